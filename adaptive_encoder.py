@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Byte-budget / quality-target image encoder
+Searches the JPEG quality setting per image instead of using a fixed
+quality=85: the lowest quality that still reaches a PSNR target, capped by
+the highest quality that fits a byte budget. Simple images (minimalist,
+abstract) come out much smaller; detailed ones keep their quality.
+
+    python adaptive_encoder.py [images] --max-bytes 60000 --min-psnr 38 [--workers N] [--dry-run]
+
+re-encodes the existing library (progressive JPEG), keeping each file only
+if it got smaller, and reports the bytes saved. Re-encoded files that were
+in the content store are stored as new blobs; the old ones are left alone.
+"""
+
+import argparse
+import io
+import math
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+# max_bytes: byte budget per image; min_psnr: quality target in dB (RGB PSNR against the
+# unencoded pixels, a cheap stand-in for a perceptual metric); either may be None
+EncodePolicy = namedtuple('EncodePolicy', ['max_bytes', 'min_psnr', 'min_quality', 'max_quality'],
+                          defaults=[None, None, 40, 92])
+
+# The fixed setting the save paths used before; savings are reported against it
+BASELINE_QUALITY = 85
+
+JPEG_OPTIONS = {'optimize': True, 'progressive': True}
+
+BYTES_SAVED = metrics.REGISTRY.counter(
+    'imagedl_encode_bytes_saved_total', 'Bytes saved by adaptive encoding versus the fixed quality=85 encode')
+
+
+def policy_from_env():
+    """Policy for the save paths from IMAGE_MAX_BYTES / IMAGE_MIN_PSNR, or None for the fixed encode"""
+    max_bytes = os.environ.get('IMAGE_MAX_BYTES')
+    min_psnr = os.environ.get('IMAGE_MIN_PSNR')
+    if not max_bytes and not min_psnr:
+        return None
+    return EncodePolicy(max_bytes=int(max_bytes) if max_bytes else None,
+                        min_psnr=float(min_psnr) if min_psnr else None)
+
+
+def psnr(reference, candidate):
+    """PSNR in dB between two same-sized RGB images (inf if identical)"""
+    from PIL import ImageChops, ImageStat
+
+    rms = ImageStat.Stat(ImageChops.difference(reference, candidate)).rms
+    mse = sum(value * value for value in rms) / len(rms)
+    return math.inf if mse == 0 else 10 * math.log10(255 * 255 / mse)
+
+
+class QualitySearch:
+    """Encodes `img` at requested qualities, remembering every result"""
+
+    def __init__(self, img, policy):
+        self.img = img
+        self.policy = policy
+        self.encoded = {}  # quality -> bytes
+        self.scores = {}   # quality -> psnr
+
+    def encode(self, quality):
+        if quality not in self.encoded:
+            buffer = io.BytesIO()
+            self.img.save(buffer, 'JPEG', quality=quality, **JPEG_OPTIONS)
+            self.encoded[quality] = buffer.getvalue()
+        return self.encoded[quality]
+
+    def score(self, quality):
+        from PIL import Image
+
+        if quality not in self.scores:
+            with Image.open(io.BytesIO(self.encode(quality))) as decoded:
+                self.scores[quality] = psnr(self.img, decoded.convert('RGB'))
+        return self.scores[quality]
+
+    def lowest(self, accept):
+        """Lowest quality in range for which `accept(quality)` holds (assumed monotone), or None"""
+        lo, hi = self.policy.min_quality, self.policy.max_quality
+        if not accept(hi):
+            return None
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if accept(mid):
+                hi = mid
+            else:
+                lo = mid + 1
+        return hi
+
+    def highest(self, accept):
+        """Highest quality in range for which `accept(quality)` holds (assumed monotone), or None"""
+        lo, hi = self.policy.min_quality, self.policy.max_quality
+        if not accept(lo):
+            return None
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if accept(mid):
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+
+def encode_adaptive(img, policy):
+    """Encode an RGB image under `policy`.
+
+    Returns {'data', 'quality', 'bytes', 'baseline_bytes', 'psnr', 'within_budget'}.
+    With no budget and no target the policy's max_quality is used. When the
+    budget can't be met even at min_quality, min_quality is used and
+    `within_budget` is False.
+    """
+    search = QualitySearch(img, policy)
+    quality = policy.max_quality
+    if policy.min_psnr is not None:
+        quality = search.lowest(lambda q: search.score(q) >= policy.min_psnr) or policy.max_quality
+    within_budget = True
+    if policy.max_bytes is not None:
+        fits = search.highest(lambda q: len(search.encode(q)) <= policy.max_bytes)
+        if fits is None:
+            fits, within_budget = policy.min_quality, False
+        quality = min(quality, fits)
+    data = search.encode(quality)
+    baseline = len(search.encode(BASELINE_QUALITY))
+    return {
+        'data': data,
+        'quality': quality,
+        'bytes': len(data),
+        'baseline_bytes': baseline,
+        'psnr': search.score(quality),
+        'within_budget': within_budget
+    }
+
+
+def record_savings(result):
+    """Count the bytes an adaptive encode saved against the fixed-quality one"""
+    if 'baseline_bytes' in result:
+        BYTES_SAVED.inc(max(0, result['baseline_bytes'] - result['bytes']))
+
+
+def bytes_saved():
+    """Total recorded by record_savings in this process"""
+    return sum(BYTES_SAVED.values.values())
+
+
+def reencode_file(path, policy):
+    """Worker job: re-encode one library file to a temp file next to it if that makes it smaller"""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        img = img.convert('RGB')
+    result = encode_adaptive(img, policy)
+    old_bytes = os.path.getsize(path)
+    temp_path = None
+    if result['bytes'] < old_bytes:
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(result['data'])
+            f.flush()
+            os.fsync(f.fileno())
+    return {'path': path, 'temp_path': temp_path, 'old_bytes': old_bytes, 'bytes': result['bytes'],
+            'quality': result['quality'], 'psnr': result['psnr']}
+
+
+def store_blobs_by_inode(base_path='images'):
+    """(dev, inode) -> store blob path, to tell which library files are links into the store"""
+    blobs = {}
+    for directory, _, files in os.walk(os.path.join(base_path, '.store', 'objects')):
+        for name in files:
+            path = os.path.join(directory, name)
+            st = os.stat(path)
+            blobs[(st.st_dev, st.st_ino)] = path
+    return blobs
+
+
+def replace_file(path, temp_path, blobs, store):
+    """Move a re-encoded file into place.
+
+    A file linked into the store gets its new bytes as a new store object;
+    the old blob is left alone, since its digest, the URLs remembered for it
+    and any other file linked to it still expect the old bytes.
+    """
+    from atomic_io import fsync_directory
+
+    st = os.stat(path)
+    os.replace(temp_path, path)
+    fsync_directory(os.path.dirname(path))
+    if (st.st_dev, st.st_ino) in blobs:
+        # Same content as an object already stored (another slot re-encoded first): share it
+        store.link(store.adopt(path), path)
+
+
+def reencode_library(base_path='images', policy=EncodePolicy(), workers=None, dry_run=False):
+    """Re-encode every library JPEG in parallel; returns totals"""
+    from derivatives import iter_sources
+    from image_store import ImageStore
+
+    sources = [path for path in iter_sources(base_path) if path.lower().endswith(('.jpg', '.jpeg'))]
+    blobs = store_blobs_by_inode(base_path)
+    store = ImageStore(os.path.join(base_path, '.store'))
+    totals = {'files': 0, 'rewritten': 0, 'failed': 0, 'old_bytes': 0, 'new_bytes': 0}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(reencode_file, path, policy) for path in sources]
+        for path, future in zip(sources, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                totals['failed'] += 1
+                print(f"❌ {path}: {e}")
+                continue
+            totals['files'] += 1
+            totals['old_bytes'] += result['old_bytes']
+            if result['temp_path'] is None:
+                totals['new_bytes'] += result['old_bytes']
+                continue
+            if dry_run:
+                os.remove(result['temp_path'])
+            else:
+                replace_file(path, result['temp_path'], blobs, store)
+            totals['rewritten'] += 1
+            totals['new_bytes'] += result['bytes']
+            print(f"🗜️  {path}: {result['old_bytes']} -> {result['bytes']} bytes "
+                  f"(q{result['quality']}, {result['psnr']:.1f} dB)")
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-encode the image library to a byte budget / quality target")
+    parser.add_argument('base_path', nargs='?', default='images')
+    parser.add_argument('--max-bytes', type=int, help="byte budget per image")
+    parser.add_argument('--min-psnr', type=float, help="quality target in dB (e.g. 38)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: CPU count)")
+    parser.add_argument('--dry-run', action='store_true', help="report the savings without writing")
+    args = parser.parse_args(argv)
+    if args.max_bytes is None and args.min_psnr is None:
+        parser.error("give --max-bytes and/or --min-psnr")
+
+    policy = EncodePolicy(max_bytes=args.max_bytes, min_psnr=args.min_psnr)
+    totals = reencode_library(args.base_path, policy, args.workers, args.dry_run)
+    saved = totals['old_bytes'] - totals['new_bytes']
+    percent = 100 * saved / totals['old_bytes'] if totals['old_bytes'] else 0
+    print(f"📉 {totals['rewritten']}/{totals['files']} images smaller, {saved} bytes saved ({percent:.1f}%), "
+          f"{totals['failed']} failed" + (" (dry run)" if args.dry_run else ""))
+    if totals['rewritten'] and not args.dry_run:
+        from catalog import get_catalog
+        from derivatives import build_all
+        from manifest import write_manifest
+
+        build_all(args.base_path, args.workers)
+        write_manifest(args.base_path)
+        get_catalog(args.base_path).rebuild()
+
+
+if __name__ == "__main__":
+    main()
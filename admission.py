@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Request coalescing and admission control for the save endpoints
+SingleFlight lets concurrent callers with the same key share one result
+(a double-clicked approval downloads and resizes once). AdmissionGate
+bounds how many saves run at once and how many may wait, rejecting the
+rest with a Retry-After estimate instead of piling up decodes
+"""
+
+import math
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+ADMISSION_ACTIVE = metrics.REGISTRY.gauge(
+    'imagedl_admission_active', 'Saves currently running under an admission gate', ['gate'])
+ADMISSION_QUEUED = metrics.REGISTRY.gauge(
+    'imagedl_admission_queued', 'Saves waiting for an admission gate slot', ['gate'])
+ADMISSION_REJECTED = metrics.REGISTRY.counter(
+    'imagedl_admission_rejected_total', 'Saves turned away because the gate was saturated', ['gate', 'reason'])
+COALESCED = metrics.REGISTRY.counter(
+    'imagedl_coalesced_requests_total', 'Calls that shared an identical in-flight call\'s result', ['flight'])
+
+
+class Saturated(Exception):
+    """Raised instead of queueing; `retry_after` is a whole number of seconds"""
+
+    def __init__(self, retry_after, reason):
+        super().__init__(f"server busy ({reason}), retry in {retry_after}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class SingleFlight:
+    """At most one call per key in flight; callers arriving meanwhile get its result"""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = {}  # key -> Future of the running call
+        self.lock = threading.Lock()
+
+    def run(self, key, fn):
+        """(fn()'s result or exception, True if this caller ran it)"""
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+        if not leader:
+            COALESCED.inc(flight=self.name)
+            return future.result(), False
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            # Later callers start a fresh call; the result isn't cached past completion
+            with self.lock:
+                del self.calls[key]
+        return future.result(), True
+
+
+class AdmissionGate:
+    """`workers` saves run at once and up to `queue` wait, for at most `max_wait` seconds"""
+
+    def __init__(self, name, workers, queue, max_wait=10.0):
+        self.name = name
+        self.workers = workers
+        self.queue = queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        # Smoothed seconds per save, for the Retry-After estimate
+        self.service_time = 1.0
+        self.condition = threading.Condition()
+
+    def retry_after(self):
+        """Seconds until the current backlog should have drained (call with the condition held)"""
+        backlog = self.active + self.waiting + 1
+        return max(1, math.ceil(self.service_time * backlog / self.workers))
+
+    def reject(self, reason):
+        ADMISSION_REJECTED.inc(gate=self.name, reason=reason)
+        raise Saturated(self.retry_after(), reason)
+
+    def acquire(self, reject=True):
+        """Take a slot. With `reject`, raise Saturated when the queue is full or the wait runs out;
+        otherwise wait as long as it takes (for callers already bounded elsewhere, like batch workers)"""
+        with self.condition:
+            if self.active < self.workers and not self.waiting:
+                self.active += 1
+            else:
+                if reject and self.waiting >= self.queue:
+                    self.reject('queue_full')
+                self.waiting += 1
+                ADMISSION_QUEUED.inc(gate=self.name)
+                deadline = time.monotonic() + self.max_wait
+                try:
+                    while self.active >= self.workers:
+                        remaining = deadline - time.monotonic() if reject else None
+                        if remaining is not None and remaining <= 0:
+                            self.reject('wait_timeout')
+                        self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                    ADMISSION_QUEUED.dec(gate=self.name)
+                self.active += 1
+        ADMISSION_ACTIVE.inc(gate=self.name)
+
+    def release(self, elapsed):
+        with self.condition:
+            self.active -= 1
+            self.service_time += 0.2 * (elapsed - self.service_time)
+            self.condition.notify()
+        ADMISSION_ACTIVE.dec(gate=self.name)
+
+    def run(self, fn, reject=True):
+        self.acquire(reject)
+        started = time.monotonic()
+        try:
+            return fn()
+        finally:
+            self.release(time.monotonic() - started)
@@ -5,9 +5,12 @@ This script helps you download actual AI-generated images from free sources
 """
 
 import os
-import requests
-from PIL import Image
-import io
+from catalog import get_catalog
+from derivatives import build_for as build_derivatives
+from download_images import CATEGORIES
+from image_fetch import ImageRejected, fetch_image
+from image_store import get_store
+from manifest import update_manifest
 import time
 
 def download_this_person_does_not_exist(count=10):
@@ -21,28 +24,30 @@ def download_this_person_does_not_exist(count=10):
         try:
             # ThisPersonDoesNotExist generates a new image each time
             url = "https://thispersondoesnotexist.com/image"
-            response = requests.get(url, timeout=15)
+            data = fetch_image(url)
             
-            if response.status_code == 200:
-                img = Image.open(io.BytesIO(response.content))
-                img = img.resize((800, 600), Image.Resampling.LANCZOS)
-                
-                filename = f"ai_people_{i+1}.jpg"
-                filepath = os.path.join(folder, filename)
-                img.save(filepath, 'JPEG', quality=85)
-                
-                print(f"✅ Saved: {filename}")
-            else:
-                print(f"❌ Failed to download image {i+1}")
+            filename = f"ai_people_{i+1}.jpg"
+            filepath = os.path.join(folder, filename)
+            # Through the store: the slot may be a hard link to a blob, which must never be written to
+            store = get_store()
+            store.link(store.put(data)['digest'], filepath)
+            build_derivatives(filepath)
+            update_manifest(filepath)
+            # Every request returns a different face, so the URL isn't recorded as the source
+            get_catalog().record(filepath, author='AI Generated (ThisPersonDoesNotExist)')
+            
+            print(f"✅ Saved: {filename}")
                 
+        except ImageRejected as e:
+            print(f"❌ Failed to download image {i+1}: {e}")
         except Exception as e:
             print(f"❌ Error downloading image {i+1}: {e}")
         
         # Be respectful to the service
         time.sleep(2)
 
-def download_from_huggingface_dataset():
-    """Download from Hugging Face AI image datasets"""
+def download_from_huggingface_dataset(paths=None, category=None, per_category=None):
+    """List known Hugging Face AI image datasets and ingest downloaded shards of them"""
     print("🤗 Downloading from Hugging Face AI datasets...")
     
     # Some known AI image datasets on Hugging Face
@@ -64,11 +69,20 @@ def download_from_huggingface_dataset():
         print(f"{i+1}. {dataset['name']} - {dataset['url']}")
         print(f"   Categories: {', '.join(dataset['categories'])}")
     
-    print("\n💡 To download from these datasets:")
-    print("1. Visit the Hugging Face dataset page")
-    print("2. Click 'Files and versions'")
-    print("3. Download the images you want")
-    print("4. Place them in the appropriate folders")
+    if not paths:
+        print("\n💡 To use these datasets:")
+        print("1. Visit the Hugging Face dataset page")
+        print("2. Click 'Files and versions'")
+        print("3. Download the Parquet (or tar/zip) shards")
+        print("4. Ingest them: python dataset_ingest.py <shards dir> [--category people]")
+        return None
+
+    # Streams the shards straight into images/<category>/ai (see dataset_ingest.py)
+    from dataset_ingest import DatasetIngest
+    stats = DatasetIngest(category=category, per_category=per_category).run(paths)
+    print(f"✅ Ingested {stats['saved']} images ({stats['duplicate']} duplicates, "
+          f"{stats['unmapped']} unmapped labels, {stats['failed']} failed)")
+    return stats
 
 def create_ai_image_prompts():
     """Generate prompts for manual AI image creation"""
@@ -163,7 +177,7 @@ def main():
     while True:
         print("\nOptions:")
         print("1. Download AI-generated people (ThisPersonDoesNotExist)")
-        print("2. Show Hugging Face AI datasets")
+        print("2. Hugging Face AI datasets (list, or ingest downloaded shards)")
         print("3. Generate AI image prompts for manual creation")
         print("4. Exit")
         
@@ -175,7 +189,12 @@ def main():
             download_this_person_does_not_exist(count)
             
         elif choice == '2':
-            download_from_huggingface_dataset()
+            path = input("Downloaded shards (file or directory, blank to just list datasets): ").strip()
+            category = input("Category for every image (blank to map dataset labels): ").strip() or None
+            if category is not None and category not in CATEGORIES:
+                print(f"❌ Unknown category: {category} (choose from: {', '.join(CATEGORIES)})")
+                continue
+            download_from_huggingface_dataset([path] if path else None, category)
             
         elif choice == '3':
             create_ai_image_prompts()
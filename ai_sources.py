@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Concurrent AI image sources for /api/fetch-ai-images
+Every eligible search source is queried at once under one deadline and the
+first to return images wins; slow sources get a hedged second request, losers
+are cancelled, and per-source circuit breakers skip sources that keep failing.
+Paid generation is a fallback, queued only when the searches come back empty
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import http_client
+import metrics
+from search_cache import get_search_cache
+
+DEFAULT_DEADLINE = 10.0
+
+CIRCUIT_OPEN = metrics.REGISTRY.gauge(
+    'imagedl_ai_source_circuit_open', '1 while a source is skipped after repeated failures', ['source'])
+SOURCE_WINS = metrics.REGISTRY.counter(
+    'imagedl_ai_source_wins_total', 'Races won per AI source', ['source'])
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `reset_after` seconds one trial call is let through"""
+
+    def __init__(self, name, threshold=3, reset_after=30.0):
+        self.name = name
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.reset_after else 'open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+        CIRCUIT_OPEN.set(0, source=self.name)
+
+    def release(self):
+        """The call was abandoned (another source won): neither success nor failure"""
+        with self.lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+                opened = True
+            else:
+                opened = False
+        if opened:
+            CIRCUIT_OPEN.set(1, source=self.name)
+
+
+class AISource:
+    """One source in the race. `fetch` returns a list of image dicts (empty = nothing found)
+    and should give up early once `cancelled` is set; it raises on failure"""
+
+    name = None
+    hedge_after = None  # seconds before a duplicate request is sent, or None
+    # Only started once the other sources have come back empty or missed the deadline
+    fallback = False
+    # Whether still running at the deadline counts as a failure for the circuit breaker
+    slow_is_failure = True
+
+    def eligible(self, category):
+        return True
+
+    def fetch(self, category, count, cancelled):
+        raise NotImplementedError
+
+
+class ThisPersonDoesNotExistSource(AISource):
+    name = 'tpdne'
+    hedge_after = 1.5
+
+    def __init__(self, url):
+        self.url = url
+
+    def eligible(self, category):
+        return category == 'people'
+
+    def fetch(self, category, count, cancelled):
+        # Every request returns a new face, so the URLs are only worth offering if the site is up
+        response = http_client.get(self.url, stream=True, timeout=(3, 5), retries=0, source=self.name)
+        response.close()
+        if response.status_code != 200:
+            raise RuntimeError(f"ThisPersonDoesNotExist returned HTTP {response.status_code}")
+        return [{
+            'src': f"{self.url}?{i}",
+            'prompt': f'AI generated person {i+1}',
+            'author': 'AI Generated'
+        } for i in range(min(count, 10))]
+
+
+class LexicaSource(AISource):
+    name = 'lexica'
+    hedge_after = 2.0
+
+    def __init__(self, url):
+        self.url = url
+
+    def fetch(self, category, count, cancelled):
+        params = {'q': category, 'size': 'landscape', 'per_page': count, 'page': 1}
+        failure = {}
+
+        def search():
+            response = http_client.get(self.url, params=params, timeout=(3, 8), retries=0, source=self.name)
+            if response.status_code == 200:
+                return response.json()
+            failure['status'] = response.status_code
+            return None
+
+        data = get_search_cache().get_or_fetch('lexica', category, 1, count, search)
+        if data is None:
+            raise RuntimeError(f"Lexica returned HTTP {failure.get('status')}")
+        return [{
+            'src': image['src'],
+            'prompt': image.get('prompt', '')[:200],
+            'author': 'AI Generated (Lexica)'
+        } for image in data.get('images', [])[:count] if image.get('src')]
+
+
+class GenerationSource(AISource):
+    """Queues generation jobs and waits for the first to finish.
+
+    A fallback: jobs are queued once per race (never hedged), only after the
+    search sources came back empty or at the deadline, and the race returns
+    them so the caller can hand them out.
+    """
+
+    name = 'generation'
+    # Every job is a paid generation, so none are queued when a search source can answer
+    fallback = True
+    # Generations routinely outlast the deadline; only failed jobs count against it
+    slow_is_failure = False
+
+    def __init__(self, queue, max_jobs=10):
+        self.queue = queue
+        self.max_jobs = max_jobs
+
+    def eligible(self, category):
+        return bool(self.queue.available())
+
+    def start(self, category, count):
+        providers = self.queue.available()
+        prompt = f"AI generated {category}, high quality, detailed"
+        return [self.queue.enqueue(providers[i % len(providers)], prompt, category)
+                for i in range(min(count, self.max_jobs))]
+
+    def fetch(self, category, count, cancelled, jobs=None):
+        if jobs is None:
+            jobs = self.start(category, count)
+        versions = [-1] * len(jobs)
+        while not cancelled.is_set():
+            states = self.queue.wait(jobs, versions, 0.25)
+            versions = [state['version'] for state in states]
+            finished = [state for state in states if state['status'] == 'succeeded']
+            if finished:
+                return [{
+                    'src': state['src'],
+                    'prompt': state['prompt'],
+                    'author': f"AI Generated ({state['provider']})"
+                } for state in finished]
+            if all(state['status'] == 'failed' for state in states):
+                raise RuntimeError(f"all generations failed: {states[0]['error']}")
+        return []
+
+
+class AISourceRace:
+    def __init__(self, sources, deadline=DEFAULT_DEADLINE, workers=16):
+        self.sources = sources
+        self.deadline = deadline
+        self.breakers = {source.name: CircuitBreaker(source.name) for source in sources}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ai-source')
+
+    def run(self, category, count):
+        """Race the eligible sources. Returns (winning source name or None, images, jobs)
+        where `jobs` are generation jobs still running (or finished) for the caller to offer"""
+        start_time = time.monotonic()
+        cancelled = threading.Event()
+        jobs = []
+        attempts = {}  # future -> source
+        hedged = set()
+        # The primary and its hedge are one logical call: the breaker hears one outcome per source
+        running = {}    # source name -> attempts not finished yet
+        settled = set()  # sources whose outcome has been recorded
+
+        def settle(source, succeeded):
+            settled.add(source.name)
+            if succeeded:
+                self.breakers[source.name].record_success()
+            else:
+                self.breakers[source.name].record_failure()
+
+        def launch(source):
+            if isinstance(source, GenerationSource):
+                if not jobs:
+                    jobs.extend(source.start(category, count))
+                future = self.executor.submit(source.fetch, category, count, cancelled, list(jobs))
+            else:
+                future = self.executor.submit(source.fetch, category, count, cancelled)
+            attempts[future] = source
+            running[source.name] = running.get(source.name, 0) + 1
+            return future
+
+        def start_sources(sources, at_deadline=False):
+            for source in sources:
+                if not self.breakers[source.name].allow():
+                    continue
+                try:
+                    if not at_deadline:
+                        pending.add(launch(source))
+                    elif isinstance(source, GenerationSource):
+                        # No time left to wait: the queued jobs go back to the caller still running
+                        jobs.extend(source.start(category, count))
+                        self.breakers[source.name].release()
+                    else:
+                        self.breakers[source.name].release()
+                except Exception as e:
+                    print(f"Error with {source.name}: {e}")
+                    metrics.count_error('ai_source_failed')
+                    settle(source, False)
+
+        eligible = [source for source in self.sources if source.eligible(category)]
+        fallbacks = [source for source in eligible if source.fallback]
+        pending = set()
+        start_sources([source for source in eligible if not source.fallback])
+
+        winner, images = None, []
+        while (pending or fallbacks) and winner is None:
+            now = time.monotonic() - start_time
+            remaining = self.deadline - now
+            if remaining <= 0:
+                break
+            if not pending:
+                # Every search source came back empty or failed
+                start_sources(fallbacks)
+                fallbacks = []
+                continue
+            # Wake up for the next hedge, if one is due before the deadline
+            hedge_times = [source.hedge_after for source in attempts.values()
+                           if source.hedge_after and source.name not in hedged and source.hedge_after > now]
+            timeout = min([remaining] + [t - now for t in hedge_times])
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                source = attempts[future]
+                running[source.name] -= 1
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error with {source.name}: {e}")
+                    metrics.count_error('ai_source_failed')
+                    # A failed primary still has its hedge (or vice versa) in flight: wait for that one
+                    if source.name not in settled and not running[source.name]:
+                        settle(source, False)
+                    continue
+                if source.name not in settled:
+                    settle(source, True)
+                if result and winner is None:
+                    winner, images = source.name, result
+
+            now = time.monotonic() - start_time
+            for future in list(pending):
+                source = attempts[future]
+                if source.hedge_after and source.name not in hedged and now >= source.hedge_after:
+                    hedged.add(source.name)
+                    pending.add(launch(source))
+
+        if winner is None and fallbacks:
+            start_sources(fallbacks, at_deadline=True)
+        # Cancel the losers: queued attempts never start, running ones stop at their next check
+        cancelled.set()
+        for future in pending:
+            future.cancel()
+        for source in {attempts[future] for future in pending}:
+            if source.name in settled:
+                continue
+            if winner is None and source.slow_is_failure:
+                # Still running at the deadline
+                self.breakers[source.name].record_failure()
+            else:
+                self.breakers[source.name].release()
+        if winner is not None:
+            SOURCE_WINS.inc(source=winner)
+        return winner, images, jobs
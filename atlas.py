@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Per-category sprite atlas packer
+Packs each category's real and ai thumbnails into a few texture sheets plus
+a JSON index of source rectangles the game can hand to drawImage
+"""
+
+import hashlib
+import os
+import sys
+
+from PIL import Image
+
+from atomic_io import atomic_write_json, read_json
+from derivatives import FORMATS, RENDITIONS, derivative_path, rendition_key, source_signature
+from image_transform import fit_image
+from manifest import IMAGE_EXTENSIONS, IMAGE_TYPES, describe_path, file_sha256, versioned_url
+
+# Largest sheet side that every browser/GPU handles comfortably
+MAX_SHEET_SIZE = 2048
+PADDING = 2
+# Bump when the packing or index format changes so every atlas is rebuilt
+ATLAS_VERSION = 1
+
+
+def atlas_root(base_path='images'):
+    return os.path.join(base_path, 'atlases')
+
+
+def index_path(category, base_path='images'):
+    return os.path.join(atlas_root(base_path), f"{category}.json")
+
+
+def pack_shelves(sizes, max_size=MAX_SHEET_SIZE, padding=PADDING):
+    """Shelf bin packing (next-fit decreasing height) into as few sheets as needed.
+
+    `sizes` is a list of (w, h). Returns (placements, sheet_sizes) where
+    placements[i] = (sheet, x, y) for sizes[i] and each sheet is trimmed to
+    the area actually used.
+    """
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+    placements = [None] * len(sizes)
+    sheets = []
+    sheet = None
+    for i in order:
+        w, h = sizes[i]
+        if w > max_size or h > max_size:
+            raise ValueError(f"Sprite {w}x{h} exceeds the {max_size}px sheet size")
+        if sheet is not None and sheet['x'] + w > max_size:
+            # Close the shelf and open a new one below it
+            sheet['y'] += sheet['shelf_height'] + padding
+            sheet['x'] = 0
+            sheet['shelf_height'] = 0
+        if sheet is None or sheet['y'] + h > max_size:
+            sheet = {'x': 0, 'y': 0, 'shelf_height': 0, 'width': 0, 'height': 0}
+            sheets.append(sheet)
+        placements[i] = (len(sheets) - 1, sheet['x'], sheet['y'])
+        sheet['width'] = max(sheet['width'], sheet['x'] + w)
+        sheet['height'] = max(sheet['height'], sheet['y'] + h)
+        sheet['x'] += w + padding
+        sheet['shelf_height'] = max(sheet['shelf_height'], h)
+    return placements, [(s['width'], s['height']) for s in sheets]
+
+
+def category_sources(category, base_path='images'):
+    sources = []
+    for image_type in IMAGE_TYPES:
+        directory = os.path.join(base_path, category, image_type)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if not name.startswith('.') and name.lower().endswith(IMAGE_EXTENSIONS):
+                sources.append((image_type, os.path.join(directory, name)))
+    return sources
+
+
+def load_thumbnail(source, size, base_path='images'):
+    """Use the prebuilt JPEG derivative when there is one, else crop the source"""
+    derived = derivative_path(source, size, 'jpg', base_path)
+    path = derived if os.path.exists(derived) else source
+    with Image.open(path) as img:
+        img = img.convert('RGB')
+        return img if img.size == size else fit_image(img, size)
+
+
+def atlas_signature(sources):
+    h = hashlib.sha256(f"v{ATLAS_VERSION}:{RENDITIONS}:{MAX_SHEET_SIZE}:{PADDING}".encode())
+    for image_type, source in sources:
+        h.update(f"{image_type}:{source}:{source_signature(source)}\n".encode())
+    return h.hexdigest()
+
+
+def build_category(category, base_path='images', force=False):
+    """Build (or skip, if inputs are unchanged) the atlases for one category"""
+    sources = category_sources(category, base_path)
+    target = index_path(category, base_path)
+    if not sources:
+        return None
+    signature = atlas_signature(sources)
+    if not force and read_json(target, {}).get('signature') == signature:
+        return False
+
+    index = {'version': ATLAS_VERSION, 'signature': signature, 'renditions': {}}
+    for size in RENDITIONS:
+        key = rendition_key(size)
+        thumbnails = [load_thumbnail(source, size, base_path) for _, source in sources]
+        placements, sheet_sizes = pack_shelves([t.size for t in thumbnails])
+
+        sheets = []
+        for number, sheet_size in enumerate(sheet_sizes):
+            canvas = Image.new('RGB', sheet_size)
+            for thumbnail, (sheet, x, y) in zip(thumbnails, placements):
+                if sheet == number:
+                    canvas.paste(thumbnail, (x, y))
+            files = {}
+            for ext, (fmt, options) in FORMATS.items():
+                path = os.path.join(atlas_root(base_path), key, f"{category}_{number}.{ext}")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                canvas.save(temp_path, fmt, **options)
+                os.replace(temp_path, path)
+                files[ext] = versioned_url(path, base_path)
+            sheets.append({'width': sheet_size[0], 'height': sheet_size[1], **files})
+
+        frames = [
+            {'source': describe_path(source, base_path), 'sha256': file_sha256(source), 'type': image_type, 'sheet': sheet,
+             'x': x, 'y': y, 'w': thumbnail.width, 'h': thumbnail.height}
+            for (image_type, source), thumbnail, (sheet, x, y) in zip(sources, thumbnails, placements)
+        ]
+        index['renditions'][key] = {'sheets': sheets, 'frames': frames}
+
+    atomic_write_json(target, index)
+    return True
+
+
+def build_all(categories, base_path='images', force=False):
+    built = skipped = 0
+    for category in categories:
+        result = build_category(category, base_path, force)
+        if result:
+            built += 1
+            print(f"🧩 Packed {category}")
+        elif result is False:
+            skipped += 1
+    return {'built': built, 'skipped': skipped}
+
+
+def build_game_assets(base_path='images', force=False):
+    """The build step for the game's images (none of it is in git): renditions, then the atlases
+    packed from them, then the manifest pointing at both. Unchanged inputs are skipped."""
+    from derivatives import build_all as build_derivatives
+    from download_images import CATEGORIES
+    from manifest import write_manifest
+
+    derivatives = build_derivatives(base_path, force=force)
+    atlases = build_all(CATEGORIES, base_path, force)
+    write_manifest(base_path)
+    return {'derivatives': derivatives, 'atlases': atlases}
+
+
+def main(base_path='images', force=False):
+    from download_images import CATEGORIES
+    from manifest import write_manifest
+
+    stats = build_all(CATEGORIES, base_path, force)
+    write_manifest(base_path)
+    print(f"🧩 Atlases: {stats['built']} rebuilt, {stats['skipped']} unchanged")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(next((a for a in args if not a.startswith('--')), 'images'), force='--force' in args)
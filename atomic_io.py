@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Crash-safe file helpers shared by the image tooling
+Writes go to a temp file in the same directory, are fsync'd, then renamed
+over the target so readers never see a half-written file
+"""
+
+import contextlib
+import json
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+
+def fsync_directory(path):
+    """Persist a rename by fsyncing its directory (no-op where unsupported)"""
+    try:
+        fd = os.open(path or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_bytes(path, data):
+    """Atomically replace `path` with `data`"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+    fsync_directory(directory)
+
+
+def atomic_write_json(path, data, indent=2):
+    """Atomically replace `path` with `data` serialized as JSON"""
+    atomic_write_bytes(path, json.dumps(data, indent=indent).encode('utf-8'))
+
+
+def read_json(path, default):
+    """Load JSON from `path`, returning `default` if it is missing or corrupt"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Exclusive lock shared by threads in this process and, via flock, other processes"""
+    path = os.path.abspath(path)
+    with _thread_locks_guard:
+        lock = _thread_locks.setdefault(path, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Offline micro-benchmarks for the download and transform pipeline
+Runs ImageDownloader.download_category_images and the Flask
+/api/download-image handler against the local stub upstream and records
+per-stage timings, images/second and peak RSS as JSON, one file per commit
+
+    python benchmarks/bench_pipeline.py                       # writes benchmarks/results/<commit>.json
+    python benchmarks/bench_pipeline.py --baseline benchmarks/results/abc1234.json
+    python benchmarks/bench_pipeline.py --diff OLD.json NEW.json
+
+Each scenario runs in a fresh interpreter inside an empty temp directory, so
+peak RSS, the search cache, the journal and the image store all start cold.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+SCHEMA_VERSION = 1
+
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from stub_upstream import StubUpstream  # noqa: E402
+
+# decode includes hashing the decoded pixels; write is the fsync'd store write
+STAGES = ['search', 'fetch', 'decode', 'resize', 'encode', 'write', 'derivatives', 'manifest']
+SCENARIOS = ['download_category_images', 'flask_download_image']
+DEFAULT_CATEGORIES = ['dogs', 'cats', 'cars', 'food']
+
+
+class StageTimer:
+    """Thread-safe collection of per-stage durations"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+        self.bytes_in = 0
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.samples[stage].append(seconds)
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            with self.time(stage):
+                return fn(*args, **kwargs)
+        return timed
+
+    def wrap_fetch(self, fn):
+        """Time a fetch and count the bytes it returned"""
+        def timed(*args, **kwargs):
+            with self.time('fetch'):
+                data = fn(*args, **kwargs)
+            if data is not None:
+                with self.lock:
+                    self.bytes_in += len(data)
+            return data
+        return timed
+
+    def instrument_store(self, store):
+        """Record the transform job's stage timings from every store.save()"""
+        save = store.save
+
+        def timed_save(*args, **kwargs):
+            result = save(*args, **kwargs)
+            for stage, seconds in ((result or {}).get('timings') or {}).items():
+                self.add(stage, seconds)
+            return result
+        store.save = timed_save
+
+    def summary(self):
+        stages = {}
+        for stage in STAGES + sorted(set(self.samples) - set(STAGES)):
+            values = sorted(self.samples.get(stage, []))
+            if not values:
+                continue
+            stages[stage] = {
+                'count': len(values),
+                'total_ms': round(sum(values) * 1000, 3),
+                'mean_ms': round(sum(values) / len(values) * 1000, 3),
+                'p50_ms': round(percentile(values, 50) * 1000, 3),
+                'p95_ms': round(percentile(values, 95) * 1000, 3),
+                'max_ms': round(values[-1] * 1000, 3)
+            }
+        return stages
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[rank - 1]
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident set size; for RUSAGE_CHILDREN, of the largest reaped child"""
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def warm_up_engine():
+    """Start the transform pool before timing so worker spawn isn't charged to the first images"""
+    from image_transform import get_engine
+    engine = get_engine()
+    for future in [engine.submit_call(time.sleep, 0.05) for _ in range(max(1, engine.max_workers))]:
+        future.result()
+    return engine
+
+
+def count_images(base_path, categories, image_types):
+    total = 0
+    for category in categories:
+        for image_type in image_types:
+            directory = os.path.join(base_path, category, image_type)
+            if os.path.isdir(directory):
+                total += sum(1 for name in os.listdir(directory) if name.endswith('.jpg'))
+    return total
+
+
+def run_download_category_images(options, stub_url, timer):
+    import download_images
+    from download_images import ImageDownloader
+
+    class BenchDownloader(ImageDownloader):
+        UNSPLASH_SEARCH_URL = stub_url + '/napi/search/photos'
+        LEXICA_SEARCH_URL = stub_url + '/api/v1/search'
+
+        def show_image_preview(self, *args):
+            # Approval is a human step, not pipeline work
+            return True
+
+        def get_unsplash_images(self, *args, **kwargs):
+            with timer.time('search'):
+                return super().get_unsplash_images(*args, **kwargs)
+
+        def get_lexica_images(self, *args, **kwargs):
+            with timer.time('search'):
+                return super().get_lexica_images(*args, **kwargs)
+
+    download_images.build_derivatives = timer.wrap('derivatives', download_images.build_derivatives)
+    download_images.update_manifest = timer.wrap('manifest', download_images.update_manifest)
+
+    downloader = BenchDownloader(
+        base_path='images',
+        target_count=options.images_per_category,
+        workers=options.workers,
+        requests_per_second=options.requests_per_second
+    )
+    downloader.fetch_bytes = timer.wrap_fetch(downloader.fetch_bytes)
+    timer.instrument_store(downloader.store)
+
+    start = time.perf_counter()
+    for category in options.categories:
+        for image_type in options.image_types:
+            downloader.download_category_images(category, image_type)
+    elapsed = time.perf_counter() - start
+    downloader.journal.close()
+    return count_images('images', options.categories, options.image_types), elapsed, 0
+
+
+def run_flask_download_image(options, stub_url, timer):
+    import image_downloader_server as server
+    from image_store import get_store
+
+    server.UNSPLASH_SEARCH_URL = stub_url + '/napi/search/photos'
+    server.fetch_image = timer.wrap_fetch(server.fetch_image)
+    server.build_derivatives = timer.wrap('derivatives', server.build_derivatives)
+    server.update_manifest = timer.wrap('manifest', server.update_manifest)
+    timer.instrument_store(get_store())
+
+    items = []
+    client = server.app.test_client()
+    for category in options.categories:
+        with timer.time('search'):
+            response = client.get('/api/fetch-real-images', query_string={
+                'category': category, 'count': options.images_per_category
+            })
+        for index, result in enumerate(response.get_json().get('results', [])):
+            items.append({'imageData': result, 'category': category, 'imageType': 'real', 'index': index + 1})
+
+    local = threading.local()
+    failures = []
+
+    def post(item):
+        if not hasattr(local, 'client'):
+            local.client = server.app.test_client()
+        response = local.client.post('/api/download-image', json=item)
+        if response.status_code != 200:
+            failures.append(response.status_code)
+
+    # Throughput covers the download requests only; searches are reported as a stage
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options.concurrency) as executor:
+        list(executor.map(post, items))
+    elapsed = time.perf_counter() - start
+    return count_images('images', options.categories, ['real']), elapsed, len(failures)
+
+
+def run_scenario(options):
+    """Child-process entry: run one scenario in the current (empty) directory and write its result"""
+    timer = StageTimer()
+    runner = {
+        'download_category_images': run_download_category_images,
+        'flask_download_image': run_flask_download_image
+    }[options.scenario]
+    engine = warm_up_engine()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        images, elapsed, errors = runner(options, options.stub_url, timer)
+    engine.shutdown()
+
+    result = {
+        'images': images,
+        'errors': errors,
+        'seconds': round(elapsed, 4),
+        'images_per_sec': round(images / elapsed, 3) if elapsed else 0.0,
+        'bytes_in': timer.bytes_in,
+        'peak_rss_mb': peak_rss_mb(),
+        # Largest transform pool worker, measured once the pool has shut down
+        'peak_worker_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+        'stages': timer.summary()
+    }
+    with open(options.result_file, 'w') as f:
+        json.dump(result, f)
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    commit = git('rev-parse', '--short', 'HEAD') or 'unknown'
+    dirty = bool(git('status', '--porcelain', '--untracked-files=no'))
+    return commit, dirty
+
+
+def scenario_command(options, scenario, result_file, stub_url):
+    return [
+        sys.executable, os.path.abspath(__file__),
+        '--scenario', scenario, '--result-file', result_file, '--stub-url', stub_url,
+        '--categories', ','.join(options.categories),
+        '--image-types', ','.join(options.image_types),
+        '--images-per-category', str(options.images_per_category),
+        '--workers', str(options.workers),
+        '--concurrency', str(options.concurrency),
+        '--requests-per-second', str(options.requests_per_second),
+    ]
+
+
+def run_all(options):
+    commit, dirty = git_revision()
+    results = {
+        'schema': SCHEMA_VERSION,
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'categories': options.categories,
+            'image_types': options.image_types,
+            'images_per_category': options.images_per_category,
+            'workers': options.workers,
+            'concurrency': options.concurrency,
+            'requests_per_second': options.requests_per_second,
+            'fixtures': options.fixtures,
+            'latency': options.latency,
+            'repeat': options.repeat
+        },
+        'scenarios': {}
+    }
+
+    wanted = len(options.categories) * len(options.image_types) * options.images_per_category
+    if wanted > options.fixtures:
+        print(f"⚠️  {wanted} images per run but only {options.fixtures} fixtures; "
+              f"repeats will be deduplicated by the store (raise --fixtures)")
+
+    # One stub for every run: its photo numbering carries on, so each run gets fresh URLs
+    with StubUpstream(fixture_count=options.fixtures, latency=options.latency) as stub:
+        for scenario in options.scenarios:
+            results['scenarios'][scenario] = run_repeated(options, scenario, stub.url)
+    return results
+
+
+def run_repeated(options, scenario, stub_url):
+    runs = []
+    for attempt in range(options.repeat):
+        print(f"⏱️  {scenario} (run {attempt + 1}/{options.repeat})...")
+        with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+            result_file = os.path.join(workdir, 'result.json')
+            subprocess.run(scenario_command(options, scenario, result_file, stub_url), cwd=workdir, check=True)
+            with open(result_file) as f:
+                runs.append(json.load(f))
+    # Report the run with the median throughput; keep every run's headline numbers
+    runs.sort(key=lambda r: r['images_per_sec'])
+    summary = dict(runs[len(runs) // 2])
+    summary['runs'] = [{key: run[key] for key in ('images', 'seconds', 'images_per_sec', 'peak_rss_mb')}
+                       for run in runs]
+    print(f"   {summary['images']} images in {summary['seconds']:.2f}s "
+          f"({summary['images_per_sec']:.2f} images/s, peak RSS {summary['peak_rss_mb']} MB)")
+    return summary
+
+
+def compare(old, new):
+    """Print headline and per-stage changes between two result files"""
+    print(f"\n📊 {old.get('commit')} → {new.get('commit')}{' (dirty)' if new.get('dirty') else ''}")
+    for scenario, current in new['scenarios'].items():
+        previous = old.get('scenarios', {}).get(scenario)
+        if previous is None:
+            print(f"  {scenario}: no baseline")
+            continue
+        print(f"  {scenario}")
+        rows = [('images/sec', previous['images_per_sec'], current['images_per_sec'], True),
+                ('peak RSS MB', previous['peak_rss_mb'], current['peak_rss_mb'], False)]
+        for stage in STAGES:
+            if stage in current['stages'] and stage in previous['stages']:
+                rows.append((f"{stage} p50 ms", previous['stages'][stage]['p50_ms'],
+                             current['stages'][stage]['p50_ms'], False))
+        for label, before, after, higher_is_better in rows:
+            change = (after - before) / before * 100 if before else 0.0
+            better = change > 0 if higher_is_better else change < 0
+            marker = '' if abs(change) < 5 else (' ✅' if better else ' ⚠️')
+            print(f"    {label:<18} {before:>10.2f} → {after:>10.2f}  {change:+6.1f}%{marker}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the image pipeline against a local stub upstream")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument('--categories', default=','.join(DEFAULT_CATEGORIES))
+    parser.add_argument('--image-types', default='real,ai', help="for download_category_images")
+    parser.add_argument('--images-per-category', type=int, default=6)
+    parser.add_argument('--workers', type=int, default=4, help="ImageDownloader download threads")
+    parser.add_argument('--concurrency', type=int, default=4, help="concurrent /api/download-image requests")
+    parser.add_argument('--requests-per-second', type=float, default=1000.0,
+                        help="per-host rate limit (the default effectively disables it)")
+    parser.add_argument('--fixtures', type=int, default=48, help="distinct fixture images the stub serves")
+    parser.add_argument('--latency', type=float, default=0.0, help="stub delay per request, seconds")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per scenario; the median is reported")
+    parser.add_argument('--output', help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument('--baseline', help="results file to compare this run against")
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'), help="compare two results files and exit")
+    # Internal: run a single scenario in this process
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    parser.add_argument('--stub-url', help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+    options.scenarios = [s for s in options.scenarios.split(',') if s]
+    options.categories = [c for c in options.categories.split(',') if c]
+    options.image_types = [t for t in options.image_types.split(',') if t]
+    unknown = set(options.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    return options
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.diff:
+        with open(options.diff[0]) as f_old, open(options.diff[1]) as f_new:
+            compare(json.load(f_old), json.load(f_new))
+        return
+    if options.scenario:
+        run_scenario(options)
+        return
+
+    results = run_all(options)
+    output = options.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{results['commit']}{'-dirty' if results['dirty'] else ''}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Results written to {output}")
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
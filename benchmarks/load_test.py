@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Open-loop HTTP load test for image_downloader_server.py
+Starts the server in a child process (in an empty temp directory, with its
+upstreams pointed at the local stub, which can add latency and errors) and
+drives /api/fetch-real-images, /api/fetch-ai-images, /api/download-image and
+/api/categories with Poisson arrivals at fixed offered rates, whether or not
+responses keep up. Each rate step reports throughput, p50/p95/p99 latency,
+the status mix and the RSS of the server and its transform workers over
+time; the first step that can't keep up is reported as the saturation point.
+
+    python benchmarks/load_test.py --rates 5,10,20,40 --duration 20
+    python benchmarks/load_test.py --worker-model processes --processes 4 --stub-latency 0.2
+    python benchmarks/load_test.py --target http://127.0.0.1:5001 --server-pid 1234   # a server you started
+
+Latency is measured from each request's scheduled send time, so time spent
+waiting for a free client thread counts against the server rather than
+silently lowering the offered rate.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+SCHEMA_VERSION = 1
+
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import git_revision, percentile  # noqa: E402
+from stub_upstream import StubUpstream  # noqa: E402
+
+ENDPOINTS = {
+    'fetch-real': '/api/fetch-real-images',
+    'fetch-ai': '/api/fetch-ai-images',
+    'download': '/api/download-image',
+    'categories': '/api/categories'
+}
+DEFAULT_MIX = 'fetch-real=2,fetch-ai=1,download=2,categories=5'
+WORKER_MODELS = ['threaded', 'single', 'processes']
+CATEGORIES = ['dogs', 'cats', 'cars', 'food', 'nature', 'people']
+# Photo numbers for /api/download-image, well clear of the ones the stub hands out in search results
+DOWNLOAD_PHOTO_BASE = 1_000_000
+# Never send real API tokens from the harness's environment to the server under test
+SECRET_ENV = ('HF_API_TOKEN', 'REPLICATE_API_TOKEN', 'UNSPLASH_ACCESS_KEY')
+
+
+def parse_mix(text):
+    """'download=2,categories=5' -> {'download': 2.0, 'categories': 5.0}"""
+    mix = {}
+    for part in filter(None, text.split(',')):
+        name, _, weight = part.partition('=')
+        if name not in ENDPOINTS:
+            raise ValueError(f"unknown endpoint {name!r} (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("the mix needs at least one endpoint with a positive weight")
+    return mix
+
+
+class RequestFactory:
+    """Builds the next request for an endpoint; download URLs are fresh stub photos each time"""
+
+    def __init__(self, stub_url, search_pages, seed=0):
+        self.stub_url = stub_url
+        self.search_pages = search_pages
+        self.random = random.Random(seed)
+        self.photos = itertools.count(DOWNLOAD_PHOTO_BASE)
+        self.lock = threading.Lock()
+
+    def build(self, endpoint):
+        """(method, path, query params, JSON body)"""
+        with self.lock:
+            category = self.random.choice(CATEGORIES)
+            page = self.random.randint(1, self.search_pages)
+            photo = next(self.photos)
+        path = ENDPOINTS[endpoint]
+        if endpoint == 'fetch-real':
+            # Random pages, so most searches miss the server's search cache
+            return 'GET', path, {'category': category, 'count': 10, 'page': page}, None
+        if endpoint == 'fetch-ai':
+            return 'GET', path, {'category': category, 'count': 10}, None
+        if endpoint == 'download':
+            return 'POST', path, None, {
+                'imageData': {'urls': {'regular': f"{self.stub_url}/photos/{photo}.jpg"},
+                              'user': {'name': 'Load Test'}, 'description': f"load test photo {photo}"},
+                'category': category, 'imageType': 'real', 'index': photo
+            }
+        return 'GET', path, None, None
+
+
+def process_tree_rss_mb(pid):
+    """Resident memory of `pid` and all its descendants (Linux /proc), or None if unavailable"""
+    try:
+        parents = {}
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat') as f:
+                        # The command name may contain spaces; fields after it are space-separated
+                        parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+    except OSError:
+        return None
+    tree, frontier = {pid}, [pid]
+    while frontier:
+        parent = frontier.pop()
+        children = [child for child, ppid in parents.items() if ppid == parent and child not in tree]
+        tree.update(children)
+        frontier.extend(children)
+    total_kb = 0
+    for member in tree:
+        try:
+            with open(f'/proc/{member}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return round(total_kb / 1024, 1) if total_kb else None
+
+
+class RssSampler:
+    """Samples the server's process-tree RSS in the background: [(seconds since start, MB)]"""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.started = time.monotonic()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='rss-sampler', daemon=True)
+
+    def run(self):
+        while not self.stopping.is_set():
+            rss = process_tree_rss_mb(self.pid)
+            if rss is not None:
+                self.samples.append((round(time.monotonic() - self.started, 2), rss))
+            self.stopping.wait(self.interval)
+
+    def between(self, start, end):
+        """[(seconds since `start`, MB)] for the samples taken between two monotonic timestamps"""
+        offset = start - self.started
+        return [(t - offset, mb) for t, mb in self.samples if offset <= t <= end - self.started]
+
+    def __enter__(self):
+        if self.pid:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+class LoadClient:
+    """One keep-alive session per client thread; no retries, so every failure is counted"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def session(self):
+        import requests
+
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def send(self, method, path, params, body):
+        """HTTP status, or an error name for transport failures"""
+        import requests
+
+        try:
+            response = self.session().request(method, self.base_url + path, params=params, json=body,
+                                              timeout=self.timeout)
+            response.content  # read the whole body; latency covers the full response
+            return response.status_code
+        except requests.Timeout:
+            return 'timeout'
+        except requests.RequestException:
+            return 'connection_error'
+
+
+def is_error(status):
+    return not isinstance(status, int) or status >= 500
+
+
+def summarize(records, offered_rate, duration, rss):
+    """Headline numbers for one step: overall, per endpoint, and per-second timeline.
+
+    `records` hold each request's scheduled send time and latency in seconds
+    from the step start; `rss` is [(seconds from the step start, MB)].
+    """
+    def stats(subset):
+        latencies = sorted(r['latency'] for r in subset)
+        statuses = {}
+        for r in subset:
+            statuses[str(r['status'])] = statuses.get(str(r['status']), 0) + 1
+        errors = sum(1 for r in subset if is_error(r['status']))
+        return {
+            'requests': len(subset),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'max_ms': round(latencies[-1] * 1000, 1) if latencies else 0.0,
+            'error_rate': round(errors / len(subset), 4) if subset else 0.0,
+            'shed_rate': round(statuses.get('429', 0) / len(subset), 4) if subset else 0.0,
+            'statuses': statuses
+        }
+
+    finished = max((r['sent'] + r['latency'] for r in records), default=duration)
+    completed = [r for r in records if not is_error(r['status'])]
+    summary = {
+        'offered_rps': offered_rate,
+        'sent_rps': round(len(records) / duration, 2),
+        # Responses that weren't errors, over the time until the last one arrived
+        'throughput_rps': round(len(completed) / max(duration, finished), 2),
+        **stats(records),
+        'peak_rss_mb': max((mb for _, mb in rss), default=None),
+        'endpoints': {name: stats([r for r in records if r['endpoint'] == name])
+                      for name in sorted({r['endpoint'] for r in records})},
+        'timeline': []
+    }
+    for second in range(int(max(duration, finished)) + 1):
+        sent = [r for r in records if second <= r['sent'] < second + 1]
+        done = sorted(r['latency'] for r in records if second <= r['sent'] + r['latency'] < second + 1)
+        summary['timeline'].append({
+            'second': second,
+            'sent': len(sent),
+            'completed': len(done),
+            'p50_ms': round(percentile(done, 50) * 1000, 1),
+            'rss_mb': max((mb for t, mb in rss if second <= t < second + 1), default=None)
+        })
+    return summary
+
+
+def run_step(options, client, factory, rate, sampler):
+    """Send Poisson arrivals at `rate` requests/second for `options.duration` seconds"""
+    rng = random.Random(options.seed + int(rate * 1000))
+    names = list(options.mix)
+    weights = [options.mix[name] for name in names]
+    records = []
+    lock = threading.Lock()
+
+    def fire(endpoint, scheduled, start):
+        status = client.send(*factory.build(endpoint))
+        finished = time.monotonic()
+        with lock:
+            records.append({'endpoint': endpoint, 'sent': scheduled - start,
+                            'latency': finished - scheduled, 'status': status})
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=options.client_threads, thread_name_prefix='load') as executor:
+        scheduled = start
+        while True:
+            scheduled += rng.expovariate(rate)
+            if scheduled - start >= options.duration:
+                break
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(fire, rng.choices(names, weights)[0], scheduled, start)
+    end = time.monotonic()
+    return summarize(records, rate, options.duration, sampler.between(start, end))
+
+
+def saturated(step, options):
+    """Why a step counts as past saturation, or None"""
+    # Against what was actually sent: Poisson arrivals over a short step stray from the nominal rate
+    if step['throughput_rps'] < 0.9 * step['sent_rps']:
+        return f"throughput {step['throughput_rps']} < 90% of sent {step['sent_rps']} req/s"
+    if step['error_rate'] > options.max_error_rate:
+        return f"error rate {step['error_rate']:.1%}"
+    if step['shed_rate'] > options.max_error_rate:
+        return f"{step['shed_rate']:.1%} shed with 429"
+    if step['p99_ms'] > options.slo_ms:
+        return f"p99 {step['p99_ms']} ms > {options.slo_ms:g} ms"
+    return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(options):
+    """Child-process entry: run the server in the current (empty) directory against the stub"""
+    from werkzeug.serving import run_simple
+
+    import image_downloader_server as server
+    from ai_sources import AISourceRace, GenerationSource, LexicaSource, ThisPersonDoesNotExistSource
+
+    stub = options.stub_url
+    server.UNSPLASH_SEARCH_URL = stub + '/napi/search/photos'
+    server.ai_sources = AISourceRace([
+        ThisPersonDoesNotExistSource(stub + '/image'),
+        LexicaSource(stub + '/api/v1/search'),
+        GenerationSource(server.generation, server.MAX_GENERATIONS_PER_REQUEST)
+    ], deadline=10.0)
+    run_simple('127.0.0.1', options.port, server.app, threaded=options.worker_model == 'threaded',
+               processes=options.processes if options.worker_model == 'processes' else 1)
+
+
+def start_server(options, stub_url, workdir):
+    """Launch the server in `workdir` and wait until it answers; returns (process, base URL)"""
+    port = free_port()
+    env = {key: value for key, value in os.environ.items() if key not in SECRET_ENV}
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_ROOT, env.get('PYTHONPATH')]))
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port), '--stub-url', stub_url,
+         '--worker-model', options.worker_model, '--processes', str(options.processes)],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    log.close()
+    base_url = f"http://127.0.0.1:{port}"
+    client = LoadClient(base_url, timeout=2)
+    deadline = time.monotonic() + 30
+    while client.send('GET', ENDPOINTS['categories'], None, None) != 200:
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError(f"server did not start (see {os.path.join(workdir, 'server.log')})")
+        time.sleep(0.2)
+    return process, base_url
+
+
+def drive(options, base_url, stub_url, server_pid):
+    client = LoadClient(base_url, options.timeout)
+    factory = RequestFactory(stub_url, options.search_pages, options.seed)
+    steps = []
+    with RssSampler(server_pid) as sampler:
+        for rate in options.rates:
+            print(f"🚦 {rate:g} req/s for {options.duration:g}s...")
+            step = run_step(options, client, factory, rate, sampler)
+            step['saturated'] = saturated(step, options)
+            steps.append(step)
+            rss = f", peak RSS {step['peak_rss_mb']} MB" if step['peak_rss_mb'] is not None else ''
+            print(f"   {step['throughput_rps']:.1f} req/s served, p50 {step['p50_ms']:.0f} / "
+                  f"p95 {step['p95_ms']:.0f} / p99 {step['p99_ms']:.0f} ms, "
+                  f"{step['error_rate']:.1%} errors, {step['shed_rate']:.1%} shed{rss}")
+            if step['saturated'] and options.stop_at_saturation:
+                break
+            # Let the previous step's stragglers drain before the next rate
+            time.sleep(options.cooldown)
+    return steps
+
+
+def run_all(options):
+    commit, dirty = git_revision()
+    results = {
+        'schema': SCHEMA_VERSION,
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'target': options.target,
+            'worker_model': None if options.target else options.worker_model,
+            'processes': options.processes if options.worker_model == 'processes' else 1,
+            'rates': options.rates,
+            'duration': options.duration,
+            'mix': options.mix,
+            'stub_latency': options.stub_latency,
+            'stub_error_rate': options.stub_error_rate,
+            'fixtures': options.fixtures,
+            'client_threads': options.client_threads,
+            'timeout': options.timeout
+        }
+    }
+    with StubUpstream(fixture_count=options.fixtures, latency=options.stub_latency,
+                      error_rate=options.stub_error_rate) as stub:
+        if options.target:
+            results['steps'] = drive(options, options.target.rstrip('/'), stub.url, options.server_pid)
+        else:
+            with tempfile.TemporaryDirectory(prefix='loadtest-') as workdir:
+                process, base_url = start_server(options, stub.url, workdir)
+                try:
+                    results['steps'] = drive(options, base_url, stub.url, process.pid)
+                finally:
+                    process.terminate()
+                    process.wait()
+
+    first = next((step for step in results['steps'] if step['saturated']), None)
+    results['saturation'] = {
+        'offered_rps': first['offered_rps'],
+        'reason': first['saturated'],
+        'max_sustained_rps': max((step['throughput_rps'] for step in results['steps'] if not step['saturated']),
+                                 default=0.0)
+    } if first else None
+    if first:
+        print(f"📈 Saturated at {first['offered_rps']:g} req/s ({first['saturated']}); "
+              f"sustained {results['saturation']['max_sustained_rps']:g} req/s before that")
+    else:
+        print("📈 No saturation up to the highest rate; raise --rates")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Open-loop load test of the image downloader server")
+    parser.add_argument('--rates', default='2,5,10,20', help="offered requests/second, one step each")
+    parser.add_argument('--duration', type=float, default=15.0, help="seconds per rate step")
+    parser.add_argument('--cooldown', type=float, default=2.0, help="pause between steps, seconds")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"endpoint weights (from {', '.join(ENDPOINTS)})")
+    parser.add_argument('--worker-model', choices=WORKER_MODELS, default='threaded',
+                        help="how the server handles requests: a thread each, one at a time, or a forked process each")
+    parser.add_argument('--processes', type=int, default=4, help="process cap for --worker-model processes")
+    parser.add_argument('--target', help="drive an already running server at this URL instead of starting one")
+    parser.add_argument('--server-pid', type=int, help="with --target, the server's pid for RSS sampling")
+    parser.add_argument('--stub-latency', type=float, default=0.05, help="stub upstream delay per request, seconds")
+    parser.add_argument('--stub-error-rate', type=float, default=0.0, help="fraction of stub requests answered 503")
+    parser.add_argument('--fixtures', type=int, default=48, help="distinct fixture images the stub serves")
+    parser.add_argument('--search-pages', type=int, default=50, help="search pages requested at random")
+    parser.add_argument('--client-threads', type=int, default=256, help="most requests the client has open")
+    parser.add_argument('--timeout', type=float, default=30.0, help="per-request timeout, seconds")
+    parser.add_argument('--slo-ms', type=float, default=2000.0, help="p99 above this counts as saturated")
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help="error (5xx/transport) or 429 rate above this counts as saturated")
+    parser.add_argument('--stop-at-saturation', action='store_true', help="skip the rates after the first saturated one")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="results file (default benchmarks/results/load-<commit>.json)")
+    # Internal: run the server in this process
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--stub-url', help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+    try:
+        options.rates = [float(rate) for rate in options.rates.split(',') if rate]
+        options.mix = parse_mix(options.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if not options.rates or min(options.rates) <= 0:
+        parser.error("--rates must be positive")
+    return options
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.serve:
+        serve(options)
+        return
+
+    results = run_all(options)
+    output = options.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"load-{results['commit']}{'-dirty' if results['dirty'] else ''}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Unsplash, Lexica, ThisPersonDoesNotExist and the
+Replicate/Hugging Face generation APIs
+Serves search JSON and fixture images of realistic sizes so the pipeline can
+be benchmarked offline. Runs in its own process so serving doesn't compete
+with the code being measured for the GIL.
+
+    python benchmarks/stub_upstream.py [port]
+
+To point a local server at it:
+    HF_API_TOKEN=test REPLICATE_API_TOKEN=test \
+    HUGGINGFACE_MODEL_URL=http://127.0.0.1:8765/models/stub \
+    REPLICATE_PREDICTIONS_URL=http://127.0.0.1:8765/v1/predictions \
+    python image_downloader_server.py
+"""
+
+import io
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image, ImageDraw
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+# Unsplash's small/regular/full renditions and a camera original
+FIXTURE_SIZES = [(640, 427), (1080, 720), (1920, 1280), (4000, 2667)]
+FIXTURE_VERSION = 1
+
+UNSPLASH_SEARCH_PATH = '/napi/search/photos'
+LEXICA_SEARCH_PATH = '/api/v1/search'
+TPDNE_PATH = '/image'
+REPLICATE_PREDICTIONS_PATH = '/v1/predictions'
+HUGGINGFACE_MODELS_PATH = '/models/'
+
+
+def make_fixture(size, seed):
+    """Photo-like JPEG: gradients, shapes and sensor noise, so it compresses like a real photo"""
+    rng = random.Random(seed)
+    width, height = size
+    gradient = Image.linear_gradient('L')
+    img = Image.merge('RGB', [gradient.rotate(rng.choice([0, 90, 180, 270])).resize(size) for _ in range(3)])
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        r = rng.randrange(width // 40, width // 6)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randrange(256) for _ in range(3)))
+    img = Image.blend(img, Image.effect_noise(size, 40).convert('RGB'), 0.15)
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def fixture_paths(count):
+    """Paths of `count` distinct fixtures, cycling through FIXTURE_SIZES; built once and kept on disk"""
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    paths = []
+    for n in range(count):
+        width, height = FIXTURE_SIZES[n % len(FIXTURE_SIZES)]
+        path = os.path.join(FIXTURE_DIR, f"v{FIXTURE_VERSION}_{n:03d}_{width}x{height}.jpg")
+        if not os.path.exists(path):
+            data = make_fixture((width, height), seed=n)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+        paths.append(path)
+    return paths
+
+
+class StubState:
+    def __init__(self, fixtures, latency=0.0, error_rate=0.0, generation_time=2.0, seed=0):
+        self.fixtures = fixtures  # list of JPEG bytes
+        self.latency = latency
+        self.error_rate = error_rate
+        self.generation_time = generation_time
+        self.predictions = {}  # prediction id -> (created, photo number)
+        self.random = random.Random(seed)
+        self.next_photo = 0
+        self.assigned = {}  # photo number -> fixture index, in first-fetch order
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def photo_numbers(self, count):
+        """Fresh photo numbers for a page of results, so no URL is ever returned twice"""
+        with self.lock:
+            start = self.next_photo
+            self.next_photo += count
+        return range(start, start + count)
+
+    def fixture_for(self, number):
+        """Fixtures are handed out as photos are first fetched, so unfetched search results don't use them up"""
+        with self.lock:
+            if number not in self.assigned:
+                self.assigned[number] = len(self.assigned) % len(self.fixtures)
+            return self.fixtures[self.assigned[number]]
+
+    def roll_error(self):
+        with self.lock:
+            self.requests += 1
+            return self.error_rate and self.random.random() < self.error_rate
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None  # set on the per-server subclass
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.state.lock:
+            self.state.bytes_sent += len(body)
+
+    def send_json(self, data, status=200):
+        self.send_body(status, json.dumps(data).encode('utf-8'), 'application/json')
+
+    def start_request(self):
+        """Apply the configured latency and error rate; False if an error was sent"""
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        if self.state.roll_error():
+            self.send_json({'error': 'stub upstream error'}, 503)
+            return False
+        return True
+
+    def prediction(self, prediction_id, base):
+        """A Replicate prediction that succeeds `generation_time` seconds after creation"""
+        created, number = self.state.predictions[prediction_id]
+        elapsed = time.time() - created
+        prediction = {'id': prediction_id, 'urls': {'get': f"{base}{REPLICATE_PREDICTIONS_PATH}/{prediction_id}"}}
+        if elapsed < self.state.generation_time / 2:
+            prediction['status'] = 'starting'
+        elif elapsed < self.state.generation_time:
+            prediction['status'] = 'processing'
+        else:
+            prediction.update(status='succeeded', output=[f"{base}/photos/{number}.jpg"])
+        return prediction
+
+    def do_POST(self):
+        # Drain the request body so the keep-alive connection stays in sync; its content isn't needed
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not self.start_request():
+            return
+        base = f"http://{self.headers.get('Host')}"
+        path = urlparse(self.path).path
+        if not self.headers.get('Authorization'):
+            self.send_json({'error': 'missing token'}, 401)
+        elif path == REPLICATE_PREDICTIONS_PATH:
+            number = self.state.photo_numbers(1)[0]
+            prediction_id = f"stubprediction{number}"
+            with self.state.lock:
+                self.state.predictions[prediction_id] = (time.time(), number)
+            self.send_json(self.prediction(prediction_id, base), 201)
+        elif path.startswith(HUGGINGFACE_MODELS_PATH):
+            # The inference API holds the request open while it generates
+            time.sleep(self.state.generation_time)
+            self.send_body(200, self.state.fixture_for(self.state.photo_numbers(1)[0]), 'image/jpeg')
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def do_GET(self):
+        if not self.start_request():
+            return
+
+        parsed = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        base = f"http://{self.headers.get('Host')}"
+
+        if parsed.path.startswith(REPLICATE_PREDICTIONS_PATH + '/'):
+            prediction_id = parsed.path[len(REPLICATE_PREDICTIONS_PATH) + 1:]
+            if prediction_id in self.state.predictions:
+                self.send_json(self.prediction(prediction_id, base))
+            else:
+                self.send_json({'detail': 'Not found.'}, 404)
+        elif parsed.path == UNSPLASH_SEARCH_PATH:
+            numbers = self.state.photo_numbers(int(query.get('per_page', 10)))
+            self.send_json({'total': 10000, 'results': [{
+                'id': f"stub{n}",
+                'description': f"{query.get('query', '')} photo {n}",
+                'user': {'name': 'Stub Photographer'},
+                'urls': {'regular': f"{base}/photos/{n}.jpg"}
+            } for n in numbers]})
+        elif parsed.path == LEXICA_SEARCH_PATH:
+            numbers = self.state.photo_numbers(int(query.get('per_page', 10)))
+            self.send_json({'images': [{
+                'id': f"stub{n}",
+                'src': f"{base}/photos/{n}.jpg",
+                'prompt': f"{query.get('q', '')} artwork {n}"
+            } for n in numbers]})
+        elif parsed.path.startswith('/photos/') and parsed.path.endswith('.jpg'):
+            number = parsed.path[len('/photos/'):-len('.jpg')]
+            if not number.isdigit():
+                self.send_json({'error': 'not found'}, 404)
+                return
+            self.send_body(200, self.state.fixture_for(int(number)), 'image/jpeg')
+        elif parsed.path == TPDNE_PATH:
+            # Like the real site, a different face on every request
+            fixtures = self.state.fixtures
+            with self.state.lock:
+                choice = self.state.random.randrange(len(fixtures))
+            self.send_body(200, fixtures[choice], 'image/jpeg')
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections (a server under load test shutting down) aren't stub bugs
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def serve(port, fixture_count, latency, error_rate, generation_time, ready=None):
+    fixtures = []
+    for path in fixture_paths(fixture_count):
+        with open(path, 'rb') as f:
+            fixtures.append(f.read())
+    handler = type('BoundStubHandler', (StubHandler,), {
+        'state': StubState(fixtures, latency, error_rate, generation_time)
+    })
+    server = StubServer(('127.0.0.1', port), handler)
+    if ready is not None:
+        ready.send(server.server_address[1])
+        ready.close()
+    server.serve_forever()
+
+
+class StubUpstream:
+    """Runs the stub server in a child process.
+
+    Search results are numbered sequentially across the whole run and each
+    photo fetched gets the next of `fixture_count` distinct images, so up to
+    that many downloads per run never hit the store's duplicate detection.
+    """
+
+    def __init__(self, fixture_count=48, latency=0.0, error_rate=0.0, generation_time=2.0, port=0):
+        self.fixture_count = fixture_count
+        self.latency = latency
+        self.error_rate = error_rate
+        self.generation_time = generation_time
+        self.port = port
+        self.process = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        # Build fixtures here so a first run's generation time isn't charged to the server start
+        fixture_paths(self.fixture_count)
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(
+            target=serve,
+            args=(self.port, self.fixture_count, self.latency, self.error_rate, self.generation_time, sender),
+            daemon=True
+        )
+        self.process.start()
+        sender.close()
+        if not receiver.poll(30):
+            self.stop()
+            raise RuntimeError("stub upstream did not start")
+        self.port = receiver.recv()
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    print(f"🧪 Stub upstream on http://127.0.0.1:{port} (Ctrl+C to stop)")
+    serve(port, 48, 0.0, 0.0, 2.0)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+SQLite catalog of the image library
+One row per file under images/<category>/<real|ai>/ with its source URL,
+author, dimensions, byte size and content hash. The downloader and the
+server update it on every save, so counts, deficits and listings are
+indexed queries instead of directory scans; it can be rebuilt from disk
+at any time (source metadata of files that still exist is kept)
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+from manifest import IMAGE_EXTENSIONS, IMAGE_TYPES, describe_path, file_sha256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    host TEXT NOT NULL,
+    author TEXT,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    category_id INTEGER NOT NULL REFERENCES categories (id),
+    image_type TEXT NOT NULL,
+    source_id INTEGER REFERENCES sources (id),
+    sha256 TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    saved_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_category_type ON images (category_id, image_type, path);
+CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256);
+CREATE INDEX IF NOT EXISTS images_source ON images (source_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+LISTING_QUERY = """
+SELECT images.path, categories.name, images.image_type, images.sha256, images.bytes,
+       images.width, images.height, images.saved_at, sources.url, sources.author, sources.description
+FROM images
+JOIN categories ON categories.id = images.category_id
+LEFT JOIN sources ON sources.id = images.source_id
+"""
+LISTING_FIELDS = ('path', 'category', 'image_type', 'sha256', 'bytes', 'width', 'height', 'saved_at',
+                  'url', 'author', 'description')
+
+
+def catalog_path(base_path='images'):
+    return os.path.join(base_path, 'catalog.sqlite')
+
+
+def split_library_path(path, base_path='images'):
+    """(category, image_type) for a file under base_path/<category>/<type>/, or None"""
+    rel_dir = os.path.relpath(os.path.dirname(os.path.abspath(path)), os.path.abspath(base_path))
+    category, image_type = os.path.split(rel_dir)
+    if image_type not in IMAGE_TYPES or not category or os.sep in category or category.startswith('.'):
+        return None
+    return category, image_type
+
+
+def library_dirs(base_path='images'):
+    """[(category, image_type, directory)] for every library directory on disk"""
+    dirs = []
+    if os.path.isdir(base_path):
+        for category in sorted(os.listdir(base_path)):
+            for image_type in IMAGE_TYPES:
+                directory = os.path.join(base_path, category, image_type)
+                if not category.startswith('.') and os.path.isdir(directory):
+                    dirs.append((category, image_type, directory))
+    return dirs
+
+
+def image_files(directory):
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if not name.startswith('.') and name.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def count_on_disk(base_path='images'):
+    """{category: {image_type: count}} from the directory listing: the catalog's counts once it has
+    been reconciled, without opening (and on a fresh tree creating and rebuilding) the catalog"""
+    counts = {}
+    for category, image_type, directory in library_dirs(base_path):
+        n = len(image_files(directory))
+        if n:
+            counts.setdefault(category, {t: 0 for t in IMAGE_TYPES})[image_type] = n
+    return counts
+
+
+def deficits_from_counts(counts, categories, target, image_types=IMAGE_TYPES):
+    """{category: {image_type: images still needed}} for the slots below `target`"""
+    deficits = {}
+    for category in categories:
+        for image_type in image_types:
+            missing = target - counts.get(category, {}).get(image_type, 0)
+            if missing > 0:
+                deficits.setdefault(category, {})[image_type] = missing
+    return deficits
+
+
+def image_size(path):
+    # Imported on first use: only recording a file (or building the catalog) needs PIL
+    from PIL import Image
+    try:
+        # Only the header is read for the size
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None, None
+
+
+class Catalog:
+    def __init__(self, base_path='images', path=None):
+        self.base_path = base_path
+        self.path = path or catalog_path(base_path)
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self.connection() as db:
+            db.executescript(SCHEMA)
+
+    def connection(self):
+        """One connection per thread; WAL lets the CLI and server read while either writes"""
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('PRAGMA foreign_keys=ON')
+            self.local.db = db
+        return db
+
+    @property
+    def built(self):
+        return self.connection().execute("SELECT 1 FROM meta WHERE key = 'built_at'").fetchone() is not None
+
+    def category_id(self, db, name):
+        db.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (name,))
+        return db.execute('SELECT id FROM categories WHERE name = ?', (name,)).fetchone()[0]
+
+    def source_id(self, db, url, author=None, description=None):
+        if not url:
+            return None
+        db.execute(
+            'INSERT INTO sources (url, host, author, description) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (url) DO UPDATE SET author = COALESCE(excluded.author, author), '
+            'description = COALESCE(excluded.description, description)',
+            (url, urlparse(url).netloc.lower(), author, description)
+        )
+        return db.execute('SELECT id FROM sources WHERE url = ?', (url,)).fetchone()[0]
+
+    def upsert(self, db, path, url=None, author=None, description=None):
+        place = split_library_path(path, self.base_path)
+        if place is None:
+            return None
+        category, image_type = place
+        rel_path = describe_path(path, self.base_path)
+        if not os.path.exists(path):
+            db.execute('DELETE FROM images WHERE path = ?', (rel_path,))
+            return None
+        width, height = image_size(path)
+        source = self.source_id(db, url, author, description)
+        db.execute(
+            'INSERT INTO images (path, category_id, image_type, source_id, sha256, bytes, width, height, saved_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (path) DO UPDATE SET category_id = excluded.category_id, '
+            'image_type = excluded.image_type, source_id = COALESCE(excluded.source_id, source_id), '
+            'sha256 = excluded.sha256, bytes = excluded.bytes, width = excluded.width, '
+            'height = excluded.height, '
+            'saved_at = CASE WHEN sha256 = excluded.sha256 THEN saved_at ELSE excluded.saved_at END',
+            (rel_path, self.category_id(db, category), image_type, source, file_sha256(path),
+             os.path.getsize(path), width, height, time.time())
+        )
+        return rel_path
+
+    def record(self, path, url=None, author=None, description=None):
+        """Add or refresh one saved file (or drop it if it no longer exists), in one transaction"""
+        with self.connection() as db:
+            return self.upsert(db, path, url, author, description)
+
+    def mark_scanned(self, db, directory):
+        """Remember the directory's mtime, which changes whenever a file is added, removed or renamed in it"""
+        db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                   (f"dir:{describe_path(directory, self.base_path)}", str(os.stat(directory).st_mtime_ns)))
+
+    def rebuild(self):
+        """Rescan the library: add new files, refresh changed ones and drop missing ones"""
+        dirs = library_dirs(self.base_path)
+        on_disk = [path for _, _, directory in dirs for path in image_files(directory)]
+        with self.connection() as db:
+            known = {row[0] for row in db.execute('SELECT path FROM images')}
+            present = {self.upsert(db, path) for path in on_disk}
+            db.executemany('DELETE FROM images WHERE path = ?', [(path,) for path in known - present])
+            db.execute('DELETE FROM sources WHERE id NOT IN (SELECT source_id FROM images WHERE source_id IS NOT NULL)')
+            db.execute("DELETE FROM meta WHERE key LIKE 'dir:%'")
+            for _, _, directory in dirs:
+                self.mark_scanned(db, directory)
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('built_at', ?)", (str(time.time()),))
+        return len(present)
+
+    def reconcile(self):
+        """Pick up files added or removed behind the catalog's back (dropped in by hand, or by
+        writers that don't record them): only directories whose mtime changed since they were
+        last scanned are listed again, and only their new files are read. Returns the number
+        of directories rescanned."""
+        with self.connection() as db:
+            scanned = {key[4:]: value for key, value in db.execute("SELECT key, value FROM meta WHERE key LIKE 'dir:%'")}
+            rescanned = 0
+            for _, _, directory in library_dirs(self.base_path):
+                rel_dir = describe_path(directory, self.base_path)
+                if scanned.pop(rel_dir, None) == str(os.stat(directory).st_mtime_ns):
+                    continue
+                prefix = rel_dir + '/'
+                known = {row[0] for row in db.execute(
+                    'SELECT path FROM images WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))}
+                on_disk = {describe_path(path, self.base_path): path for path in image_files(directory)}
+                for rel_path in on_disk.keys() - known:
+                    self.upsert(db, on_disk[rel_path])
+                db.executemany('DELETE FROM images WHERE path = ?', [(path,) for path in known - on_disk.keys()])
+                self.mark_scanned(db, directory)
+                rescanned += 1
+            # Directories that are gone altogether
+            for rel_dir in scanned:
+                prefix = rel_dir + '/'
+                db.execute('DELETE FROM images WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))
+                db.execute('DELETE FROM meta WHERE key = ?', (f"dir:{rel_dir}",))
+                rescanned += 1
+        return rescanned
+
+    def count(self, category, image_type):
+        return self.connection().execute(
+            'SELECT COUNT(*) FROM images JOIN categories ON categories.id = images.category_id '
+            'WHERE categories.name = ? AND images.image_type = ?', (category, image_type)
+        ).fetchone()[0]
+
+    def has_source(self, url):
+        """True if a library file was saved from `url`"""
+        return self.connection().execute(
+            'SELECT 1 FROM images JOIN sources ON sources.id = images.source_id WHERE sources.url = ? LIMIT 1', (url,)
+        ).fetchone() is not None
+
+    def counts(self):
+        """{category: {image_type: count}} for every category with images"""
+        counts = {}
+        for category, image_type, n in self.connection().execute(
+                'SELECT categories.name, images.image_type, COUNT(*) FROM images '
+                'JOIN categories ON categories.id = images.category_id '
+                'GROUP BY images.category_id, images.image_type'):
+            counts.setdefault(category, {t: 0 for t in IMAGE_TYPES})[image_type] = n
+        return counts
+
+    def deficits(self, categories, target, image_types=IMAGE_TYPES):
+        """{category: {image_type: images still needed}} for the slots below `target`"""
+        return deficits_from_counts(self.counts(), categories, target, image_types)
+
+    def list_images(self, category=None, image_type=None, limit=50, offset=0):
+        """(page of image dicts ordered by path, total matching)"""
+        clauses, params = [], []
+        if category:
+            clauses.append('categories.name = ?')
+            params.append(category)
+        if image_type:
+            clauses.append('images.image_type = ?')
+            params.append(image_type)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        db = self.connection()
+        total = db.execute(
+            f'SELECT COUNT(*) FROM images JOIN categories ON categories.id = images.category_id{where}', params
+        ).fetchone()[0]
+        rows = db.execute(f'{LISTING_QUERY}{where} ORDER BY images.path LIMIT ? OFFSET ?',
+                          params + [limit, offset]).fetchall()
+        return [dict(zip(LISTING_FIELDS, row)) for row in rows], total
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+_reconciled = {}  # base path -> monotonic time of the last reconcile
+
+# A long-running server picks up files added by hand at most this many seconds late
+RECONCILE_INTERVAL = 30.0
+
+
+def get_catalog(base_path='images'):
+    """Process-wide catalog for `base_path`: rebuilt from disk the first time it is ever
+    opened, and reconciled with the library on open and then every RECONCILE_INTERVAL"""
+    key = os.path.abspath(base_path)
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = _catalogs[key] = Catalog(base_path)
+            if not catalog.built:
+                catalog.rebuild()
+            else:
+                catalog.reconcile()
+            _reconciled[key] = time.monotonic()
+        elif time.monotonic() - _reconciled[key] >= RECONCILE_INTERVAL:
+            catalog.reconcile()
+            _reconciled[key] = time.monotonic()
+    return catalog
+
+
+def main(base_path='images'):
+    catalog = Catalog(base_path)
+    total = catalog.rebuild()
+    print(f"🗂️  Rebuilt {catalog.path}: {total} images")
+    for category, counts in sorted(catalog.counts().items()):
+        print(f"   {category}: " + ", ".join(f"{n} {image_type}" for image_type, n in counts.items()))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Bulk ingest of AI images from local dataset shards
+Streams Parquet (image byte columns, e.g. Hugging Face datasets), tar /
+WebDataset and zip shards without extracting them: uncompressed tars and
+Parquet files are memory-mapped, Parquet is read one batch of a row group
+at a time and archives one member at a time, so shards larger than RAM are
+fine. Images are decoded and resized in the transform process pool, mapped
+from dataset labels to the game's categories and written straight into
+images/<category>/ai. Progress is checkpointed per shard, so an interrupted
+run resumes from the last shard and offset.
+
+    python dataset_ingest.py shards/ [--label-map puppy=dogs] [--category people] [--per-category 20]
+"""
+
+import argparse
+import json
+import mmap
+import os
+import sys
+import tarfile
+import zipfile
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from atomic_io import atomic_write_json, read_json
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; only Parquet shards need it
+    pq = None
+
+STATE_FILE = os.path.join('cache', 'ingest_state.json')
+SHARD_SUFFIXES = ('.parquet', '.tar', '.tar.gz', '.tgz', '.zip')
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+LABEL_SUFFIXES = ('.cls', '.txt', '.json')
+# Larger members are skipped rather than buffered
+MAX_SAMPLE_BYTES = 20 * 1024 * 1024
+# Checkpoint the resume offset after this many finished samples
+CHECKPOINT_EVERY = 50
+PARQUET_BATCH_ROWS = 64
+
+# Dataset label (lowercased) -> game category, for labels that aren't a category name already
+LABEL_SYNONYMS = {
+    'dog': 'dogs', 'puppy': 'dogs', 'canine': 'dogs',
+    'cat': 'cats', 'kitten': 'cats', 'feline': 'cats',
+    'car': 'cars', 'vehicle': 'cars', 'automobile': 'cars', 'truck': 'cars',
+    'meal': 'food', 'dish': 'food',
+    'landscape': 'nature', 'forest': 'nature', 'mountain': 'nature',
+    'building': 'buildings', 'architecture': 'buildings', 'house': 'buildings',
+    'person': 'people', 'face': 'people', 'faces': 'people', 'human': 'people', 'portrait': 'people',
+    'animal': 'animals', 'wildlife': 'animals', 'bird': 'animals', 'horse': 'animals',
+    'painting': 'art', 'artwork': 'art',
+    'instrument': 'music', 'guitar': 'music',
+    'clothing': 'fashion', 'outfit': 'fashion',
+    'galaxy': 'space', 'planet': 'space', 'nebula': 'space',
+    'dragon': 'fantasy', 'magic': 'fantasy',
+    'minimal': 'minimalist'
+}
+
+# offset: position of the sample in its shard; label may be None
+Sample = namedtuple('Sample', ['offset', 'key', 'label', 'data'])
+
+
+def find_shards(paths):
+    """Shard files named directly or found (sorted) in the given directories"""
+    shards = []
+    for path in paths:
+        if os.path.isdir(path):
+            shards.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                          if name.lower().endswith(SHARD_SUFFIXES))
+        else:
+            shards.append(path)
+    return shards
+
+
+def split_member_name(name):
+    """WebDataset convention: the key is everything before the first dot of the basename"""
+    directory, base = os.path.split(name)
+    stem, dot, suffix = base.partition('.')
+    return os.path.join(directory, stem), ('.' + suffix.lower()) if dot else ''
+
+
+def parse_label(suffix, data):
+    text = bytes(data).decode('utf-8', errors='replace').strip()
+    if suffix == '.json':
+        try:
+            meta = json.loads(text)
+        except ValueError:
+            return None
+        if not isinstance(meta, dict):
+            return None
+        value = next((meta[k] for k in ('label', 'category', 'class') if meta.get(k) is not None), None)
+        return None if value is None else str(value)
+    return text.splitlines()[0] if text else None
+
+
+def group_members(members, skip):
+    """Samples from archive members in order: (name, size, read) with read() -> bytes.
+
+    Members sharing a key (`x.jpg`, `x.cls`) form one sample; a lone image is
+    labelled by its directory. Members of samples before `skip` are not read.
+    """
+    offset = -1
+    key = image = label = None
+
+    def finish():
+        if image is None or offset < skip:
+            return None
+        return Sample(offset, key, label or os.path.basename(os.path.dirname(key)) or None, image)
+
+    for name, size, read in members:
+        member_key, suffix = split_member_name(name)
+        if member_key != key:
+            sample = finish()
+            if sample is not None:
+                yield sample
+            offset, key, image, label = offset + 1, member_key, None, None
+        if offset < skip or size > MAX_SAMPLE_BYTES:
+            continue
+        if suffix.endswith(IMAGE_SUFFIXES) and image is None:
+            image = read()
+        elif suffix in LABEL_SUFFIXES and label is None:
+            label = parse_label(suffix, read())
+    sample = finish()
+    if sample is not None:
+        yield sample
+
+
+def iter_tar(path, skip=0):
+    """Stream a tar / WebDataset shard; uncompressed tars are read through a memory map"""
+    compressed = not path.lower().endswith('.tar')
+    with open(path, 'rb') as f, tarfile.open(fileobj=f, mode='r:*' if compressed else 'r:') as tar:
+        mapped = None
+        if not compressed and os.fstat(f.fileno()).st_size:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        def members():
+            for member in tar:
+                # TarFile remembers every header it has seen; drop them so huge shards stay small
+                tar.members = []
+                if not member.isfile():
+                    continue
+                if mapped is not None:
+                    read = lambda m=member: mapped[m.offset_data:m.offset_data + m.size]
+                else:
+                    read = lambda m=member: tar.extractfile(m).read()
+                yield member.name, member.size, read
+
+        try:
+            yield from group_members(members(), skip)
+        finally:
+            if mapped is not None:
+                mapped.close()
+
+
+def iter_zip(path, skip=0):
+    """Stream a zip shard member by member"""
+    with zipfile.ZipFile(path) as archive:
+        members = ((info.filename, info.file_size, lambda i=info: archive.read(i))
+                   for info in archive.infolist() if not info.is_dir())
+        yield from group_members(members, skip)
+
+
+def class_names(schema, label_column):
+    """ClassLabel names for an integer label column, from Hugging Face's schema metadata"""
+    raw = (schema.metadata or {}).get(b'huggingface')
+    if not raw:
+        return None
+    try:
+        features = json.loads(raw)['info']['features']
+        return features[label_column].get('names')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def iter_parquet(path, skip=0, image_column='image', label_column='label'):
+    """Stream a Parquet shard from a memory map, skipping whole row groups before `skip`"""
+    if pq is None:
+        raise RuntimeError("reading Parquet shards needs pyarrow (pip install pyarrow)")
+    parquet = pq.ParquetFile(path, memory_map=True)
+    columns = [image_column] + ([label_column] if label_column in parquet.schema_arrow.names else [])
+    names = class_names(parquet.schema_arrow, label_column)
+    offset = 0
+    for group in range(parquet.num_row_groups):
+        rows = parquet.metadata.row_group(group).num_rows
+        if offset + rows <= skip:
+            offset += rows
+            continue
+        for batch in parquet.iter_batches(batch_size=PARQUET_BATCH_ROWS, row_groups=[group], columns=columns):
+            images = batch.column(image_column).to_pylist()
+            labels = batch.column(label_column).to_pylist() if len(columns) > 1 else [None] * len(images)
+            for image, label in zip(images, labels):
+                if offset >= skip:
+                    # Hugging Face Image features are {'bytes': ..., 'path': ...} structs
+                    data = image.get('bytes') if isinstance(image, dict) else image
+                    if isinstance(label, int) and names and 0 <= label < len(names):
+                        label = names[label]
+                    if data and len(data) <= MAX_SAMPLE_BYTES:
+                        yield Sample(offset, f"{os.path.basename(path)}#{offset}",
+                                     None if label is None else str(label), data)
+                offset += 1
+
+
+def iter_shard(path, skip=0, image_column='image', label_column='label'):
+    lower = path.lower()
+    if lower.endswith('.parquet'):
+        return iter_parquet(path, skip, image_column, label_column)
+    if lower.endswith('.zip'):
+        return iter_zip(path, skip)
+    if lower.endswith(('.tar', '.tar.gz', '.tgz')):
+        return iter_tar(path, skip)
+    raise ValueError(f"unsupported shard type: {path}")
+
+
+def normalize_label(label):
+    """Dataset labels and --label-map keys are compared in this form"""
+    return label.strip().lower().replace('_', ' ')
+
+
+def category_for(label, categories, label_map=None):
+    """Game category for a dataset label, or None if it doesn't map to one.
+    `label_map` keys must already be normalize_label()d."""
+    if label is None:
+        return None
+    name = normalize_label(label)
+    if label_map and name in label_map:
+        return label_map[name]
+    # The category itself, or its singular ("dog" -> dogs) or plural ("arts" -> art) form
+    for category in categories:
+        if name in (category, category + 's') or name + 's' == category:
+            return category
+    if LABEL_SYNONYMS.get(name) in categories:
+        return LABEL_SYNONYMS[name]
+    # Multi-word labels ("golden retriever dog") match on any word
+    for word in name.replace('-', ' ').split():
+        candidate = word if word in categories else LABEL_SYNONYMS.get(word)
+        if candidate in categories:
+            return candidate
+    return None
+
+
+class Watermark:
+    """Highest offset below which every sample of a shard has finished (they finish out of order)"""
+
+    def __init__(self, start):
+        self.value = start
+        self.finished = set()
+
+    def finish(self, offset):
+        self.finished.add(offset)
+        while self.value in self.finished:
+            self.finished.discard(self.value)
+            self.value += 1
+
+
+class DatasetIngest:
+    def __init__(self, base_path='images', categories=None, label_map=None, category=None, per_category=None,
+                 workers=4, state_file=STATE_FILE, image_column='image', label_column='label'):
+        from adaptive_encoder import policy_from_env
+        from catalog import get_catalog
+        from download_images import CATEGORIES
+        from image_store import ImageStore
+        from perceptual_index import get_perceptual_index
+
+        self.base_path = base_path
+        self.categories = categories or CATEGORIES
+        if category is not None and category not in self.categories:
+            raise ValueError(f"unknown category '{category}' (expected one of: {', '.join(self.categories)})")
+        self.label_map = {normalize_label(k): v for k, v in (label_map or {}).items()}
+        self.category = category
+        self.per_category = per_category
+        self.workers = workers
+        self.state_file = state_file
+        self.image_column = image_column
+        self.label_column = label_column
+        self.store = ImageStore(os.path.join(base_path, '.store'), policy_from_env())
+        self.catalog = get_catalog(base_path)
+        self.near_index = get_perceptual_index(base_path)
+        self.state = read_json(state_file, {})
+        self.names = {}   # category -> file names taken in images/<category>/ai
+        self.counts = {}  # category -> images present or in flight
+        self.stats = {'saved': 0, 'duplicate': 0, 'unmapped': 0, 'full': 0, 'failed': 0}
+
+    def shard_state(self, path):
+        """Resume record for a shard; a shard that changed on disk starts over"""
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        record = self.state.get(key)
+        if not record or record.get('size') != st.st_size or record.get('mtime') != st.st_mtime_ns:
+            record = self.state[key] = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'offset': 0, 'done': False}
+        return record
+
+    def checkpoint(self):
+        atomic_write_json(self.state_file, self.state)
+
+    def reserve(self, category):
+        """Next free ai_<category>_<n>.jpg path, or None if the category is full"""
+        directory = os.path.join(self.base_path, category, 'ai')
+        if category not in self.names:
+            os.makedirs(directory, exist_ok=True)
+            self.names[category] = set(os.listdir(directory))
+            self.counts[category] = self.catalog.count(category, 'ai')
+        if self.per_category is not None and self.counts[category] >= self.per_category:
+            return None
+        number = 1
+        while f"ai_{category}_{number}.jpg" in self.names[category]:
+            number += 1
+        name = f"ai_{category}_{number}.jpg"
+        self.names[category].add(name)
+        self.counts[category] += 1
+        return os.path.join(directory, name)
+
+    def save(self, sample, category, dest, shard):
+        """Worker thread: decode/resize in the transform pool, then link into the library"""
+        result = self.store.put(bytes(sample.data))
+        near, duplicate = self.near_index.admit(self.store.path_for(result['digest']), dest,
+                                                lambda: self.store.link_unique(result['digest'], dest))
+        if near is not None:
+            return near
+        if duplicate is None:
+            self.catalog.record(dest, author=f"AI Generated ({os.path.basename(shard)})", description=sample.label)
+        return duplicate
+
+    def ingest_shard(self, path):
+        record = self.shard_state(path)
+        if record['done']:
+            print(f"⏭️  {path} already ingested")
+            return
+        print(f"📦 Ingesting {path} from sample {record['offset']}")
+        watermark = Watermark(record['offset'])
+        pending = {}  # future -> (sample offset, category, dest)
+        since_checkpoint = 0
+
+        def collect(block):
+            nonlocal since_checkpoint
+            done, _ = wait(list(pending), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                offset, category, dest = pending.pop(future)
+                try:
+                    saved = future.result() is None
+                    self.stats['saved' if saved else 'duplicate'] += 1
+                except Exception as e:
+                    print(f"❌ {path}#{offset}: {e}")
+                    self.stats['failed'] += 1
+                    saved = False
+                if not saved:
+                    # Hand the name and the slot back
+                    self.names[category].discard(os.path.basename(dest))
+                    self.counts[category] -= 1
+                watermark.finish(offset)
+                since_checkpoint += 1
+            if since_checkpoint >= CHECKPOINT_EVERY:
+                record['offset'] = watermark.value
+                self.checkpoint()
+                since_checkpoint = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for sample in iter_shard(path, record['offset'], self.image_column, self.label_column):
+                category = self.category or category_for(sample.label, self.categories, self.label_map)
+                dest = self.reserve(category) if category else None
+                if dest is None:
+                    self.stats['unmapped' if category is None else 'full'] += 1
+                    watermark.finish(sample.offset)
+                    continue
+                # Bounded in-flight work keeps memory flat however large the shard is
+                while len(pending) >= self.workers * 2:
+                    collect(block=True)
+                pending[executor.submit(self.save, sample, category, dest, path)] = (sample.offset, category, dest)
+                collect(block=False)
+            while pending:
+                collect(block=True)
+
+        record['offset'] = watermark.value
+        record['done'] = True
+        self.checkpoint()
+
+    def run(self, paths, restart=False):
+        from image_transform import configure_engine
+
+        configure_engine(self.workers)
+        if restart:
+            self.state = {}
+        for path in find_shards(paths):
+            try:
+                self.ingest_shard(path)
+            except (OSError, ValueError, RuntimeError, tarfile.TarError, zipfile.BadZipFile) as e:
+                print(f"❌ Skipping shard {path}: {e}")
+        if self.stats['saved']:
+            from derivatives import build_all
+            from manifest import write_manifest
+
+            build_all(self.base_path, self.workers)
+            write_manifest(self.base_path)
+        return self.stats
+
+
+def parse_label_map(pairs):
+    label_map = {}
+    for pair in pairs or []:
+        label, _, category = pair.partition('=')
+        if not category:
+            raise ValueError(f"expected label=category, got '{pair}'")
+        label_map[label.strip()] = category.strip()
+    return label_map
+
+
+def main(argv=None):
+    from download_images import CATEGORIES
+
+    parser = argparse.ArgumentParser(description="Ingest AI images from local dataset shards")
+    parser.add_argument('paths', nargs='+', help="shard files or directories (.parquet, .tar, .tar.gz, .zip)")
+    parser.add_argument('--category', choices=CATEGORIES, help="put every image in this category")
+    parser.add_argument('--label-map', nargs='*', metavar='LABEL=CATEGORY', help="extra label mappings")
+    parser.add_argument('--per-category', type=int, help="stop filling a category at this many AI images")
+    parser.add_argument('--image-column', default='image', help="Parquet image column (default: image)")
+    parser.add_argument('--label-column', default='label', help="Parquet label column (default: label)")
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help="decode/resize worker processes")
+    parser.add_argument('--base-path', default='images')
+    parser.add_argument('--restart', action='store_true', help="ignore saved progress and start every shard over")
+    args = parser.parse_args(argv)
+    try:
+        label_map = parse_label_map(args.label_map)
+    except ValueError as e:
+        parser.error(str(e))
+    unknown = sorted(set(label_map.values()) - set(CATEGORIES))
+    if unknown:
+        parser.error(f"unknown categories in --label-map: {', '.join(unknown)}")
+
+    ingest = DatasetIngest(args.base_path, CATEGORIES, label_map, args.category, args.per_category,
+                           args.workers, image_column=args.image_column, label_column=args.label_column)
+    stats = ingest.run(args.paths, args.restart)
+    print(f"🎉 {stats['saved']} saved, {stats['duplicate']} duplicates, {stats['unmapped']} unmapped labels, "
+          f"{stats['full']} over the per-category limit, {stats['failed']} failed")
+    return 0 if not stats['failed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Derivative builder for the game's render box
+Produces center-cropped WebP and JPEG renditions of every library image at
+the sizes ImageObject actually draws (200x160, plus 400x320 for HiDPI)
+"""
+
+import hashlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+import metrics
+from atomic_io import atomic_write_json, file_lock, read_json
+from image_transform import fit_image, get_engine
+
+# ImageObject in images.js is 200x160; 2x covers HiDPI screens
+RENDITIONS = [(200, 160), (400, 320)]
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})
+}
+# Bump when RENDITIONS/FORMATS or the crop logic change so everything is rebuilt
+PIPELINE_VERSION = 1
+
+IMAGE_TYPES = ('real', 'ai')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif')
+
+
+def derived_root(base_path='images'):
+    return os.path.join(base_path, 'derived')
+
+
+def state_path(base_path='images'):
+    return os.path.join(derived_root(base_path), '.state.json')
+
+
+def rendition_key(size):
+    return f"{size[0]}x{size[1]}"
+
+
+def derivative_path(source, size, ext, base_path='images'):
+    """images/<category>/<type>/<name>.* -> images/derived/<WxH>/<category>/<type>/<name>.<ext>"""
+    rel = os.path.relpath(source, base_path)
+    stem = os.path.splitext(rel)[0]
+    return os.path.join(derived_root(base_path), rendition_key(size), f"{stem}.{ext}")
+
+
+def derivative_paths(source, base_path='images'):
+    """{'200x160': {'webp': path, 'jpg': path}, ...} for one source image"""
+    return {
+        rendition_key(size): {ext: derivative_path(source, size, ext, base_path) for ext in FORMATS}
+        for size in RENDITIONS
+    }
+
+
+def source_signature(source):
+    h = hashlib.sha256(f"v{PIPELINE_VERSION}:".encode())
+    with open(source, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def render_derivatives(source, base_path='images'):
+    """Worker job: decode once and write every rendition/format of `source`"""
+    with Image.open(source) as img:
+        largest = max(RENDITIONS)
+        if img.format == 'JPEG':
+            img.draft('RGB', largest)
+        img = img.convert('RGB')
+        written = []
+        for size in RENDITIONS:
+            rendition = fit_image(img, size)
+            for ext, (fmt, options) in FORMATS.items():
+                dest = derivative_path(source, size, ext, base_path)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                temp_path = f"{dest}.{os.getpid()}.tmp"
+                rendition.save(temp_path, fmt, **options)
+                os.replace(temp_path, dest)
+                written.append(dest)
+    return written
+
+
+def iter_sources(base_path='images'):
+    for category in sorted(os.listdir(base_path)):
+        for image_type in IMAGE_TYPES:
+            directory = os.path.join(base_path, category, image_type)
+            if category.startswith('.') or not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if not name.startswith('.') and name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(directory, name)
+
+
+def is_current(source, signature, state, base_path='images'):
+    if state.get(source) != signature:
+        return False
+    return all(os.path.exists(p) for formats in derivative_paths(source, base_path).values() for p in formats.values())
+
+
+def record_built(sources, base_path='images'):
+    """Remember the signatures of freshly built sources"""
+    with file_lock(state_path(base_path) + '.lock'):
+        state = read_json(state_path(base_path), {})
+        state.update(sources)
+        atomic_write_json(state_path(base_path), state)
+
+
+def build_for(source, base_path='images'):
+    """Build derivatives for one newly saved image (used by the downloader save paths)"""
+    with metrics.timed('derivatives'):
+        signature = source_signature(source)
+        get_engine().submit_call(render_derivatives, source, base_path).result()
+        record_built({source: signature}, base_path)
+
+
+def build_all(base_path='images', workers=None, force=False):
+    """Build derivatives for the whole tree in parallel, skipping unchanged inputs"""
+    state = read_json(state_path(base_path), {})
+    todo = {}
+    skipped = 0
+    for source in iter_sources(base_path):
+        signature = source_signature(source)
+        if not force and is_current(source, signature, state, base_path):
+            skipped += 1
+        else:
+            todo[source] = signature
+
+    built = {}
+    failed = 0
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {source: pool.submit(render_derivatives, source, base_path) for source in todo}
+            for source, future in futures.items():
+                try:
+                    future.result()
+                    built[source] = todo[source]
+                except Exception as e:
+                    failed += 1
+                    print(f"❌ {source}: {e}")
+        record_built(built, base_path)
+    return {'built': len(built), 'skipped': skipped, 'failed': failed}
+
+
+def main(base_path='images', force=False):
+    from manifest import write_manifest
+
+    stats = build_all(base_path, force=force)
+    write_manifest(base_path)
+    print(f"🖼️  Derivatives: {stats['built']} built, {stats['skipped']} unchanged, {stats['failed']} failed")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(next((a for a in args if not a.startswith('--')), 'images'), force='--force' in args)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Background batch processing for approved image downloads
+Batches are keyed by their content, so resubmitting the same batch attaches
+to the running (or finished) one instead of doing the work twice
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+def batch_key(items):
+    """Stable id for a list of items (order-sensitive, key-order-insensitive)"""
+    canonical = json.dumps(items, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+class DownloadBatch:
+    def __init__(self, batch_id, items):
+        self.id = batch_id
+        self.items = items
+        self.results = [None] * len(items)
+        self.events = []  # per-item results in completion order
+        self.created = time.time()
+        self.condition = threading.Condition()
+
+    @property
+    def done(self):
+        return len(self.events) == len(self.items)
+
+    def complete(self, position, status, result):
+        event = {'event': 'item', 'batchId': self.id, 'position': position, 'status': status, 'result': result}
+        with self.condition:
+            self.results[position] = event
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def summary(self):
+        succeeded = sum(1 for e in self.events if e['status'] < 400)
+        return {'event': 'done', 'batchId': self.id, 'total': len(self.items),
+                'succeeded': succeeded, 'failed': len(self.events) - succeeded}
+
+    def stream(self, heartbeat=15.0):
+        """Yield an accepted event, every item event as it lands (replaying earlier ones), then a summary"""
+        yield {'event': 'accepted', 'batchId': self.id, 'total': len(self.items)}
+        sent = 0
+        while True:
+            with self.condition:
+                while sent == len(self.events) and not self.done:
+                    if not self.condition.wait(timeout=heartbeat):
+                        break
+                pending = self.events[sent:]
+                finished = self.done
+            if not pending and not finished:
+                # Keep proxies from closing an idle stream
+                yield {'event': 'heartbeat', 'batchId': self.id, 'completed': sent}
+                continue
+            for event in pending:
+                yield event
+            sent += len(pending)
+            if finished and sent == len(self.events):
+                yield self.summary()
+                return
+
+
+class BatchRegistry:
+    """Runs batches on a shared worker pool and remembers the most recent ones"""
+
+    def __init__(self, process_item, max_workers=4, keep=100):
+        # process_item(item) -> (result dict, HTTP-style status code)
+        self.process_item = process_item
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='download-batch')
+        self.keep = keep
+        self.batches = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, items, batch_id=None):
+        """Start a batch, or return the existing one with the same id/content"""
+        batch_id = batch_id or batch_key(items)
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is not None:
+                self.batches.move_to_end(batch_id)
+                return batch, False
+            batch = self.batches[batch_id] = DownloadBatch(batch_id, items)
+            while len(self.batches) > self.keep:
+                oldest_id, oldest = next(iter(self.batches.items()))
+                if not oldest.done:
+                    break
+                del self.batches[oldest_id]
+
+        for position, item in enumerate(items):
+            self.executor.submit(self.run_item, batch, position, item)
+        return batch, True
+
+    def run_item(self, batch, position, item):
+        try:
+            result, status = self.process_item(item)
+        except Exception as e:
+            metrics.count_error('batch_item_exception')
+            result, status = {'error': str(e)}, 500
+        batch.complete(position, status, result)
+
+    def get(self, batch_id):
+        with self.lock:
+            return self.batches.get(batch_id)
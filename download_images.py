@@ -1,17 +1,30 @@
 #!/usr/bin/env python3
 """
-Interactive Image Downloader with Approval Workflow
-Downloads real and AI-generated images for the AI Slop Shooter game
+Image Downloader with Approval Workflow
+Downloads real and AI-generated images for the AI Slop Shooter game, either
+interactively or as a headless batch sharded across worker processes
+
+    python download_images.py --types real,ai --target 6 --approve all --processes 4
+    python download_images.py --job jobs/nightly.json --dry-run
+
+PIL, requests and tqdm are imported on first use, so --help and --dry-run
+planning start without loading them
 """
 
-import os
+import argparse
+import contextlib
+import importlib.util
 import json
-import requests
-from PIL import Image
-import io
-import time
-from tqdm import tqdm
+import os
+import queue
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import metrics
+from catalog import count_on_disk, deficits_from_counts, get_catalog
+from manifest import update_manifest
+from rate_limiter import HostRateLimiter
+from download_journal import DownloadJournal, JOURNAL_FILE
+from search_cache import get_search_cache
 
 # Game categories from config
 CATEGORIES = [
@@ -19,88 +32,180 @@ CATEGORIES = [
     'art', 'technology', 'sports', 'music', 'fashion', 'travel', 'space',
     'fantasy', 'abstract', 'vintage', 'minimalist', 'surreal'
 ]
+IMAGE_TYPES = ('real', 'ai')
+
+# first: approve the first candidate per category and reject the rest (the old auto-choice);
+# all: approve every candidate; interactive: ask on the terminal
+APPROVAL_POLICIES = ('first', 'all', 'interactive')
+
+# Search pages a category may page through before giving up short of its target
+MAX_SEARCH_PAGES = 10
+
+# Per-shard output of batch runs (the terminal only shows the aggregated progress bar)
+BATCH_LOG_DIR = os.path.join('cache', 'batch_logs')
+
+
+def build_derivatives(path, base_path='images'):
+    from derivatives import build_for
+    return build_for(path, base_path)
+
 
 class ImageDownloader:
-    def __init__(self, base_path="images", target_count=6):
+    # Upstream search endpoints; class-level so benchmarks can point them at a local stub
+    UNSPLASH_SEARCH_URL = "https://unsplash.com/napi/search/photos"
+    LEXICA_SEARCH_URL = "https://lexica.art/api/v1/search"
+
+    def __init__(self, base_path="images", target_count=6, workers=4, requests_per_second=2.0,
+                 journal_file=JOURNAL_FILE, resume=False, approval='first', on_saved=None,
+                 repair_journal=True, encode_policy=None):
+        from adaptive_encoder import policy_from_env
+        from image_store import ImageStore
+        from perceptual_index import get_perceptual_index
+
+        if approval not in APPROVAL_POLICIES:
+            raise ValueError(f"unknown approval policy '{approval}'")
         self.base_path = base_path
         self.target_count = target_count
-        self.progress_file = "download_progress.json"
-        self.progress = self.load_progress()
-        
-    def load_progress(self):
-        """Load existing progress from JSON file"""
-        if os.path.exists(self.progress_file):
-            with open(self.progress_file, 'r') as f:
-                return json.load(f)
-        return {"real": {}, "ai": {}}
-    
-    def save_progress(self):
-        """Save current progress to JSON file"""
-        with open(self.progress_file, 'w') as f:
-            json.dump(self.progress, f, indent=2)
+        self.workers = workers
+        self.resume = resume
+        self.approval = approval
+        # Called with (category, image_type, path) after each file is saved
+        self.on_saved = on_saved
+        # Append-only, fsync'd record of every candidate; replaces download_progress.json
+        self.journal = DownloadJournal(journal_file, repair=repair_journal)
+        # Per-host budget replaces the old fixed sleep between candidates
+        self.rate_limiter = HostRateLimiter(rate=requests_per_second, burst=max(1, workers))
+        # Byte budget / quality target for saved images (see adaptive_encoder.py)
+        self.store = ImageStore(os.path.join(base_path, '.store'), encode_policy or policy_from_env())
+        # Rejects other crops/qualities of images the category already has
+        self.near_index = get_perceptual_index(base_path)
+        # Shared with the Flask server, so re-runs and UI refreshes reuse search results
+        self.search_cache = get_search_cache()
+        # Indexed record of what the library holds (see catalog.py)
+        self.catalog = get_catalog(base_path)
     
-    def get_unsplash_images(self, category, count=10):
-        """Fetch candidate images from Unsplash API"""
+    def get_unsplash_images(self, category, count=10, page=1):
+        """Fetch candidate images from Unsplash API (cached, see search_cache.py)"""
+        import http_client
+
         try:
             # Using Unsplash's public API (no key required for basic access)
-            url = f"https://unsplash.com/napi/search/photos"
+            url = self.UNSPLASH_SEARCH_URL
             params = {
                 'query': category,
                 'per_page': count,
+                'page': page,
                 'orientation': 'landscape'
             }
             
-            response = requests.get(url, params=params, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('results', [])
-            else:
+            def fetch():
+                self.rate_limiter.acquire(url)
+                response = http_client.get(url, params=params, timeout=(5, 10), source='unsplash')
+                if response.status_code == 200:
+                    return response.json()
                 print(f"⚠️  Unsplash API returned status {response.status_code}")
-                return []
+                return None
+            
+            with metrics.timed('search'):
+                data = self.search_cache.get_or_fetch('unsplash', category, page, count, fetch)
+            return (data or {}).get('results', [])
         except Exception as e:
             print(f"❌ Error fetching from Unsplash: {e}")
             return []
     
-    def get_lexica_images(self, category, count=10):
-        """Fetch AI-generated images from Lexica.art"""
+    def get_lexica_images(self, category, count=10, page=1):
+        """Fetch AI-generated images from Lexica.art (cached, see search_cache.py)"""
+        import http_client
+
         try:
             # Lexica.art public API
-            url = "https://lexica.art/api/v1/search"
+            url = self.LEXICA_SEARCH_URL
             params = {
                 'q': category,
                 'size': 'landscape',
-                'per_page': count
+                'per_page': count,
+                'page': page
             }
             
-            response = requests.get(url, params=params, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('images', [])
-            else:
+            def fetch():
+                self.rate_limiter.acquire(url)
+                response = http_client.get(url, params=params, timeout=(5, 10), source='lexica')
+                if response.status_code == 200:
+                    return response.json()
                 print(f"⚠️  Lexica API returned status {response.status_code}")
-                return []
+                return None
+            
+            with metrics.timed('search'):
+                data = self.search_cache.get_or_fetch('lexica', category, page, count, fetch)
+            return (data or {}).get('images', [])
         except Exception as e:
             print(f"❌ Error fetching from Lexica: {e}")
             return []
     
+    def iter_candidates(self, category, image_type, page_size, max_pages=MAX_SEARCH_PAGES):
+        """Search results for one category, fetched page by page only as they are consumed.
+
+        The next page is requested in the background while the current one is
+        reviewed. Results without a URL, repeated across pages or already
+        handled (saved in the library, or with resume, decided in an earlier
+        run) are skipped. Paging ends at a short page or after `max_pages`.
+        """
+        search = self.get_unsplash_images if image_type == 'real' else self.get_lexica_images
+        prefetch = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search-prefetch')
+        seen = set()
+        try:
+            upcoming = prefetch.submit(search, category, page_size, 1)
+            for page in range(1, max_pages + 1):
+                results = upcoming.result()
+                more = len(results) >= page_size and page < max_pages
+                if more:
+                    upcoming = prefetch.submit(search, category, page_size, page + 1)
+                for candidate in results:
+                    url = self.candidate_url(candidate, image_type)
+                    if not url or url in seen:
+                        continue
+                    seen.add(url)
+                    if self.catalog.has_source(url):
+                        print(f"⏭️  Already in the library: {url}")
+                        continue
+                    if self.resume and self.journal.processed(url):
+                        print(f"⏭️  Already {self.journal.state(url)} in an earlier run: {url}")
+                        continue
+                    yield candidate
+                if not more:
+                    return
+        finally:
+            # Stopping early (quota filled) leaves at most one prefetched page unused
+            prefetch.shutdown(wait=False, cancel_futures=True)
+
+    def fetch_bytes(self, url):
+        """Stream raw image bytes (size/format checked up front), or None if rejected"""
+        from image_fetch import ImageRejected, fetch_image
+
+        self.rate_limiter.acquire(url)
+        try:
+            return fetch_image(url)
+        except ImageRejected as e:
+            print(f"🚫 Rejected {url}: {e}")
+            return None
+
     def download_image(self, url, filename):
         """Download and save an image"""
         try:
-            response = requests.get(url, timeout=15)
-            if response.status_code == 200:
-                # Open with PIL to resize and optimize
-                img = Image.open(io.BytesIO(response.content))
-                
-                # Convert to RGB if necessary
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Resize to consistent dimensions for game performance
-                img = img.resize((800, 600), Image.Resampling.LANCZOS)
-                
-                # Save with optimization
-                img.save(filename, 'JPEG', quality=85, optimize=True)
-                return True
+            # The store skips the fetch for known URLs and the encode for known pixels
+            result = self.store.save(url, filename, self.fetch_bytes, admit=self.near_index.admit)
+            if result is None:
+                return False
+            if result['duplicate']:
+                if result['near']:
+                    print(f"🔁 Too similar to existing {result['duplicate']}, skipping")
+                    metrics.count_error('near_duplicate')
+                else:
+                    print(f"🔁 Same image as existing {result['duplicate']}, skipping")
+                    metrics.count_error('duplicate')
+                self.journal.record('duplicate', url=url, of=result['duplicate'])
+                return False
+            return True
         except Exception as e:
             print(f"❌ Error downloading image: {e}")
         return False
@@ -133,9 +238,11 @@ class ImageDownloader:
             
             # Get user decision
             while True:
-                # For testing, auto-approve first image, reject others
-                choice = 'y' if approved_count == 0 else 'n'  # input("\nApprove this image? (Y)es / (N)o / (S)kip category / (Q)uit: ").lower().strip()
-                print(f"\nAuto-choice: {choice}")
+                if self.approval == 'interactive':
+                    choice = input("\nApprove this image? (Y)es / (N)o / (S)kip category / (Q)uit: ").lower().strip()
+                else:
+                    choice = 'y' if self.approval == 'all' or approved_count == 0 else 'n'
+                    print(f"\nAuto-choice ({self.approval}): {choice}")
                 if choice in ['y', 'yes']:
                     return True
                 elif choice in ['n', 'no']:
@@ -160,7 +267,12 @@ class ImageDownloader:
         if not os.path.exists(category_path):
             os.makedirs(category_path, exist_ok=True)
         
-        existing_count = len([f for f in os.listdir(category_path) if f.lower().endswith(('.jpg', '.jpeg', '.png'))])
+        # Downloads left behind by an interrupted run were never journaled as saved
+        for name in os.listdir(category_path):
+            if name.endswith('.part'):
+                os.remove(os.path.join(category_path, name))
+        
+        existing_count = self.catalog.count(category, image_type)
         needed = max(0, self.target_count - existing_count)
         
         if needed == 0:
@@ -169,102 +281,364 @@ class ImageDownloader:
         
         print(f"📊 Need {needed} more images (have {existing_count}/{self.target_count})")
         
-        # Fetch candidate images
-        if image_type == 'real':
-            candidates = self.get_unsplash_images(category, needed * 2)  # Get extra for filtering
-        else:
-            candidates = self.get_lexica_images(category, needed * 2)
+        # Candidates are searched page by page (twice what's needed per page) until the quota is
+        # filled; the `first` policy rejects everything after one approval, so more pages can't help it
+        max_pages = 1 if self.approval == 'first' else MAX_SEARCH_PAGES
+        candidates = self.iter_candidates(category, image_type, needed * 2, max_pages)
         
-        if not candidates:
+        # Approval stays sequential (it may prompt the user); fetching, resizing
+        # and saving run on a worker pool while the next candidate is reviewed
+        pending = {}  # future -> (candidate index, temp path, url, candidate)
+        saved = {}    # candidate index -> (temp path, url, candidate)
+        offered = 0
+        outcome = True
+
+        def collect(block):
+            if not pending:
+                return
+            done, _ = wait(list(pending), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, temp_path, url, candidate = pending.pop(future)
+                if future.result():
+                    saved[index] = (temp_path, url, candidate)
+                else:
+                    print("❌ Failed to download image")
+                    if self.journal.state(url) != 'duplicate':
+                        self.journal.record('failed', url=url, category=category, image_type=image_type)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for i, candidate in enumerate(candidates):
+                offered += 1
+                url = self.candidate_url(candidate, image_type)
+                self.journal.record('seen', url=url, category=category, image_type=image_type)
+
+                # Show preview and get approval
+                result = self.show_image_preview(candidate, image_type, category, i + 1, len(saved) + len(pending))
+
+                if result == 'quit':
+                    print("👋 Quitting download process")
+                    outcome = False
+                    break
+                elif result == 'skip':
+                    print(f"⏭️  Skipping {category} category")
+                    break
+                elif result:
+                    self.journal.record('approved', url=url, category=category, image_type=image_type)
+                    temp_path = os.path.join(category_path, f".{image_type}_{category}_candidate_{i}.part")
+                    pending[executor.submit(self.download_image, url, temp_path)] = (i, temp_path, url, candidate)
+                elif self.approval == 'interactive':
+                    self.journal.record('rejected', url=url, category=category, image_type=image_type)
+                else:
+                    # Passed over by the policy, not judged: a later run with another policy may take it
+                    self.journal.record('skipped', url=url, category=category, image_type=image_type)
+
+                collect(block=False)
+                # Never have more downloads in flight than slots left to fill
+                while pending and len(saved) + len(pending) >= needed:
+                    collect(block=True)
+                # Checked before pulling the next candidate, so a filled quota fetches no further pages
+                if len(saved) >= needed:
+                    break
+
+            while pending:
+                collect(block=True)
+            candidates.close()
+
+        if not offered and not saved:
             print(f"❌ No {image_type} images found for {category}")
             return False
-        
+
+        approved_count = self.finalize_downloads(category_path, category, image_type, saved, needed)
+        print(f"🎉 Completed {category} ({image_type}): {approved_count} images downloaded")
+        return outcome
+
+    def candidate_url(self, candidate, image_type):
+        """Extract the downloadable URL from an Unsplash/Lexica search result"""
+        if image_type == 'real':
+            return candidate.get('urls', {}).get('regular', '')
+        return candidate.get('src', '')
+
+    def candidate_details(self, candidate, image_type):
+        """(author, description) of an Unsplash/Lexica search result, for the catalog"""
+        if image_type == 'real':
+            return candidate.get('user', {}).get('name'), candidate.get('description')
+        return 'AI Generated (Lexica)', (candidate.get('prompt') or '')[:200] or None
+
+    def finalize_downloads(self, category_path, category, image_type, saved, needed):
+        """Rename finished downloads to their final names in candidate order.
+
+        Downloads complete in arbitrary order, so names are only handed out once
+        everything has finished: the earliest approved candidates get the lowest
+        free `{image_type}_{category}_{n}.jpg` numbers, and anything past
+        `needed` is discarded.
+        """
+        existing = set(os.listdir(category_path))
         approved_count = 0
-        for i, candidate in enumerate(candidates):
+        number = 1
+        for index in sorted(saved):
+            temp_path, url, candidate = saved[index]
             if approved_count >= needed:
-                break
-            
-            # Show preview and get approval
-            result = self.show_image_preview(candidate, image_type, category, i + 1, approved_count)
-            
-            if result == 'quit':
-                print("👋 Quitting download process")
-                return False
-            elif result == 'skip':
-                print(f"⏭️  Skipping {category} category")
-                return True
-            elif result:
-                # Download and save approved image
-                filename = f"{image_type}_{category}_{approved_count + 1}.jpg"
-                filepath = os.path.join(category_path, filename)
-                
-                if image_type == 'real':
-                    url = candidate.get('urls', {}).get('regular', '')
-                else:
-                    url = candidate.get('src', '')
-                
-                if self.download_image(url, filepath):
-                    approved_count += 1
-                    print(f"✅ Saved: {filename}")
-                else:
-                    print(f"❌ Failed to download image")
-            
-            # Small delay to be respectful to APIs
-            time.sleep(0.5)
-        
-        print(f"🎉 Completed {category} ({image_type}): {approved_count} images downloaded")
-        return True
-    
-    def run(self):
-        """Main download process"""
+                os.remove(temp_path)
+                self.near_index.rename(temp_path, None)
+                continue
+            while f"{image_type}_{category}_{number}.jpg" in existing:
+                number += 1
+            filename = f"{image_type}_{category}_{number}.jpg"
+            final_path = os.path.join(category_path, filename)
+            os.replace(temp_path, final_path)
+            self.near_index.rename(temp_path, final_path)
+            build_derivatives(final_path, self.base_path)
+            update_manifest(final_path, self.base_path)
+            author, description = self.candidate_details(candidate, image_type)
+            self.catalog.record(final_path, url=url, author=author, description=description)
+            self.journal.record('saved', url=url, category=category, image_type=image_type, file=final_path)
+            existing.add(filename)
+            approved_count += 1
+            print(f"✅ Saved: {filename}")
+            if self.on_saved:
+                self.on_saved(category, image_type, final_path)
+        return approved_count
+
+    def run(self, categories=CATEGORIES, image_types=('real',)):
+        """Download every category/type in this process"""
+        from tqdm import tqdm
+
         print("🚀 AI Slop Shooter Image Downloader")
         print(f"📁 Target: {self.target_count} images per category/type")
         print(f"📂 Base path: {self.base_path}")
         
-        # Ask user what to download
-        print("\nWhat would you like to download?")
-        print("1. Real images only")
-        print("2. AI images only") 
-        print("3. Both real and AI images")
-        print("4. Specific categories only")
-        
-        # For testing, default to option 1 (real images only)
-        choice = "1"  # input("Enter choice (1-4): ").strip()
-        
-        if choice == '4':
-            # Let user select specific categories
-            print(f"\nAvailable categories: {', '.join(CATEGORIES)}")
-            # For testing, use first 3 categories only
-            categories = ['dogs', 'cats', 'cars']  # input("Enter categories (comma-separated): ").strip().split(',')
-            # categories = [cat.strip() for cat in selected if cat.strip() in CATEGORIES]
-        else:
-            categories = CATEGORIES
-        
         if not categories:
             print("❌ No valid categories selected")
             return
         
-        # Download based on choice
         for category in tqdm(categories, desc="Processing categories"):
-            if choice in ['1', '3']:
-                self.download_category_images(category, 'real')
-            if choice in ['2', '3']:
-                self.download_category_images(category, 'ai')
+            for image_type in image_types:
+                self.download_category_images(category, image_type)
         
         print("\n🎉 Download process completed!")
-        self.save_progress()
+        print(f"\n⏱️  Where the time went:\n{metrics.stage_breakdown()}")
+        self.journal.close()
 
-if __name__ == "__main__":
-    # Check if required packages are installed
+
+DEFAULT_SPEC = {
+    'categories': CATEGORIES,
+    'types': ['real'],
+    'target': 6,
+    'approval': 'first',
+    'processes': 1,
+    'workers': 4,
+    'rate': 2.0,
+    'resume': True,
+    'base_path': 'images',
+    'max_bytes': None,
+    'min_psnr': None
+}
+
+
+def load_spec(path):
+    """Job spec file: a JSON object with any of DEFAULT_SPEC's keys"""
+    with open(path) as f:
+        spec = json.load(f)
+    unknown = set(spec) - set(DEFAULT_SPEC)
+    if unknown:
+        raise ValueError(f"unknown job spec keys: {', '.join(sorted(unknown))}")
+    return spec
+
+
+def plan_batch(spec, dry_run=False):
+    """[(category, image_type, images needed)] for every slot below the target, from the catalog.
+    A dry run counts the files on disk instead, so it never creates, rebuilds or hashes anything."""
+    counts = count_on_disk(spec['base_path']) if dry_run else get_catalog(spec['base_path']).counts()
+    deficits = deficits_from_counts(counts, spec['categories'], spec['target'], spec['types'])
+    return [(category, image_type, deficits[category][image_type])
+            for category in spec['categories'] for image_type in spec['types']
+            if deficits.get(category, {}).get(image_type)]
+
+
+def shard_plan(plan, processes):
+    """Split the plan into `processes` shards of roughly equal work, keeping each category in one shard
+    (a category's real and AI slots share its directory-level bookkeeping)"""
+    by_category = {}
+    for category, image_type, needed in plan:
+        by_category.setdefault(category, []).append((category, image_type, needed))
+    shards = [[] for _ in range(max(1, min(processes, len(by_category))))]
+    loads = [0] * len(shards)
+    # Largest first into the least loaded shard
+    for items in sorted(by_category.values(), key=lambda items: -sum(item[2] for item in items)):
+        lightest = loads.index(min(loads))
+        shards[lightest].extend(items)
+        loads[lightest] += sum(item[2] for item in items)
+    return shards
+
+
+def run_shard(shard, spec, report, repair_journal=True):
+    """Download one shard's slots; `report(event)` is called with each saved file and finished slot"""
+    downloader = ImageDownloader(
+        base_path=spec['base_path'],
+        target_count=spec['target'],
+        workers=spec['workers'],
+        requests_per_second=spec['rate'],
+        resume=spec['resume'],
+        approval=spec['approval'],
+        on_saved=lambda category, image_type, path: report({'event': 'saved', 'category': category,
+                                                            'image_type': image_type}),
+        repair_journal=repair_journal,
+        encode_policy=encode_policy(spec)
+    )
+    completed = True
     try:
-        import PIL
-        import requests
-        from tqdm import tqdm
-    except ImportError as e:
-        print(f"❌ Missing required package: {e}")
-        print("💡 Run: pip install -r requirements.txt")
-        sys.exit(1)
+        for category, image_type, _ in shard:
+            report({'event': 'started', 'category': category, 'image_type': image_type})
+            completed = downloader.download_category_images(category, image_type) and completed
+            report({'event': 'finished', 'category': category, 'image_type': image_type})
+    finally:
+        downloader.journal.close()
+    if downloader.store.encode_policy:
+        from adaptive_encoder import bytes_saved
+        print(f"📉 Adaptive encoding saved {bytes_saved()} bytes against quality=85")
+    return completed
+
+
+def encode_policy(spec):
+    """EncodePolicy for the spec's byte budget / quality target, or None to use the environment's"""
+    if spec['max_bytes'] is None and spec['min_psnr'] is None:
+        return None
+    from adaptive_encoder import EncodePolicy
+    return EncodePolicy(max_bytes=spec['max_bytes'], min_psnr=spec['min_psnr'])
+
+
+def run_shard_process(number, shard, spec, events):
+    """Worker process entry point: output goes to a per-shard log, progress to the parent's queue"""
+    from image_transform import configure_engine
+
+    # The shards are the process-level parallelism; transforms run inline in each of them
+    configure_engine(0)
+    os.makedirs(BATCH_LOG_DIR, exist_ok=True)
+    with open(os.path.join(BATCH_LOG_DIR, f"shard-{number}.log"), 'a', buffering=1, encoding='utf-8') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        # The parent already repaired the journal; a torn tail now is another shard mid-append
+        return run_shard(shard, spec, events.put, repair_journal=False)
+
+
+def describe_plan(plan, shards):
+    lines = [f"📋 {sum(needed for _, _, needed in plan)} images needed across {len(plan)} category/type slots"]
+    for number, shard in enumerate(shards):
+        slots = ', '.join(f"{category}/{image_type} +{needed}" for category, image_type, needed in shard)
+        lines.append(f"   shard {number}: {slots}")
+    return '\n'.join(lines)
+
+
+def run_batch(spec, dry_run=False):
+    """Plan from the catalog, shard by category and download with one aggregated progress bar"""
+    plan = plan_batch(spec, dry_run)
+    shards = shard_plan(plan, spec['processes'])
+    print(describe_plan(plan, shards))
+    if dry_run or not plan:
+        return True
+
+    from tqdm import tqdm
+
+    # Replay (and repair) the journal once before any shard appends to it
+    DownloadJournal(JOURNAL_FILE).close()
+    progress = tqdm(total=sum(needed for _, _, needed in plan), unit='img', desc='Downloading')
+    active = set()
+
+    def report(event):
+        slot = f"{event['category']}/{event['image_type']}"
+        if event['event'] == 'saved':
+            progress.update(1)
+        elif event['event'] == 'started':
+            active.add(slot)
+        else:
+            active.discard(slot)
+        progress.set_postfix_str(', '.join(sorted(active)))
+
+    try:
+        if len(shards) == 1:
+            return run_shard(shards[0], spec, report)
+
+        import multiprocessing
+
+        with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=len(shards)) as executor:
+            events = manager.Queue()
+            futures = [executor.submit(run_shard_process, number, shard, spec, events)
+                       for number, shard in enumerate(shards)]
+            while not all(future.done() for future in futures) or not events.empty():
+                try:
+                    report(events.get(timeout=0.2))
+                except queue.Empty:
+                    continue
+            completed = True
+            for number, future in enumerate(futures):
+                try:
+                    completed = future.result() and completed
+                except Exception as e:
+                    progress.write(f"❌ Shard {number} failed: {e}")
+                    completed = False
+            progress.write(f"📝 Shard logs in {BATCH_LOG_DIR}/")
+            return completed
+    finally:
+        progress.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download images for the AI Slop Shooter game")
+    parser.add_argument('--job', help="JSON job spec (categories, types, target, approval, processes, ...); "
+                                      "flags override it")
+    parser.add_argument('--categories', help="comma-separated categories (default: all)")
+    parser.add_argument('--types', help="comma-separated image types: real, ai (default: real)")
+    parser.add_argument('--target', type=int, help="images wanted per category/type (default: 6)")
+    parser.add_argument('--approve', dest='approval', choices=APPROVAL_POLICIES,
+                        help="approval policy (default: first)")
+    parser.add_argument('--processes', type=int, help="worker processes, categories are split between them")
+    parser.add_argument('--workers', type=int, help="concurrent downloads per process (default: 4)")
+    parser.add_argument('--rate', type=float, help="requests per second per host (default: 2)")
+    parser.add_argument('--no-resume', dest='resume', action='store_false', default=None,
+                        help="offer candidates the journal has already seen again")
+    parser.add_argument('--base-path', help="image library root (default: images)")
+    parser.add_argument('--max-bytes', type=int, help="byte budget per saved image (quality is searched)")
+    parser.add_argument('--min-psnr', type=float, help="quality target per saved image in dB, e.g. 38")
+    parser.add_argument('--dry-run', action='store_true', help="print the plan and exit")
+    args = parser.parse_args(argv)
+
+    spec = dict(DEFAULT_SPEC)
+    try:
+        if args.job:
+            spec.update(load_spec(args.job))
+    except (OSError, ValueError) as e:
+        parser.error(f"bad job spec: {e}")
+    for key in ('target', 'approval', 'processes', 'workers', 'rate', 'resume', 'base_path', 'max_bytes', 'min_psnr'):
+        if getattr(args, key) is not None:
+            spec[key] = getattr(args, key)
+    if args.categories:
+        spec['categories'] = [c.strip() for c in args.categories.split(',') if c.strip()]
+    if args.types:
+        spec['types'] = [t.strip() for t in args.types.split(',') if t.strip()]
+
+    unknown = [c for c in spec['categories'] if c not in CATEGORIES]
+    if unknown:
+        parser.error(f"unknown categories: {', '.join(unknown)}")
+    if not set(spec['types']) <= set(IMAGE_TYPES):
+        parser.error(f"types must be among: {', '.join(IMAGE_TYPES)}")
+    if spec['approval'] not in APPROVAL_POLICIES:
+        parser.error(f"approval must be one of: {', '.join(APPROVAL_POLICIES)}")
+    if spec['processes'] < 1 or spec['target'] < 0:
+        parser.error("processes must be at least 1 and target non-negative")
+    if not spec['rate'] > 0:
+        parser.error("rate must be a positive number of requests per second")
+    if spec['approval'] == 'interactive' and spec['processes'] > 1:
+        parser.error("interactive approval needs a single process")
+    return spec, args.dry_run
+
+
+if __name__ == "__main__":
+    spec, dry_run = parse_args()
+    if not dry_run:
+        # Check if required packages are installed (they are imported where they're used)
+        missing = [name for name in ('PIL', 'requests', 'tqdm') if importlib.util.find_spec(name) is None]
+        if missing:
+            print(f"❌ Missing required package: {', '.join(missing)}")
+            print("💡 Run: pip install -r requirements.txt")
+            sys.exit(1)
     
-    # Create downloader and run
-    downloader = ImageDownloader()
-    downloader.run()
+    sys.exit(0 if run_batch(spec, dry_run) else 1)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Crash-safe download journal
+Append-only JSONL log of every candidate the downloader sees, its approval
+decision and the file it was saved to; replayed on start so interrupted
+runs can resume where they stopped
+"""
+
+import json
+import os
+import threading
+import time
+
+JOURNAL_FILE = "download_journal.jsonl"
+
+# Final states: a candidate in one of these is never offered or fetched again on resume. Only
+# a person's rejection is final; candidates an approval policy passed over are journaled 'skipped'
+FINAL_STATES = {'rejected', 'saved', 'duplicate'}
+
+
+class DownloadJournal:
+    """Each record is one JSON line written with a single append and fsync'd.
+
+    A crash can at worst leave a torn final line, which is dropped (and the
+    file truncated back to the last complete record) on the next open.
+    """
+
+    def __init__(self, path=JOURNAL_FILE, repair=True):
+        self.path = path
+        self.lock = threading.Lock()
+        self.states = {}  # url -> latest record
+        self.saved_files = {}  # saved path -> url
+        self.replay(repair)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def replay(self, repair=True):
+        """Load the records. With repair=False a torn tail is skipped but left alone: when several
+        processes append to one journal, it may be another writer's record still in flight"""
+        if not os.path.exists(self.path):
+            return
+        good_bytes = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                good_bytes += len(line)
+                self.apply(record)
+        if repair and good_bytes < os.path.getsize(self.path):
+            print(f"⚠️  Dropping torn record at the end of {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_bytes)
+
+    def apply(self, record):
+        url = record.get('url')
+        if url:
+            self.states[url] = record
+        if record.get('event') == 'saved' and record.get('file'):
+            self.saved_files[record['file']] = url
+
+    def record(self, event, **fields):
+        """Durably append one event"""
+        record = {'event': event, 'time': round(time.time(), 3), **fields}
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.apply(record)
+        return record
+
+    def state(self, url):
+        record = self.states.get(url)
+        return record['event'] if record else None
+
+    def processed(self, url):
+        """True if `url` reached a final state and, if it was saved, the file is still on disk"""
+        record = self.states.get(url)
+        if not record or record['event'] not in FINAL_STATES:
+            return False
+        if record['event'] == 'saved':
+            return os.path.exists(record.get('file', ''))
+        return True
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Background generation jobs for the AI image sources (Replicate, Hugging Face)
+Requests are queued and answered with a job id straight away; a single
+scheduler thread polls pending predictions with backoff and a small worker
+pool makes the HTTP calls, so no Flask thread ever waits on a generation.
+Finished images go into the image store and are served from /api/store/.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import http_client
+import metrics
+from image_fetch import ImageRejected, fetch_image
+from image_store import get_store, store_url
+
+HUGGINGFACE_MODEL_URL = os.environ.get(
+    'HUGGINGFACE_MODEL_URL',
+    'https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0')
+REPLICATE_PREDICTIONS_URL = os.environ.get('REPLICATE_PREDICTIONS_URL', 'https://api.replicate.com/v1/predictions')
+REPLICATE_MODEL_VERSION = 'ac732df83cea7fff18b8472768c88ad041fa750ff7682a21affe81863cbe77e4'
+
+FINAL_STATUSES = {'succeeded', 'failed'}
+POLL_INITIAL = 1.0     # seconds before the first status check
+POLL_BACKOFF = 1.5
+POLL_MAX = 10.0
+RETRY_AFTER_MAX = 60.0  # cap on a provider-suggested wait (e.g. HF model loading)
+JOB_TIMEOUT = 300.0    # give up on a generation after five minutes
+MAX_FAILURES = 5       # consecutive transient errors before a job fails
+
+# A provider call either returns the image bytes or one of these
+Pending = namedtuple('Pending', ['prediction_id', 'retry_after'])
+
+
+class GenerationFailed(Exception):
+    """The provider reported a permanent failure for this job"""
+
+
+class ReplicateProvider:
+    """Replicate predictions API: create a prediction, then poll it until it has an output URL"""
+
+    name = 'replicate'
+
+    def __init__(self, url=REPLICATE_PREDICTIONS_URL, token=None, version=REPLICATE_MODEL_VERSION):
+        self.url = url.rstrip('/')
+        self.token = token
+        self.version = version
+
+    @property
+    def configured(self):
+        return bool(self.token)
+
+    def headers(self):
+        return {'Authorization': f"Token {self.token}"}
+
+    def submit(self, job):
+        payload = {
+            'version': self.version,
+            'input': {
+                'prompt': job.prompt,
+                'width': 800,
+                'height': 600,
+                'num_inference_steps': 20,
+                'seed': job.seed
+            }
+        }
+        response = http_client.post(self.url, json=payload, headers=self.headers(), timeout=(5, 30),
+                                    source=self.name)
+        if response.status_code not in (200, 201):
+            raise_for_status(self.name, response)
+        return self.interpret(response.json())
+
+    def poll(self, job):
+        response = http_client.get(f"{self.url}/{job.prediction_id}", headers=self.headers(), timeout=(5, 15),
+                                   source=self.name)
+        if response.status_code != 200:
+            raise_for_status(self.name, response)
+        return self.interpret(response.json())
+
+    def interpret(self, prediction):
+        status = prediction.get('status')
+        if status == 'succeeded':
+            output = prediction.get('output')
+            url = output[0] if isinstance(output, list) and output else output
+            if not url:
+                raise GenerationFailed("prediction succeeded without an output")
+            try:
+                return fetch_image(url)
+            except ImageRejected as e:
+                raise GenerationFailed(f"output rejected: {e}")
+        if status in ('failed', 'canceled'):
+            raise GenerationFailed(prediction.get('error') or f"prediction {status}")
+        return Pending(prediction['id'], None)
+
+
+class HuggingFaceProvider:
+    """Hugging Face inference API: one blocking call returns the image, or 503 while the model loads"""
+
+    name = 'huggingface'
+
+    def __init__(self, url=HUGGINGFACE_MODEL_URL, token=None):
+        self.url = url
+        self.token = token
+
+    @property
+    def configured(self):
+        return bool(self.token)
+
+    def submit(self, job):
+        payload = {
+            'inputs': job.prompt,
+            'parameters': {'num_inference_steps': 20, 'guidance_scale': 7.5, 'seed': job.seed}
+        }
+        # The scheduler handles "model loading" itself, using the wait the API suggests
+        response = http_client.post(self.url, json=payload, headers={'Authorization': f"Bearer {self.token}"},
+                                    timeout=(5, 60), retries=0, source=self.name)
+        if response.status_code == 200:
+            return response.content
+        if response.status_code == 503:
+            try:
+                estimate = float(response.json().get('estimated_time'))
+            except (TypeError, ValueError, AttributeError):
+                estimate = None
+            return Pending(None, estimate)
+        raise_for_status(self.name, response)
+
+    def poll(self, job):
+        # Nothing to poll: just try the generation again
+        return self.submit(job)
+
+
+def raise_for_status(source, response):
+    """Client errors won't fix themselves; anything else is retried"""
+    message = f"{source} returned HTTP {response.status_code}"
+    if 400 <= response.status_code < 500 and response.status_code != 429:
+        raise GenerationFailed(message)
+    raise RuntimeError(message)
+
+
+class GenerationJob:
+    def __init__(self, provider, prompt, category=None):
+        self.id = uuid.uuid4().hex
+        self.provider = provider
+        self.prompt = prompt
+        self.category = category
+        self.seed = uuid.uuid4().int % (2 ** 31)
+        self.status = 'queued'
+        self.prediction_id = None
+        self.digest = None
+        self.error = None
+        self.created = self.updated = time.time()
+        self.delay = POLL_INITIAL
+        self.failures = 0
+        self.version = 0  # bumped on every change, for long-polling clients
+
+    @property
+    def done(self):
+        return self.status in FINAL_STATUSES
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'provider': self.provider,
+            'prompt': self.prompt,
+            'category': self.category,
+            'status': self.status,
+            'error': self.error,
+            'src': store_url(self.digest) if self.digest else None,
+            'created': round(self.created, 3),
+            'updated': round(self.updated, 3),
+            'version': self.version
+        }
+
+
+class GenerationQueue:
+    """Runs generation jobs on a worker pool, polling pending ones from one scheduler thread.
+
+    Jobs are kept in memory (the most recent `keep`); their images outlive
+    them in the store.
+    """
+
+    def __init__(self, providers, store=None, workers=8, keep=500, job_timeout=JOB_TIMEOUT):
+        self.providers = {provider.name: provider for provider in providers}
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='generation')
+        self.keep = keep
+        self.job_timeout = job_timeout
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.schedule = []  # heap of (due time, tiebreak, job)
+        self.sequence = itertools.count()
+        self.scheduler = None
+
+    def available(self):
+        """Names of providers that have credentials"""
+        return [name for name, provider in self.providers.items() if provider.configured]
+
+    def enqueue(self, provider, prompt, category=None):
+        if provider not in self.available():
+            raise ValueError(f"generation provider '{provider}' is not configured")
+        job = GenerationJob(provider, prompt, category)
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.keep:
+                oldest_id, oldest = next(iter(self.jobs.items()))
+                if not oldest.done:
+                    break
+                del self.jobs[oldest_id]
+        self.executor.submit(self.run_step, job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def wait(self, jobs, versions, timeout):
+        """Block until any of `jobs` moves past its known version, all are finished, or `timeout` passes"""
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            while all(job.version <= version for job, version in zip(jobs, versions)) \
+                    and not all(job.done for job in jobs):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.changed.wait(remaining):
+                    break
+            return [job.to_dict() for job in jobs]
+
+    def update(self, job, **fields):
+        with self.changed:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.updated = time.time()
+            job.version += 1
+            self.changed.notify_all()
+
+    def run_step(self, job):
+        """Submit or poll `job` once (on a worker thread) and decide what happens next"""
+        provider = self.providers[job.provider]
+        try:
+            if time.time() - job.created > self.job_timeout:
+                raise GenerationFailed(f"timed out after {self.job_timeout:.0f}s")
+            if job.prediction_id is None and job.status == 'queued':
+                self.update(job, status='running')
+            result = provider.poll(job) if job.prediction_id else provider.submit(job)
+        except GenerationFailed as e:
+            self.fail(job, str(e))
+            return
+        except Exception as e:
+            if job.failures + 1 >= MAX_FAILURES:
+                self.fail(job, str(e))
+            else:
+                job.failures += 1
+                self.poll_later(job, None)
+            return
+
+        job.failures = 0
+        if isinstance(result, Pending):
+            if result.prediction_id and result.prediction_id != job.prediction_id:
+                self.update(job, prediction_id=result.prediction_id)
+            self.poll_later(job, result.retry_after)
+            return
+        try:
+            stored = (self.store or get_store()).put(result)
+        except Exception as e:
+            self.fail(job, f"could not decode generated image: {e}")
+            return
+        metrics.observe_stages({'generate': time.time() - job.created})
+        self.update(job, status='succeeded', digest=stored['digest'])
+
+    def fail(self, job, error):
+        metrics.count_error('generation_failed')
+        self.update(job, status='failed', error=error)
+
+    def poll_later(self, job, retry_after):
+        delay = min(retry_after, RETRY_AFTER_MAX) if retry_after is not None else job.delay
+        job.delay = min(POLL_MAX, job.delay * POLL_BACKOFF)
+        with self.changed:
+            heapq.heappush(self.schedule, (time.monotonic() + delay, next(self.sequence), job))
+            if self.scheduler is None:
+                self.scheduler = threading.Thread(target=self.run_scheduler, name='generation-scheduler', daemon=True)
+                self.scheduler.start()
+            self.changed.notify_all()
+
+    def run_scheduler(self):
+        """Hand due polls to the worker pool; sleeps until the next one is due"""
+        while True:
+            with self.changed:
+                while not self.schedule or self.schedule[0][0] > time.monotonic():
+                    timeout = self.schedule[0][0] - time.monotonic() if self.schedule else None
+                    self.changed.wait(timeout)
+                _, _, job = heapq.heappop(self.schedule)
+            self.executor.submit(self.run_step, job)
+
+
+def default_providers():
+    """Providers configured from the environment (HF_API_TOKEN, REPLICATE_API_TOKEN)"""
+    return [
+        HuggingFaceProvider(HUGGINGFACE_MODEL_URL, os.environ.get('HF_API_TOKEN')),
+        ReplicateProvider(REPLICATE_PREDICTIONS_URL, os.environ.get('REPLICATE_API_TOKEN'))
+    ]
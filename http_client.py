@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Shared pooled HTTP client for the image downloaders
+Keeps connections alive per host and retries 429/5xx with jittered backoff
+"""
+
+import email.utils
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# (connect, read) seconds; callers override per call
+DEFAULT_TIMEOUT = (5, 15)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses that mean the server did not act on the request, so even a POST is safe to resend
+SAFE_RETRY_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+
+class HttpClient:
+    """requests.Session wrapper with bounded keep-alive pools and retries"""
+
+    def __init__(self, pool_connections=16, pool_maxsize=8, max_retries=3,
+                 backoff_base=0.5, backoff_cap=20.0, max_retry_after=60.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_retry_after = max_retry_after
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'ai-slop-shooter-image-downloader/1.0'
+        # pool_connections = how many hosts keep a pool, pool_maxsize = sockets per host.
+        # pool_block makes extra threads wait for a socket instead of opening throwaway ones.
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=True,
+            max_retries=0
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def backoff_delay(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def retry_after_delay(self, response):
+        """Seconds requested by a Retry-After header, or None"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                when = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            delay = when.timestamp() - time.time()
+        return max(0.0, min(delay, self.max_retry_after))
+
+    def request(self, method, url, timeout=DEFAULT_TIMEOUT, retries=None, source=None, **kwargs):
+        """Send a request, retrying transient failures; returns the final response.
+
+        Latency (including retries) and body size are recorded per upstream
+        `source`, which defaults to one derived from the URL's host.
+        """
+        source = source or metrics.source_for_url(url)
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = self.send_with_retries(method, url, timeout, retries, **kwargs)
+            outcome = metrics.status_outcome(response.status_code)
+            if response.status_code >= 400:
+                metrics.count_error('upstream_status')
+            if not kwargs.get('stream'):
+                metrics.UPSTREAM_BYTES.inc(len(response.content), source=source)
+            return response
+        except requests.RequestException:
+            metrics.count_error('upstream_connection')
+            raise
+        finally:
+            metrics.UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - start, source=source, outcome=outcome)
+
+    def send_with_retries(self, method, url, timeout, retries, **kwargs):
+        method = method.upper()
+        retries = self.max_retries if retries is None else retries
+        idempotent = method in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else SAFE_RETRY_STATUSES
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # A non-idempotent request may have reached the server unless we never connected
+                retryable = idempotent or isinstance(e, requests.ConnectTimeout)
+                if attempt >= retries or not retryable:
+                    raise
+                delay = self.backoff_delay(attempt)
+            else:
+                if response.status_code not in retry_statuses or attempt >= retries:
+                    return response
+                delay = self.retry_after_delay(response)
+                if delay is None:
+                    delay = self.backoff_delay(attempt)
+                # Release the socket back to the pool before sleeping
+                response.close()
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide shared client (created lazily)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient()
+    return _client
+
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_client().post(url, **kwargs)
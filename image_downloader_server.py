@@ -3,15 +3,53 @@
 Flask backend for the Image Downloader web UI
 """
 
-from flask import Flask, request, jsonify, send_from_directory
-import requests
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory, stream_with_context
+import http_client
+import metrics
 import os
 import json
-from PIL import Image
-import io
-import time
+import base64
+import binascii
+from image_fetch import MAX_IMAGE_BYTES, ImageRejected, fetch_image
+from image_store import STORE_URL_PREFIX, get_store, is_digest, store_url
+from manifest import update_manifest
+from catalog import get_catalog
+from perceptual_index import get_perceptual_index
+from derivatives import build_for as build_derivatives
+from search_cache import get_search_cache
+from download_batches import BatchRegistry
+from static_assets import serve as serve_static
+from generation_jobs import GenerationQueue, default_providers
+from admission import AdmissionGate, Saturated, SingleFlight
+from ai_sources import AISourceRace, GenerationSource, LexicaSource, ThisPersonDoesNotExistSource
 
 app = Flask(__name__)
+metrics.instrument_flask(app)
+
+# Upstream endpoints; module-level so benchmarks can point them at a local stub
+UNSPLASH_SEARCH_URL = "https://unsplash.com/napi/search/photos"
+LEXICA_SEARCH_URL = "https://lexica.art/api/v1/search"
+THISPERSONDOESNOTEXIST_URL = "https://thispersondoesnotexist.com/image"
+
+# Replicate/HF generations run in the background (tokens from HF_API_TOKEN / REPLICATE_API_TOKEN)
+generation = GenerationQueue(default_providers())
+MAX_GENERATIONS_PER_REQUEST = 10
+# Longest a job status request may wait for a change
+MAX_JOB_WAIT = 30
+# Largest page /api/images will return
+MAX_LISTING_PAGE = 200
+# Saves (download + decode + resize) running at once, waiting for a slot, and the longest wait
+# before /api/download-image answers 429
+MAX_ACTIVE_SAVES = 4
+MAX_QUEUED_SAVES = 16
+MAX_SAVE_WAIT = 10.0
+
+# Raced concurrently by /api/fetch-ai-images; fallbacks below are used only if all of them fail
+ai_sources = AISourceRace([
+    ThisPersonDoesNotExistSource(THISPERSONDOESNOTEXIST_URL),
+    LexicaSource(LEXICA_SEARCH_URL),
+    GenerationSource(generation, MAX_GENERATIONS_PER_REQUEST)
+], deadline=10.0)
 
 # Game categories
 CATEGORIES = [
@@ -23,132 +61,69 @@ CATEGORIES = [
 def index():
     return send_from_directory('.', 'image_downloader.html')
 
+@app.route('/game/')
+def game_index():
+    """Serve the game itself, with cache validators (see static_assets.py)"""
+    return serve_static('index.html')
+
+@app.route('/game/<path:filename>')
+def game_asset(filename):
+    """Game JS/CSS and the images/ tree: ETags, 304s, Range and precompressed text"""
+    return serve_static(filename)
+
 @app.route('/api/fetch-real-images')
 def fetch_real_images():
-    """Fetch real images from Unsplash API"""
+    """Fetch real images from Unsplash API (cached, see search_cache.py)"""
     category = request.args.get('category', 'dogs')
     count = int(request.args.get('count', 10))
+    page = int(request.args.get('page', 1))
     
     try:
-        url = "https://unsplash.com/napi/search/photos"
+        url = UNSPLASH_SEARCH_URL
         params = {
             'query': category,
             'per_page': count,
+            'page': page,
             'orientation': 'landscape'
         }
+        failure = {}
+        
+        def fetch():
+            response = http_client.get(url, params=params, timeout=(5, 10), source='unsplash')
+            if response.status_code == 200:
+                return response.json()
+            failure['status'] = response.status_code
+            return None
         
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
+        with metrics.timed('search'):
+            data = get_search_cache().get_or_fetch('unsplash', category, page, count, fetch)
+        if data is not None:
             return jsonify(data)
         else:
-            return jsonify({'error': f'Unsplash API returned status {response.status_code}'}), 400
+            metrics.count_error('search_failed')
+            return jsonify({'error': f"Unsplash API returned status {failure.get('status')}"}), 400
             
     except Exception as e:
+        metrics.count_error('handler_exception')
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/fetch-ai-images')
 def fetch_ai_images():
-    """Fetch AI images from multiple sources"""
+    """Fetch AI images from multiple sources.
+    
+    ThisPersonDoesNotExist (people only), Lexica and the generation APIs are
+    raced under one deadline (see ai_sources.py); the first to come back with
+    images wins. Generation jobs that are still running are listed under
+    `jobs` (status 202); poll /api/generate?ids=... for them.
+    """
     category = request.args.get('category', 'dogs')
     count = int(request.args.get('count', 10))
     
-    # Try multiple AI image sources
-    sources = [
-        {
-            'name': 'ThisPersonDoesNotExist',
-            'url': 'https://thispersondoesnotexist.com/image',
-            'works_for': ['people']
-        },
-        {
-            'name': 'HuggingFaceStableDiffusion',
-            'url': 'https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0',
-            'works_for': ['all'],
-            'headers': {'Authorization': 'Bearer hf_your_token_here'}  # Free tier available
-        },
-        {
-            'name': 'ReplicateStableDiffusion',
-            'url': 'https://api.replicate.com/v1/predictions',
-            'works_for': ['all'],
-            'api_key': 'your_replicate_key_here'
-        }
-    ]
-    
-    for source in sources:
-        try:
-            if source['name'] == 'ThisPersonDoesNotExist' and category == 'people':
-                # Generate multiple fake person images
-                images = []
-                for i in range(min(count, 10)):
-                    images.append({
-                        'src': f"{source['url']}?{i}",
-                        'prompt': f'AI generated person {i+1}',
-                        'author': 'AI Generated'
-                    })
-                return jsonify({'images': images})
-            
-            elif source['name'] == 'HuggingFaceStableDiffusion':
-                # Try Hugging Face Stable Diffusion (free tier)
-                prompt = f"AI generated {category}, high quality, detailed"
-                payload = {
-                    "inputs": prompt,
-                    "parameters": {
-                        "num_inference_steps": 20,
-                        "guidance_scale": 7.5
-                    }
-                }
-                
-                response = requests.post(
-                    source['url'], 
-                    json=payload,
-                    headers=source.get('headers', {}),
-                    timeout=30
-                )
-                
-                if response.status_code == 200:
-                    # Hugging Face returns base64 encoded image
-                    import base64
-                    image_data = response.content
-                    base64_image = base64.b64encode(image_data).decode('utf-8')
-                    
-                    images = []
-                    for i in range(count):
-                        images.append({
-                            'src': f"data:image/png;base64,{base64_image}",
-                            'prompt': f'AI generated {category} {i+1}',
-                            'author': 'AI Generated (Stable Diffusion)'
-                        })
-                    return jsonify({'images': images})
-            
-            elif source['name'] == 'ReplicateStableDiffusion':
-                # Try Replicate API (requires API key)
-                prompt = f"AI generated {category}, high quality, detailed"
-                payload = {
-                    "version": "ac732df83cea7fff18b8472768c88ad041fa750ff7682a21affe81863cbe77e4",
-                    "input": {
-                        "prompt": prompt,
-                        "width": 800,
-                        "height": 600,
-                        "num_inference_steps": 20
-                    }
-                }
-                
-                response = requests.post(
-                    source['url'],
-                    json=payload,
-                    headers={'Authorization': f"Token {source['api_key']}"},
-                    timeout=60
-                )
-                
-                if response.status_code == 201:
-                    # Replicate returns a prediction ID, need to poll for result
-                    prediction_id = response.json()['id']
-                    # For now, return placeholder since this requires polling
-                    continue
-                    
-        except Exception as e:
-            print(f"Error with {source['name']}: {e}")
-            continue
+    winner, images, jobs = ai_sources.run(category, count)
+    offered = {image['src'] for image in images}
+    jobs = [state for state in (job.to_dict() for job in jobs) if state['src'] not in offered]
+    if images or jobs:
+        return jsonify({'images': images, 'jobs': jobs, 'source': winner}), 202 if jobs else 200
     
     # Fallback: Use some known AI image datasets
     ai_image_urls = {
@@ -193,63 +168,235 @@ def fetch_ai_images():
     
     return jsonify({'images': placeholder_images})
 
+def approved_image_source(data):
+    """(url, author, description) of an approved image"""
+    image_data = data['imageData']
+    if data['imageType'] == 'real':
+        return (image_data.get('urls', {}).get('regular', ''),
+                image_data.get('user', {}).get('name'), image_data.get('description'))
+    return image_data.get('src', ''), image_data.get('author'), image_data.get('prompt')
+
+def save_approved_image(data):
+    """Download and save one approved image; returns (response body, status code)"""
+    category = data['category']
+    image_type = data['imageType']
+    index = data['index']
+    url, author, description = approved_image_source(data)
+    
+    if not url:
+        return {'error': 'No image URL found'}, 400
+    # Pages from before generated images were served from the store still post inline data URIs
+    if url.startswith('data:'):
+        try:
+            url = store_data_uri(url)
+        except (ValueError, ImageRejected) as e:
+            return {'error': f'Bad inline image: {e}'}, 400
+    # Generated images are already in the store; nothing to download
+    if url.startswith(STORE_URL_PREFIX) and get_store().lookup_url(url) is None:
+        return {'error': 'Unknown stored image'}, 404
+    
+    # Create directory if it doesn't exist
+    save_dir = f"images/{category}/{image_type}"
+    os.makedirs(save_dir, exist_ok=True)
+    
+    # Save with clean filename
+    filename = f"{image_type}_{category}_{index}.jpg"
+    filepath = os.path.join(save_dir, filename)
+    
+    # The store skips the download for known URLs and the encode for known pixels;
+    # new images are processed in the transform process pool, off the request thread
+    try:
+        result = get_store().save(url, filepath, fetch_image, admit=get_perceptual_index().admit)
+    except ImageRejected as e:
+        return {'error': f'Failed to download image: {e}'}, 400
+    if result['duplicate']:
+        metrics.count_error('near_duplicate' if result['near'] else 'duplicate')
+        return {
+            'error': f"{'Too similar to' if result['near'] else 'Same image as'} existing {result['duplicate']}",
+            'duplicate': result['duplicate'],
+            'near': result['near']
+        }, 409
+    build_derivatives(filepath)
+    update_manifest(filepath)
+    get_catalog().record(filepath, url=url, author=author, description=description)
+    
+    return {'success': True, 'filename': filename}, 200
+
+def store_data_uri(uri):
+    """Persist a base64 `data:image/...` URI in the store once; returns its store URL"""
+    header, _, payload = uri.partition(',')
+    if not header.startswith('data:image/') or not header.endswith(';base64'):
+        raise ValueError('only base64 image data URIs are accepted')
+    if len(payload) * 3 // 4 > MAX_IMAGE_BYTES:
+        raise ImageRejected(f'inline image exceeds {MAX_IMAGE_BYTES} bytes')
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except binascii.Error as e:
+        raise ValueError(str(e))
+    try:
+        return store_url(get_store().put(data)['digest'])
+    except Exception as e:
+        raise ImageRejected(f'could not decode image: {e}')
+
+# Concurrent saves of the same source URL share one download, and at most
+# MAX_ACTIVE_SAVES decode at once (batch items included)
+save_flights = SingleFlight('save_image')
+save_gate = AdmissionGate('save_image', MAX_ACTIVE_SAVES, MAX_QUEUED_SAVES, MAX_SAVE_WAIT)
+
+def save_coalesced(data, reject=True):
+    """save_approved_image behind the admission gate, sharing the result of an identical save in flight.
+    
+    Raises Saturated when `reject` is set and the gate is full. The gate is passed before
+    joining a flight, so a request that would be turned away never waits on another's save.
+    """
+    slot = (data['category'], data['imageType'], data['index'])
+    url = approved_image_source(data)[0]
+    if not url:
+        return save_approved_image(data)
+    
+    def save():
+        (body, status, saved_slot), _ = save_flights.run(url, lambda: save_approved_image(data) + (slot,))
+        if saved_slot != slot:
+            # Same image approved for another slot: the URL is in the store now, so this only links
+            body, status = save_approved_image(data)
+        return body, status
+    
+    return save_gate.run(save, reject)
+
 @app.route('/api/download-image', methods=['POST'])
 def download_image():
     """Download and save an approved image"""
     try:
-        data = request.json
-        image_data = data['imageData']
-        category = data['category']
-        image_type = data['imageType']
-        index = data['index']
-        
-        # Get image URL
-        if image_type == 'real':
-            url = image_data.get('urls', {}).get('regular', '')
-        else:
-            url = image_data.get('src', '')
-        
-        if not url:
-            return jsonify({'error': 'No image URL found'}), 400
-        
-        # Create directory if it doesn't exist
-        save_dir = f"images/{category}/{image_type}"
-        os.makedirs(save_dir, exist_ok=True)
-        
-        # Download image
-        response = requests.get(url, timeout=15)
-        if response.status_code != 200:
-            return jsonify({'error': 'Failed to download image'}), 400
-        
-        # Process image
-        img = Image.open(io.BytesIO(response.content))
-        
-        # Convert to RGB if necessary
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Resize to consistent dimensions for game performance
-        img = img.resize((800, 600), Image.Resampling.LANCZOS)
-        
-        # Save with clean filename
-        filename = f"{image_type}_{category}_{index}.jpg"
-        filepath = os.path.join(save_dir, filename)
-        
-        # Save with optimization
-        img.save(filepath, 'JPEG', quality=85, optimize=True)
-        
-        return jsonify({'success': True, 'filename': filename})
-        
+        body, status = save_coalesced(request.json)
+        return jsonify(body), status
+    
+    except Saturated as e:
+        return jsonify({'error': str(e), 'retryAfter': e.retry_after}), 429, {'Retry-After': str(e.retry_after)}
     except Exception as e:
+        metrics.count_error('handler_exception')
         return jsonify({'error': str(e)}), 500
 
+# Batch items are already limited by the batch pool, so they wait for a slot instead of being turned away
+batches = BatchRegistry(lambda item: save_coalesced(item, reject=False))
+
+def stream_batch(batch):
+    """Newline-delimited JSON: accepted, one line per item as it finishes, then done"""
+    def generate():
+        for event in batch.stream():
+            yield json.dumps(event) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/download-batch', methods=['POST'])
+def download_batch():
+    """Queue a list of approved images (any categories) and stream per-item results.
+    
+    Body: {"items": [{imageData, category, imageType, index}, ...], "batchId": optional}.
+    Resubmitting the same items (or batchId) attaches to the existing batch.
+    """
+    data = request.json or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list'}), 400
+    for item in items:
+        if not isinstance(item, dict) or not {'imageData', 'category', 'imageType', 'index'} <= item.keys():
+            return jsonify({'error': 'each item needs imageData, category, imageType and index'}), 400
+    
+    batch, created = batches.submit(items, data.get('batchId'))
+    response = stream_batch(batch)
+    response.status_code = 202 if created else 200
+    return response
+
+@app.route('/api/download-batch/<batch_id>')
+def download_batch_progress(batch_id):
+    """Re-attach to a batch's progress stream (replays finished items)"""
+    batch = batches.get(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Unknown batch'}), 404
+    return stream_batch(batch)
+
+@app.route('/api/generate', methods=['POST'])
+def generate_images():
+    """Queue generations: {"category", "count"?, "prompt"?, "provider"?} -> 202 with the jobs"""
+    data = request.json or {}
+    category = data.get('category', 'dogs')
+    prompt = data.get('prompt') or f"AI generated {category}, high quality, detailed"
+    providers = [data['provider']] if data.get('provider') else generation.available()
+    if not providers:
+        return jsonify({'error': 'No generation API configured (set HF_API_TOKEN or REPLICATE_API_TOKEN)'}), 503
+    count = max(1, min(int(data.get('count', 1)), MAX_GENERATIONS_PER_REQUEST))
+    try:
+        jobs = [generation.enqueue(providers[i % len(providers)], prompt, category) for i in range(count)]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'jobs': [job.to_dict() for job in jobs]}), 202
+
+@app.route('/api/generate/<job_id>')
+def generation_status(job_id):
+    """One generation job's status"""
+    job = generation.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/generate')
+def generation_statuses():
+    """Several jobs' statuses: ?ids=a,b&versions=3,0&wait=<seconds> long-polls until any of them
+    moves past the given version (one connection for a whole request's worth of jobs)"""
+    ids = [i for i in request.args.get('ids', '').split(',') if i]
+    jobs = [generation.get(job_id) for job_id in ids]
+    if not jobs or None in jobs:
+        return jsonify({'error': 'Unknown job'}), 404
+    versions = [int(v) for v in request.args.get('versions', '').split(',') if v]
+    versions += [-1] * (len(jobs) - len(versions))
+    wait = max(0.0, min(float(request.args.get('wait', 0)), MAX_JOB_WAIT))
+    return jsonify({'jobs': generation.wait(jobs, versions, wait)})
+
+@app.route(f'{STORE_URL_PREFIX}<name>')
+def stored_image(name):
+    """A blob from the content-addressed store; its URL never changes meaning, so it caches forever"""
+    digest = name.split('.')[0]
+    store = get_store()
+    if not is_digest(digest) or not store.has(digest):
+        return jsonify({'error': 'Unknown stored image'}), 404
+    response = send_file(os.path.abspath(store.path_for(digest)), mimetype='image/jpeg', etag=digest[:32], conditional=True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/api/images')
+def list_images():
+    """Paginated library listing from the catalog: ?category=&type=&page=1&per_page=50"""
+    page = max(1, int(request.args.get('page', 1)))
+    per_page = max(1, min(int(request.args.get('per_page', 50)), MAX_LISTING_PAGE))
+    images, total = get_catalog().list_images(request.args.get('category'), request.args.get('type'),
+                                              limit=per_page, offset=(page - 1) * per_page)
+    return jsonify({'images': images, 'total': total, 'page': page, 'per_page': per_page})
+
+@app.route('/api/images/stats')
+def image_stats():
+    """Per-category counts, plus what is still missing for ?target=N images per category/type"""
+    catalog = get_catalog()
+    target = int(request.args.get('target', 6))
+    return jsonify({'counts': catalog.counts(), 'deficits': catalog.deficits(CATEGORIES, target), 'target': target})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint (see metrics.py)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/categories')
 def get_categories():
     """Get list of available categories"""
     return jsonify({'categories': CATEGORIES})
 
 if __name__ == '__main__':
+    from atlas import build_game_assets
+    
+    # Renditions, atlases and the manifest are build outputs; only new or changed images are processed
+    stats = build_game_assets()
+    print(f"🖼️  Game images: {stats['derivatives']['built']} renditions and {stats['atlases']['built']} atlases rebuilt")
     print("🌐 Starting Image Downloader Web Server...")
     print("📱 Open your browser to: http://localhost:5001")
+    print("🎮 Play the game at: http://localhost:5001/game/")
     print("🛑 Press Ctrl+C to stop the server")
     app.run(debug=True, host='0.0.0.0', port=5001)
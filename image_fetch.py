@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Streaming, memory-bounded image fetch
+Checks Content-Type/Content-Length before reading the body, sniffs the image
+header from the first chunks and aborts as soon as the format or dimensions
+are unacceptable, and never buffers more than a hard byte cap.
+
+Peak memory per concurrent download is bounded by
+    max_bytes (body buffer) + CHUNK_SIZE + HEADER_PROBE_BYTES (header sniff copy)
+i.e. about 20.3 MiB with the defaults; handing the body to the transform
+engine adds one more transient copy of at most max_bytes.
+"""
+
+import io
+
+from PIL import Image, UnidentifiedImageError
+
+import http_client
+import metrics
+
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+# Pixel budget for a source image (about 7000x5700); larger ones are decompression-bomb territory
+MAX_PIXELS = 40_000_000
+# Anything smaller than the game's render box would be upscaled
+MIN_SIZE = (200, 160)
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF', 'BMP', 'TIFF', 'AVIF'}
+# Content types some CDNs use for images
+ALLOWED_CONTENT_TYPES = {'application/octet-stream', 'binary/octet-stream'}
+CHUNK_SIZE = 64 * 1024
+# Give up if no image header has been recognised after this many bytes
+HEADER_PROBE_BYTES = 256 * 1024
+
+
+class ImageRejected(Exception):
+    """The URL did not yield an acceptable image; the message says why"""
+
+
+class HeaderSniffer:
+    """Incremental image header parser.
+
+    PIL's ImageFile.Parser would do, but it allocates the full decoded image
+    (load_prepare) as soon as it recognises the header, before we get a chance
+    to look at the dimensions. This only runs the lazy Image.open on the bytes
+    seen so far, retrying as the prefix doubles, so nothing is decoded.
+    """
+
+    def __init__(self):
+        self.format = None
+        self.size = None
+        self.next_attempt = 1024
+
+    def feed(self, buffer):
+        """Try to identify the image from `buffer` (all bytes so far); True once known"""
+        if self.format is not None:
+            return True
+        if len(buffer) < self.next_attempt:
+            return False
+        self.next_attempt = len(buffer) * 2
+        try:
+            with Image.open(io.BytesIO(bytes(buffer[:HEADER_PROBE_BYTES]))) as img:
+                self.format, self.size = img.format, img.size
+        except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+            return False
+        return True
+
+    def finish(self, buffer):
+        """Last attempt once the whole body is in"""
+        self.next_attempt = 0
+        return self.feed(buffer)
+
+
+def check_header(sniffer, min_size=MIN_SIZE, max_pixels=MAX_PIXELS):
+    if sniffer.format not in ALLOWED_FORMATS:
+        raise ImageRejected(f"unsupported image format {sniffer.format}")
+    width, height = sniffer.size
+    if width * height > max_pixels:
+        raise ImageRejected(f"image is {width}x{height}, over the {max_pixels:,} pixel limit")
+    if width < min_size[0] or height < min_size[1]:
+        raise ImageRejected(f"image is {width}x{height}, smaller than {min_size[0]}x{min_size[1]}")
+
+
+def fetch_image(url, max_bytes=MAX_IMAGE_BYTES, min_size=MIN_SIZE, max_pixels=MAX_PIXELS, timeout=(5, 15)):
+    """Download an image body, rejecting bad responses as early as possible.
+
+    Returns the encoded bytes (as a bytearray, to avoid a final copy) or raises
+    ImageRejected. Network errors propagate from the HTTP client.
+    """
+    try:
+        with metrics.timed('fetch'):
+            return read_image(url, max_bytes, min_size, max_pixels, timeout)
+    except ImageRejected:
+        metrics.count_error('image_rejected')
+        raise
+
+
+def read_image(url, max_bytes, min_size, max_pixels, timeout):
+    response = http_client.get(url, stream=True, timeout=timeout)
+    try:
+        if response.status_code != 200:
+            raise ImageRejected(f"HTTP {response.status_code}")
+
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type and not content_type.startswith('image/') and content_type not in ALLOWED_CONTENT_TYPES:
+            raise ImageRejected(f"Content-Type {content_type} is not an image")
+
+        declared = response.headers.get('Content-Length')
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise ImageRejected(f"Content-Length {int(declared):,} exceeds the {max_bytes:,} byte cap")
+
+        buffer = bytearray()
+        sniffer = HeaderSniffer()
+        header_checked = False
+        for chunk in response.iter_content(CHUNK_SIZE):
+            buffer += chunk
+            if len(buffer) > max_bytes:
+                raise ImageRejected(f"body exceeds the {max_bytes:,} byte cap")
+            if not header_checked:
+                if sniffer.feed(buffer):
+                    check_header(sniffer, min_size, max_pixels)
+                    header_checked = True
+                elif len(buffer) > HEADER_PROBE_BYTES:
+                    raise ImageRejected("no image header in the first bytes")
+
+        if not header_checked:
+            if not sniffer.finish(buffer):
+                raise ImageRejected("response is not a recognisable image")
+            check_header(sniffer, min_size, max_pixels)
+        metrics.UPSTREAM_BYTES.inc(len(buffer), source=metrics.source_for_url(url))
+        return buffer
+    finally:
+        # Closing a partially read stream drops the connection rather than draining the rest
+        response.close()
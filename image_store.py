@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Content-addressed image store
+Every processed image is written once under images/.store, keyed by the
+SHA-256 of its decoded pixels; category files are hard links into the store
+"""
+
+import contextlib
+import hashlib
+import io
+import os
+import shutil
+import sys
+import time
+from urllib.parse import urlparse
+
+from PIL import Image
+
+import metrics
+from adaptive_encoder import encode_adaptive, policy_from_env, record_savings, store_blobs_by_inode
+from atomic_io import atomic_write_json, file_lock, fsync_directory, read_json
+from image_transform import JPEG_QUALITY, TARGET_SIZE, decode_image, fit_image, get_engine
+
+STORE_ROOT = os.path.join('images', '.store')
+
+# Hosts that return a different image for the same URL, so a URL hit proves nothing
+VOLATILE_HOSTS = {'thispersondoesnotexist.com', 'picsum.photos'}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif')
+
+# Server URL for a stored blob (see /api/store/<digest>); the store resolves these without a fetch
+STORE_URL_PREFIX = '/api/store/'
+
+
+def pixel_digest(img):
+    """SHA-256 over the decoded pixels (plus mode/size so shapes can't collide)"""
+    h = hashlib.sha256(f"{img.mode}:{img.width}x{img.height}:".encode())
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def object_path(objects_dir, digest):
+    return os.path.join(objects_dir, digest[:2], f"{digest}.jpg")
+
+
+def is_digest(value):
+    return len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+
+def store_url(digest):
+    return f"{STORE_URL_PREFIX}{digest}.jpg"
+
+
+def store_image(fp, objects_dir, target_size=TARGET_SIZE, quality=JPEG_QUALITY, policy=None):
+    """Transform-engine job: decode, hash and (only if new) resize + encode into the store.
+
+    With an EncodePolicy the JPEG quality is searched per image (see
+    adaptive_encoder.py) instead of using `quality`. The result carries
+    per-stage wall times in seconds under 'timings'.
+    """
+    timings = {}
+    start = time.perf_counter()
+    img = decode_image(fp, target_size)
+    digest = pixel_digest(img)
+    timings['decode'] = time.perf_counter() - start
+    path = object_path(objects_dir, digest)
+    if os.path.exists(path):
+        return {'digest': digest, 'existing': True, 'timings': timings}
+
+    start = time.perf_counter()
+    img = fit_image(img, target_size)
+    timings['resize'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encoded = {}
+    if policy is None:
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=quality, optimize=True)
+        data = buffer.getbuffer()
+    else:
+        encoded = encode_adaptive(img, policy)
+        data = encoded.pop('data')
+    timings['encode'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    timings['write'] = time.perf_counter() - start
+    return {**encoded, 'digest': digest, 'existing': False, 'width': img.width, 'height': img.height,
+            'bytes': len(data), 'timings': timings}
+
+
+class ImageStore:
+    """Blob directory plus a small URL -> digest index"""
+
+    def __init__(self, root=STORE_ROOT, encode_policy=None):
+        self.root = root
+        # None keeps the fixed quality encode; an EncodePolicy searches quality per image
+        self.encode_policy = encode_policy
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_file = os.path.join(root, 'index.json')
+        self.lock_file = os.path.join(root, '.lock')
+
+    def path_for(self, digest):
+        return object_path(self.objects_dir, digest)
+
+    def has(self, digest):
+        return os.path.exists(self.path_for(digest))
+
+    def url_cacheable(self, url):
+        return urlparse(url).netloc.lower() not in VOLATILE_HOSTS
+
+    def lookup_url(self, url):
+        """Digest previously stored for `url` (or named by a store URL), if its blob still exists"""
+        if url.startswith(STORE_URL_PREFIX):
+            digest = url[len(STORE_URL_PREFIX):].split('.')[0]
+            return digest if is_digest(digest) and self.has(digest) else None
+        if not self.url_cacheable(url):
+            return None
+        digest = read_json(self.index_file, {}).get('urls', {}).get(url)
+        if digest and self.has(digest):
+            return digest
+        return None
+
+    def remember_url(self, url, digest):
+        if not self.url_cacheable(url):
+            return
+        with file_lock(self.lock_file):
+            index = read_json(self.index_file, {})
+            index.setdefault('urls', {})[url] = digest
+            atomic_write_json(self.index_file, index)
+
+    def find_duplicate(self, digest, directory, exclude=None):
+        """Name of a file in `directory` that already holds `digest`'s content"""
+        blob = self.path_for(digest)
+        if not os.path.isdir(directory):
+            return None
+        blob_stat = os.stat(blob)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            # In-flight link/encode temp files are never duplicates; `.part` downloads are
+            if name.endswith(('.link', '.tmp')) or (exclude and os.path.abspath(path) == os.path.abspath(exclude)):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) == (blob_stat.st_dev, blob_stat.st_ino):
+                return name
+            # Copies made where hard links aren't supported
+            if st.st_size == blob_stat.st_size and file_digest(path) == file_digest(blob):
+                return name
+        return None
+
+    def link(self, digest, dest):
+        """Atomically point `dest` at the stored blob (hard link, copy as fallback)"""
+        blob = self.path_for(digest)
+        with contextlib.suppress(OSError):
+            # rename() onto another link of the same inode is a no-op that leaves the temp behind
+            if os.path.samefile(blob, dest):
+                return
+        directory = os.path.dirname(dest) or '.'
+        os.makedirs(directory, exist_ok=True)
+        temp_path = os.path.join(directory, f".{os.path.basename(dest)}.{os.getpid()}.link")
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_path)
+        try:
+            os.link(blob, temp_path)
+        except OSError:
+            shutil.copyfile(blob, temp_path)
+        os.replace(temp_path, dest)
+        fsync_directory(directory)
+
+    def save(self, url, dest, fetch, target_size=TARGET_SIZE, quality=JPEG_QUALITY, admit=None):
+        """Store the image at `url` and link it to `dest`.
+
+        Skips the download when `url` is already known and skips the encode
+        when the decoded pixels are already stored. `fetch(url)` returns the
+        encoded bytes or None. `admit(blob path, dest, link)`, if given, wraps
+        the link in a near-duplicate check (see PerceptualIndex.admit) and
+        returns (path of an existing image the new one is too similar to or
+        None, link's result). Returns None
+        if the fetch failed, otherwise a dict with `digest`, `reused`,
+        `duplicate` (the name of an existing file with the same or, with
+        `near` set, similar content, in which case nothing was written) and
+        the transform job's stage `timings`.
+        """
+        digest = self.lookup_url(url)
+        reused = digest is not None
+        timings = {}
+        if digest is None:
+            data = fetch(url)
+            if data is None:
+                return None
+            result = self.put(data, target_size, quality)
+            digest = result['digest']
+            reused = result['existing']
+            timings = result['timings']
+            self.remember_url(url, digest)
+
+        if admit is not None:
+            near, duplicate = admit(self.path_for(digest), dest, lambda: self.link_unique(digest, dest))
+            if near is not None:
+                return {'digest': digest, 'reused': reused, 'duplicate': os.path.basename(near), 'near': True,
+                        'timings': timings}
+        else:
+            duplicate = self.link_unique(digest, dest)
+        return {'digest': digest, 'reused': reused, 'duplicate': duplicate, 'near': False, 'timings': timings}
+
+    def link_unique(self, digest, dest):
+        """Link `dest` to the blob unless its directory already holds the same content; returns that file's name"""
+        with file_lock(self.lock_file):
+            duplicate = self.find_duplicate(digest, os.path.dirname(dest), exclude=dest)
+            if duplicate is None:
+                self.link(digest, dest)
+        return duplicate
+
+    def put(self, data, target_size=TARGET_SIZE, quality=JPEG_QUALITY):
+        """Process encoded image bytes into the store (in the transform pool); returns store_image's result"""
+        result = get_engine().submit_job(store_image, data, self.objects_dir, target_size, quality,
+                                         self.encode_policy).result()
+        metrics.observe_stages(result['timings'])
+        record_savings(result)
+        return result
+
+    def adopt(self, path, target_size=TARGET_SIZE):
+        """Hard-link an existing library JPEG into the store.
+
+        The file keeps its bytes (no re-encode) but gets the same key and
+        object name store_image would give it: the pixel digest of the image
+        as decode_image reads it, under object_path(). Other formats raise
+        ValueError, since store objects are always JPEGs.
+        """
+        with Image.open(path) as img:
+            if img.format != 'JPEG':
+                raise ValueError(f"only JPEG files can be stored, not {img.format}")
+        digest = pixel_digest(decode_image(path, target_size))
+        blob = self.path_for(digest)
+        with file_lock(self.lock_file):
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                try:
+                    os.link(path, blob)
+                except OSError:
+                    shutil.copyfile(path, blob)
+        return digest
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = ImageStore(encode_policy=policy_from_env())
+    return _store
+
+
+def main(base_path='images'):
+    """Adopt the existing library into the store and report exact duplicates"""
+    store = ImageStore(os.path.join(base_path, '.store'))
+    # Files saved through the store are links to their blob already, under the source image's digest
+    blobs = store_blobs_by_inode(base_path)
+    seen = {}
+    duplicates = 0
+    for category in sorted(os.listdir(base_path)):
+        for image_type in ('real', 'ai'):
+            directory = os.path.join(base_path, category, image_type)
+            if category.startswith('.') or not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                path = os.path.join(directory, name)
+                st = os.stat(path)
+                try:
+                    blob = blobs.get((st.st_dev, st.st_ino))
+                    digest = os.path.basename(blob).split('.')[0] if blob else store.adopt(path)
+                except Exception as e:
+                    print(f"⚠️  Skipping {path}: {e}")
+                    continue
+                if digest in seen:
+                    duplicates += 1
+                    print(f"🔁 {path} duplicates {seen[digest]}")
+                else:
+                    seen[digest] = path
+    print(f"📦 {len(seen)} unique images stored, {duplicates} exact duplicates found")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
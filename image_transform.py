@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Image transform engine for the downloaders
+Decodes, resizes and JPEG-encodes images in a process pool so the Flask
+request threads (and the GIL) stay free while PIL does the heavy lifting
+"""
+
+import io
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+from PIL import Image, ImageOps
+
+# Consistent dimensions for game performance
+TARGET_SIZE = (800, 600)
+JPEG_QUALITY = 85
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable read-only file over a memoryview, so PIL can decode a shared
+    memory block in place instead of from a copied bytes object"""
+
+    def __init__(self, view):
+        self.view = view
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = max(0, min(len(buffer), len(self.view) - self.pos))
+        buffer[:n] = self.view[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.pos = offset
+        elif whence == io.SEEK_CUR:
+            self.pos += offset
+        else:
+            self.pos = len(self.view) + offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+
+def decode_image(fp, target_size=TARGET_SIZE):
+    """Open an image, letting the JPEG decoder downscale while decoding.
+
+    `draft` picks the largest DCT scale (1/2, 1/4, 1/8) that still yields at
+    least `target_size`, which makes multi-megapixel sources much cheaper.
+    """
+    img = Image.open(fp)
+    if img.format == 'JPEG':
+        img.draft('RGB', target_size)
+    img.load()
+    # Convert to RGB if necessary
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def fit_image(img, size):
+    """Scale and center-crop to exactly `size` without distorting the aspect ratio"""
+    return ImageOps.fit(img, size, Image.Resampling.LANCZOS, centering=(0.5, 0.5))
+
+
+def transform_image(fp, dest, target_size=TARGET_SIZE, quality=JPEG_QUALITY):
+    """Decode `fp`, fit to `target_size` and save an optimized JPEG to `dest`"""
+    img = decode_image(fp, target_size)
+    img = fit_image(img, target_size)
+    img.save(dest, 'JPEG', quality=quality, optimize=True)
+    return {'width': img.width, 'height': img.height, 'bytes': os.path.getsize(dest)}
+
+
+def run_shared(job, shm_name, size, *args):
+    """Worker entry point: run `job(fp, *args)` over image bytes in a shared memory block"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        view = shm.buf[:size]
+        try:
+            with BufferReader(view) as reader:
+                return job(io.BufferedReader(reader), *args)
+        finally:
+            view.release()
+    finally:
+        shm.close()
+
+
+class TransformEngine:
+    """Submits image transforms to a process pool.
+
+    Image bytes are copied once into a shared memory block and workers decode
+    straight from it, so nothing large is pickled through the pool's pipes.
+    With `max_workers=0` (or where process pools are unavailable) transforms
+    run inline in the calling thread.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers if max_workers is not None else min(4, os.cpu_count() or 1)
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def get_pool(self):
+        if self.max_workers == 0:
+            return None
+        with self.lock:
+            if self.pool is None:
+                try:
+                    if os.name == 'posix':
+                        # Workers must share our resource tracker: one they start
+                        # themselves would try to clean up every block they attached
+                        # to (already unlinked by us) when they exit, and warn
+                        resource_tracker.ensure_running()
+                    self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                except (OSError, NotImplementedError) as e:
+                    print(f"⚠️  Process pool unavailable, transforming inline: {e}")
+                    self.max_workers = 0
+            return self.pool
+
+    def submit_job(self, job, data, *args):
+        """Queue `job(fp, *args)` over `data` (encoded image bytes); returns a Future.
+
+        `job` must be a module-level function so the pool can pickle it by name.
+        """
+        pool = self.get_pool()
+        if pool is None:
+            future = Future()
+            try:
+                future.set_result(job(io.BytesIO(data), *args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        shm.buf[:len(data)] = data
+
+        def release(_):
+            shm.close()
+            shm.unlink()
+
+        try:
+            future = pool.submit(run_shared, job, shm.name, len(data), *args)
+        except Exception:
+            release(None)
+            raise
+        future.add_done_callback(release)
+        return future
+
+    def submit_call(self, fn, *args):
+        """Run a module-level function that reads its own input (e.g. from disk) in the pool"""
+        pool = self.get_pool()
+        if pool is None:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return pool.submit(fn, *args)
+
+    def submit(self, data, dest, target_size=TARGET_SIZE, quality=JPEG_QUALITY):
+        """Queue a resize + JPEG encode of `data` into `dest`; returns a Future"""
+        return self.submit_job(transform_image, data, dest, target_size, quality)
+
+    def transform(self, data, dest, target_size=TARGET_SIZE, quality=JPEG_QUALITY):
+        """Transform and wait for the result"""
+        return self.submit(data, dest, target_size, quality).result()
+
+    def shutdown(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def configure_engine(max_workers):
+    """Replace the shared engine, e.g. with max_workers=0 in processes that are themselves pool workers"""
+    global _engine
+    with _engine_lock:
+        previous, _engine = _engine, TransformEngine(max_workers)
+    if previous is not None:
+        previous.shutdown()
+
+
+def get_engine():
+    """Process-wide shared engine (the pool starts on first use)"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = TransformEngine()
+    return _engine
@@ -15,9 +15,13 @@ class ImageObject {
         this.textDisplayTimer = 0; // frames for text display
         this.textOpacity = 0; // opacity for text fade
         
-        // Load actual image if imageUrl is provided
+        // Load actual image if imageUrl is provided (or reuse a shared atlas sheet)
         this.image = null;
-        if (imageData.imageUrl) {
+        this.sourceRect = null;
+        if (imageData.atlas) {
+            this.image = imageData.atlas.image;
+            this.sourceRect = imageData.atlas;
+        } else if (imageData.imageUrl) {
             this.image = new Image();
             this.image.src = imageData.imageUrl;
             this.image.onerror = () => {
@@ -90,7 +94,9 @@ class ImageObject {
             // Calculate aspect ratio preserving dimensions
             const containerWidth = this.width - 4;
             const containerHeight = this.height - 4;
-            const imageAspect = this.image.width / this.image.height;
+            const sourceWidth = this.sourceRect ? this.sourceRect.w : this.image.width;
+            const sourceHeight = this.sourceRect ? this.sourceRect.h : this.image.height;
+            const imageAspect = sourceWidth / sourceHeight;
             const containerAspect = containerWidth / containerHeight;
             
             let drawWidth, drawHeight, drawX, drawY;
@@ -111,10 +117,15 @@ class ImageObject {
             
             // Debug logging for image dimensions
             if (Math.random() < 0.01) { // Only log occasionally to avoid spam
-                console.log(`Image ${this.imageData.text || 'unknown'}: original=${this.image.width}x${this.image.height}, drawn=${Math.round(drawWidth)}x${Math.round(drawHeight)}, aspect=${imageAspect.toFixed(2)}`);
+                console.log(`Image ${this.imageData.text || 'unknown'}: original=${sourceWidth}x${sourceHeight}, drawn=${Math.round(drawWidth)}x${Math.round(drawHeight)}, aspect=${imageAspect.toFixed(2)}`);
             }
             
-            ctx.drawImage(this.image, drawX, drawY, drawWidth, drawHeight);
+            if (this.sourceRect) {
+                const { x, y, w, h } = this.sourceRect;
+                ctx.drawImage(this.image, x, y, w, h, drawX, drawY, drawWidth, drawHeight);
+            } else {
+                ctx.drawImage(this.image, drawX, drawY, drawWidth, drawHeight);
+            }
         } else {
             // Fallback to text if no image
             ctx.fillStyle = '#fff';
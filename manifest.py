@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Image manifest builder
+Scans images/<category>/<real|ai>/ and writes images/manifest.json so the
+game can load exactly the files that exist instead of probing extensions
+"""
+
+import hashlib
+import os
+import sys
+import time
+
+import metrics
+from atomic_io import atomic_write_json, file_lock, read_json
+
+MANIFEST_VERSION = 1
+IMAGE_TYPES = ('real', 'ai')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif')
+# Hash prefix length used in ?v= URLs
+URL_VERSION_LENGTH = 12
+
+
+def manifest_path(base_path='images'):
+    return os.path.join(base_path, 'manifest.json')
+
+
+def lock_path(base_path='images'):
+    return os.path.join(base_path, '.manifest.lock')
+
+
+def describe_path(path, base_path='images'):
+    """URL path as the game requests it, relative to the directory holding `base_path`"""
+    return os.path.relpath(path, os.path.dirname(os.path.abspath(base_path))).replace(os.sep, '/')
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def versioned_url(path, base_path='images'):
+    """URL path with a ?v=<content hash prefix>, which the Flask static mode caches as immutable"""
+    return f"{describe_path(path, base_path)}?v={file_sha256(path)[:URL_VERSION_LENGTH]}"
+
+
+def describe_image(path, base_path='images'):
+    """Manifest entry for one file: URL path, byte size, dimensions and content hash"""
+    # PIL is imported here so catalog readers and download planning start without it
+    from PIL import Image
+    from derivatives import derivative_paths
+
+    entry = {
+        'path': describe_path(path, base_path),
+        'bytes': os.path.getsize(path),
+        'sha256': file_sha256(path)
+    }
+    try:
+        # Only the header is read for the size
+        with Image.open(path) as img:
+            entry['width'], entry['height'] = img.size
+    except Exception:
+        entry['width'] = entry['height'] = None
+    derived = {}
+    for rendition, formats in derivative_paths(path, base_path).items():
+        present = {ext: versioned_url(p, base_path) for ext, p in formats.items() if os.path.exists(p)}
+        if present:
+            derived[rendition] = present
+    if derived:
+        entry['derived'] = derived
+    return entry
+
+
+def scan_directory(directory, base_path='images'):
+    if not os.path.isdir(directory):
+        return []
+    return [
+        describe_image(os.path.join(directory, name), base_path)
+        for name in sorted(os.listdir(directory))
+        if not name.startswith('.') and name.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+
+
+def build_manifest(base_path='images'):
+    """Full rescan of the image tree"""
+    categories = {}
+    for category in sorted(os.listdir(base_path)):
+        category_path = os.path.join(base_path, category)
+        if category.startswith('.') or not any(os.path.isdir(os.path.join(category_path, t)) for t in IMAGE_TYPES):
+            continue
+        categories[category] = {
+            image_type: scan_directory(os.path.join(category_path, image_type), base_path)
+            for image_type in IMAGE_TYPES
+        }
+    # Sprite atlas indexes written by atlas.py
+    atlases = {}
+    for category in categories:
+        atlas_index = os.path.join(base_path, 'atlases', f"{category}.json")
+        if os.path.exists(atlas_index):
+            atlases[category] = versioned_url(atlas_index, base_path)
+    return {'version': MANIFEST_VERSION, 'generated': int(time.time()), 'categories': categories,
+            'atlases': atlases}
+
+
+def write_manifest(base_path='images'):
+    manifest = build_manifest(base_path)
+    with file_lock(lock_path(base_path)):
+        atomic_write_json(manifest_path(base_path), manifest)
+    return manifest
+
+
+def update_manifest(path, base_path='images'):
+    """Add, refresh or (if it no longer exists) drop a single file's entry"""
+    with metrics.timed('manifest'):
+        rel_dir = os.path.relpath(os.path.dirname(path), base_path)
+        category, image_type = os.path.split(rel_dir)
+        if image_type not in IMAGE_TYPES or not category or os.sep in category:
+            return
+        target = manifest_path(base_path)
+        with file_lock(lock_path(base_path)):
+            manifest = read_json(target, None)
+            if not manifest or manifest.get('version') != MANIFEST_VERSION:
+                manifest = build_manifest(base_path)
+            else:
+                entries = manifest['categories'].setdefault(category, {t: [] for t in IMAGE_TYPES}).setdefault(image_type, [])
+                url_path = describe_path(path, base_path)
+                entries[:] = [e for e in entries if e['path'] != url_path]
+                if os.path.exists(path):
+                    entries.append(describe_image(path, base_path))
+                    entries.sort(key=lambda e: e['path'])
+                manifest['generated'] = int(time.time())
+            atomic_write_json(target, manifest)
+
+
+def main(base_path='images'):
+    manifest = write_manifest(base_path)
+    total = sum(len(files) for types in manifest['categories'].values() for files in types.values())
+    print(f"📝 Wrote {manifest_path(base_path)}: {total} images in {len(manifest['categories'])} categories")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
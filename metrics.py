@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Process-local metrics in the Prometheus text exposition format
+Labelled counters, gauges and histograms (no prometheus_client needed), a
+cheap `timed()` context manager for pipeline stages, Flask request
+instrumentation and a plain-text stage breakdown for CLI runs
+"""
+
+import bisect
+import contextlib
+import threading
+import time
+from urllib.parse import urlparse
+
+# Seconds; spans a cached search (~ms) up to a slow generation API (~minute)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Upstream hosts by source label; anything else is 'other'
+SOURCE_HOSTS = {
+    'unsplash.com': 'unsplash',
+    'images.unsplash.com': 'unsplash',
+    'lexica.art': 'lexica',
+    'image.lexica.art': 'lexica',
+    'api-inference.huggingface.co': 'huggingface',
+    'huggingface.co': 'huggingface',
+    'api.replicate.com': 'replicate',
+    'replicate.delivery': 'replicate',
+    'thispersondoesnotexist.com': 'tpdne',
+    'picsum.photos': 'picsum',
+}
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{escape(value)}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    @contextlib.contextmanager
+    def track(self, **labels):
+        """Count the enclosed block as in progress"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                # per-bucket (non-cumulative) counts, then sum, count, max
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0.0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+            series[3] = max(series[3], value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """{label values: (count, sum, max)}"""
+        with self.lock:
+            return {key: (series[2], series[1], series[3]) for key, series in self.values.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((key, [list(series[0])] + series[1:]) for key, series in self.values.items())
+        for key, (counts, total, count, _) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labelnames, key, [('le', format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, cls, name, help, labelnames=(), **kwargs):
+        """Get or create a metric, so re-imports (e.g. the Flask reloader) don't duplicate it"""
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'imagedl_http_request_duration_seconds',
+    'Time to produce a response (for streamed responses, until the stream starts)',
+    ['route', 'method', 'status'])
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    'imagedl_http_requests_in_flight', 'Requests currently being handled', ['route'])
+HTTP_RESPONSE_BYTES = REGISTRY.counter(
+    'imagedl_http_response_bytes_total', 'Response body bytes sent (where the length is known)', ['route'])
+UPSTREAM_REQUEST_SECONDS = REGISTRY.histogram(
+    'imagedl_upstream_request_duration_seconds',
+    'Upstream API and image host latency including retries, until response headers',
+    ['source', 'outcome'])
+UPSTREAM_BYTES = REGISTRY.counter(
+    'imagedl_upstream_bytes_total', 'Response body bytes received from upstream', ['source'])
+STAGE_SECONDS = REGISTRY.histogram(
+    'imagedl_stage_duration_seconds',
+    'Pipeline stage durations (search, fetch, decode, resize, encode, write, derivatives, manifest)',
+    ['stage'])
+ERRORS = REGISTRY.counter('imagedl_errors_total', 'Errors by kind', ['kind'])
+
+
+def source_for_url(url):
+    host = (urlparse(url).hostname or '').lower()
+    return SOURCE_HOSTS.get(host, 'other')
+
+
+def timed(stage):
+    """Time a pipeline stage: `with timed('resize'): ...`"""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def observe_stages(timings):
+    """Record stage durations measured elsewhere (e.g. in a transform worker process)"""
+    for stage, seconds in (timings or {}).items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def count_error(kind):
+    ERRORS.inc(kind=kind)
+
+
+def status_outcome(status_code):
+    return f"{status_code // 100}xx"
+
+
+def render():
+    return REGISTRY.render()
+
+
+def stage_breakdown():
+    """Plain-text table of stage timings recorded so far in this process"""
+    snapshot = STAGE_SECONDS.snapshot()
+    if not snapshot:
+        return "No stage timings recorded"
+    grand_total = sum(total for _, total, _ in snapshot.values()) or 1.0
+    lines = [f"{'stage':<12} {'count':>6} {'total s':>9} {'mean ms':>9} {'max ms':>9} {'share':>6}"]
+    for (stage,), (count, total, peak) in sorted(snapshot.items(), key=lambda item: -item[1][1]):
+        lines.append(f"{stage:<12} {count:>6} {total:>9.2f} {total / count * 1000:>9.1f} "
+                     f"{peak * 1000:>9.1f} {total / grand_total:>6.0%}")
+    return '\n'.join(lines)
+
+
+def instrument_flask(app):
+    """Per-route latency, status, in-flight and response-size metrics for a Flask app"""
+    from flask import g, request
+
+    def route_label():
+        return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+    @app.before_request
+    def start_timer():
+        g.metrics_route = route_label()
+        g.metrics_start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(route=g.metrics_route)
+
+    @app.after_request
+    def record_response(response):
+        route = g.get('metrics_route')
+        if route is not None:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.metrics_start,
+                                         route=route, method=request.method, status=response.status_code)
+            if response.content_length:
+                HTTP_RESPONSE_BYTES.inc(response.content_length, route=route)
+        return response
+
+    @app.teardown_request
+    def finish(exc):
+        route = g.pop('metrics_route', None)
+        if route is not None:
+            HTTP_IN_FLIGHT.dec(route=route)
+            if exc is not None:
+                count_error('unhandled_exception')
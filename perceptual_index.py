@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Perceptual-hash near-duplicate index of the image library
+64-bit pHash (DCT) and dHash (gradient) for every library image, computed
+in NumPy batches and stored as columns in images/.phash_index.npz (plus
+an append-only log of later changes). Lookups within a Hamming radius go
+through a per-category BK-tree, so the save paths can reject the same
+photo at another crop or quality before it is written
+
+    python perceptual_index.py [images]          # refresh the index and list near-duplicate pairs
+"""
+
+import io
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from atomic_io import atomic_write_bytes, file_lock
+from catalog import split_library_path
+
+# Both hashes must be within these Hamming distances (of 64 bits) for a near duplicate
+PHASH_RADIUS = 10
+DHASH_RADIUS = 12
+DCT_SIZE = 32
+HASH_BATCH = 256
+# Log lines after which the log is folded into the npz
+COMPACT_AFTER = 1000
+
+COLUMNS = ('paths', 'categories', 'sizes', 'mtimes', 'phash', 'dhash')
+
+
+def dct_matrix(n=DCT_SIZE):
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.sqrt(2 / n) * np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+DCT = dct_matrix()
+
+
+def thumbnails(path_or_file):
+    """Grayscale 32x32 (for pHash) and 9x8 (for dHash) thumbnails as bytes"""
+    with Image.open(path_or_file) as img:
+        if img.format == 'JPEG':
+            img.draft('L', (DCT_SIZE * 2, DCT_SIZE * 2))
+        gray = img.convert('L')
+        return (gray.resize((DCT_SIZE, DCT_SIZE), Image.Resampling.LANCZOS).tobytes(),
+                gray.resize((9, 8), Image.Resampling.LANCZOS).tobytes())
+
+
+def pack_bits(bits):
+    """(N, 64) booleans -> N uint64 hashes"""
+    return np.packbits(bits, axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def hash_batch(thumbs):
+    """pHash and dHash arrays for a list of thumbnails() results, all at once"""
+    if not thumbs:
+        return np.zeros(0, np.uint64), np.zeros(0, np.uint64)
+    large = np.frombuffer(b''.join(t[0] for t in thumbs), np.uint8).reshape(-1, DCT_SIZE, DCT_SIZE)
+    small = np.frombuffer(b''.join(t[1] for t in thumbs), np.uint8).reshape(-1, 8, 9)
+    coefficients = np.einsum('kn,bnm,lm->bkl', DCT, large.astype(np.float64), DCT)[:, :8, :8].reshape(-1, 64)
+    # The DC term would dominate the median, so it is left out of it
+    medians = np.median(coefficients[:, 1:], axis=1)
+    phash = pack_bits(coefficients > medians[:, None])
+    dhash = pack_bits((small[:, :, 1:] > small[:, :, :-1]).reshape(-1, 64))
+    return phash, dhash
+
+
+def hamming(a, b):
+    return bin(int(a) ^ int(b)).count('1')
+
+
+def hamming_many(values, value):
+    """Hamming distance from `value` to each of `values` (uint64 array)"""
+    xor = np.bitwise_xor(values, np.uint64(value))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class BKTree:
+    """Metric tree over Hamming distance: a search only visits children whose edge
+    distance is within `radius` of the query's distance to their parent"""
+
+    def __init__(self):
+        self.root = None  # [value, item, {distance: child}]
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = [value, item, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, item, {}]
+                return
+            node = child
+
+    def search(self, value, radius):
+        """[(distance, item)] within `radius` of `value`"""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.append((distance, node[1]))
+            stack.extend(child for edge, child in node[2].items() if distance - radius <= edge <= distance + radius)
+        return found
+
+
+class PerceptualIndex:
+    """One row per library file plus per-category BK-trees over pHash.
+
+    The rows live in images/.phash_index.npz and an append-only log next
+    to it: each recorded, renamed or dropped file appends one line, which
+    other processes pick up on their next lookup, and the log is folded
+    into the npz every COMPACT_AFTER lines (and by refresh()).
+    """
+
+    def __init__(self, base_path='images', path=None):
+        self.base_path = base_path
+        self.path = path or os.path.join(base_path, '.phash_index.npz')
+        self.log_path = self.path + '.log'
+        self.lock_file = self.path + '.lock'
+        self.lock = threading.Lock()
+        self.loaded_mtime = None
+        self.log_offset = 0
+        self.log_lines = 0
+        # [path, category, size, mtime, phash, dhash] per row, None once dropped; row
+        # numbers never change until the next compaction, so the trees stay valid
+        self.table = []
+        self.rows = {}  # path -> row number
+        self.trees = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        """Replace the rows with the npz's (call with the file lock held)"""
+        self.table, self.rows, self.trees = [], {}, None
+        mtime = self.file_mtime()
+        if mtime is not None:
+            with np.load(self.path, allow_pickle=False) as data:
+                columns = [data[name].tolist() for name in COLUMNS]
+            for row in zip(*columns):
+                self.put(list(row))
+        self.loaded_mtime = mtime
+        self.log_offset = self.log_lines = 0
+
+    def sync(self):
+        """Catch up with other processes' changes (call with the file lock held)"""
+        if self.file_mtime() != self.loaded_mtime:
+            self.load()
+        try:
+            with open(self.log_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < self.log_offset:
+                    # Compacted by another process since the npz was loaded
+                    self.load()
+                f.seek(self.log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # A line without its newline is still being written
+        complete = data[:data.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            self.apply(json.loads(line))
+        self.log_offset += len(complete)
+
+    def apply(self, entry):
+        if entry['op'] == 'put':
+            self.put(entry['row'])
+        elif entry['op'] == 'rename':
+            self.move(entry['old'], entry['new'])
+        self.log_lines += 1
+
+    def put(self, row):
+        i = self.rows.get(row[0])
+        if i is not None:
+            # Replaced hashes would sit under the wrong tree edges
+            self.table[i] = None
+            self.trees = None
+        self.rows[row[0]] = len(self.table)
+        self.table.append(row)
+        if self.trees is not None:
+            self.trees.setdefault(row[1], BKTree()).add(row[4], len(self.table) - 1)
+
+    def move(self, old, new):
+        """Rename a row in place (same image, new path), or drop it if `new` is None"""
+        i = self.rows.pop(old, None)
+        if i is None:
+            return
+        self.rows.pop(new, None)
+        if new is None:
+            self.table[i] = None
+            return
+        self.table[i] = [new] + self.table[i][1:]
+        self.rows[new] = i
+
+    def append(self, entries):
+        """Apply entries here and log them for other processes (call with the file lock held)"""
+        with open(self.log_path, 'ab') as f:
+            for entry in entries:
+                line = (json.dumps(entry) + '\n').encode('utf-8')
+                f.write(line)
+                self.log_offset += len(line)
+                self.apply(entry)
+        if self.log_lines >= COMPACT_AFTER:
+            self.compact()
+
+    def compact(self):
+        """Fold the log into the npz and start a new log (call with the file lock held)"""
+        live = [row for row in self.table if row is not None]
+        columns = {name: [row[n] for row in live] for n, name in enumerate(COLUMNS)}
+        buffer = io.BytesIO()
+        np.savez(buffer, **self.to_arrays(columns))
+        atomic_write_bytes(self.path, buffer.getvalue())
+        # Replaying a log over an npz that already holds it is harmless if we crash here
+        open(self.log_path, 'wb').close()
+        self.table = live
+        self.rows = {row[0]: i for i, row in enumerate(live)}
+        self.trees = None
+        self.loaded_mtime = self.file_mtime()
+        self.log_offset = self.log_lines = 0
+
+    def category_trees(self):
+        if self.trees is None:
+            self.trees = {}
+            for i, row in enumerate(self.table):
+                if row is not None:
+                    self.trees.setdefault(row[1], BKTree()).add(row[4], i)
+        return self.trees
+
+    def near(self, category, phash, dhash, exclude=None):
+        """Existing files in `category` within both radii, closest first: [(path, phash distance)]"""
+        tree = self.category_trees().get(category)
+        if tree is None:
+            return []
+        matches = []
+        for distance, i in sorted(tree.search(int(phash), PHASH_RADIUS)):
+            row = self.table[i]
+            if row is None or row[0] == exclude or hamming(row[5], dhash) > DHASH_RADIUS:
+                continue
+            if os.path.exists(row[0]):
+                matches.append((row[0], distance))
+        return matches
+
+    @staticmethod
+    def to_arrays(columns):
+        return {
+            'paths': np.array(columns['paths'], dtype=str), 'categories': np.array(columns['categories'], dtype=str),
+            'sizes': np.array(columns['sizes'], np.int64), 'mtimes': np.array(columns['mtimes'], np.int64),
+            'phash': np.array(columns['phash'], np.uint64), 'dhash': np.array(columns['dhash'], np.uint64)
+        }
+
+    def admit(self, source, dest, link):
+        """Near-duplicate check, link and index update as one step under the index lock, so two
+        concurrent saves of similar images can't both pass the check.
+
+        `source` is the new image's content (e.g. a store blob) and `link()` writes it to
+        `dest`, returning None or the name of an exact duplicate it found instead. Returns
+        (path of an existing image in dest's category that the new one is too similar to, in
+        which case nothing is linked, or None; link()'s result). `dest` is only indexed once
+        link() has written it.
+        """
+        place = split_library_path(dest, self.base_path)
+        if place is None:
+            return None, link()
+        st = os.stat(source)
+        phash, dhash = (int(h[0]) for h in hash_batch([thumbnails(source)]))
+        with self.lock, file_lock(self.lock_file):
+            self.sync()
+            matches = self.near(place[0], phash, dhash, exclude=dest)
+            if matches:
+                return matches[0][0], None
+            duplicate = link()
+            if duplicate is None:
+                self.append([{'op': 'put', 'row': [dest, place[0], st.st_size, st.st_mtime_ns, phash, dhash]}])
+        return None, duplicate
+
+    def rename(self, old, new):
+        """Move an entry (e.g. a finished download from its temp name); drops it if `new` is None"""
+        with self.lock, file_lock(self.lock_file):
+            self.sync()
+            if old in self.rows:
+                self.append([{'op': 'rename', 'old': old, 'new': new}])
+
+    def refresh(self, workers=None):
+        """Bring the index in line with the library, hashing only new or changed files"""
+        from derivatives import iter_sources
+
+        with self.lock, file_lock(self.lock_file):
+            self.sync()
+            current, todo = [], []
+            for source in iter_sources(self.base_path):
+                st = os.stat(source)
+                i = self.rows.get(source)
+                if i is not None and self.table[i][2:4] == [st.st_size, st.st_mtime_ns]:
+                    current.append(source)
+                else:
+                    todo.append((source, st))
+            for path in set(self.rows) - set(current):
+                self.move(path, None)
+
+            hashed_count = 0
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for start in range(0, len(todo), HASH_BATCH):
+                    batch = todo[start:start + HASH_BATCH]
+                    thumbs, hashed = [], []
+                    for (source, st), result in zip(batch, pool.map(safe_thumbnails, [s for s, _ in batch])):
+                        if result is not None:
+                            thumbs.append(result)
+                            hashed.append((source, st))
+                    phash, dhash = hash_batch(thumbs)
+                    for (source, st), p, d in zip(hashed, phash, dhash):
+                        self.put([source, split_library_path(source, self.base_path)[0], st.st_size,
+                                  st.st_mtime_ns, int(p), int(d)])
+                    hashed_count += len(hashed)
+            self.compact()
+        return {'hashed': hashed_count, 'unchanged': len(current)}
+
+    def near_duplicate_pairs(self):
+        """[(path, path, phash distance, dhash distance)] within the radii, per category, vectorized"""
+        live = [row for row in self.table if row is not None]
+        paths = [row[0] for row in live]
+        categories = np.array([row[1] for row in live], dtype=str)
+        phashes = np.array([row[4] for row in live], np.uint64)
+        dhashes = np.array([row[5] for row in live], np.uint64)
+        pairs = []
+        for category in np.unique(categories):
+            rows = np.flatnonzero(categories == category)
+            for n, i in enumerate(rows[:-1]):
+                others = rows[n + 1:]
+                p = hamming_many(phashes[others], phashes[i])
+                d = hamming_many(dhashes[others], dhashes[i])
+                for j in np.flatnonzero((p <= PHASH_RADIUS) & (d <= DHASH_RADIUS)):
+                    pairs.append((paths[i], paths[others[j]], int(p[j]), int(d[j])))
+        return pairs
+
+
+def safe_thumbnails(path):
+    """Worker job: thumbnails() or None for an unreadable file"""
+    try:
+        return thumbnails(path)
+    except Exception as e:
+        print(f"⚠️  Skipping {path}: {e}")
+        return None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_perceptual_index(base_path='images'):
+    """Process-wide index for `base_path`, built from the library the first time it is ever used"""
+    key = os.path.abspath(base_path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = PerceptualIndex(base_path)
+            if index.file_mtime() is None:
+                index.refresh()
+            else:
+                with index.lock, file_lock(index.lock_file):
+                    index.sync()
+    return index
+
+
+def main(base_path='images'):
+    index = PerceptualIndex(base_path)
+    stats = index.refresh()
+    print(f"🔎 {len(index)} images indexed ({stats['hashed']} hashed, {stats['unchanged']} unchanged)")
+    pairs = index.near_duplicate_pairs()
+    for a, b, p, d in pairs:
+        print(f"🔁 {a} ~ {b} (pHash {p}, dHash {d})")
+    print(f"{len(pairs)} near-duplicate pairs within pHash {PHASH_RADIUS} / dHash {DHASH_RADIUS}")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Per-host token-bucket rate limiting for the image downloaders
+Replaces fixed sleeps between requests with a shared, thread-safe budget
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `burst` banked"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available; return seconds to wait otherwise (0 on success)"""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """Keeps one TokenBucket per host so slow APIs don't throttle image CDNs"""
+
+    def __init__(self, rate=2.0, burst=4, overrides=None):
+        self.rate = rate
+        self.burst = burst
+        # host -> (rate, burst) for hosts that need a different budget
+        self.overrides = overrides or {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket_for(self, url):
+        host = urlparse(url).netloc.lower()
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                rate, burst = self.overrides.get(host, (self.rate, self.burst))
+                bucket = self.buckets[host] = TokenBucket(rate, burst)
+            return bucket
+
+    def acquire(self, url):
+        """Block until a request to `url`'s host is allowed"""
+        self.bucket_for(url).acquire()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+On-disk cache for upstream image search results (Unsplash, Lexica)
+SQLite-backed so the CLI and the Flask server share it; entries expire
+after a TTL, are served stale while a background refresh runs, and the
+least recently used ones are evicted once the cache outgrows its budget
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_FILE = os.path.join('cache', 'search_cache.sqlite')
+DEFAULT_TTL = 60 * 60             # fresh for an hour
+DEFAULT_STALE_TTL = 24 * 60 * 60  # then served stale (while refreshing) for a day
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    query TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    per_page INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+"""
+
+
+def cache_key(source, query, page, per_page):
+    return json.dumps([source, query.strip().lower(), int(page), int(per_page)])
+
+
+class SearchCache:
+    def __init__(self, path=CACHE_FILE, ttl=DEFAULT_TTL, stale_ttl=DEFAULT_STALE_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        self.refreshing = set()
+        self.refresh_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self.connection() as db:
+            db.executescript(SCHEMA)
+
+    def connection(self):
+        """One connection per thread; WAL lets the CLI and server read while either writes"""
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    def lookup(self, key):
+        row = self.connection().execute(
+            'SELECT payload, stored_at FROM entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None, None
+        with self.connection() as db:
+            db.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0]), row[1]
+
+    def store(self, key, source, query, page, per_page, data):
+        payload = json.dumps(data)
+        now = time.time()
+        with self.connection() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, source, query, int(page), int(per_page), payload, len(payload), now, now)
+            )
+            self.evict(db)
+
+    def evict(self, db):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in db.execute('SELECT key, size FROM entries ORDER BY accessed_at').fetchall():
+            db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def refresh_in_background(self, key, source, query, page, per_page, fetch):
+        with self.refresh_lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def refresh():
+            try:
+                data = fetch()
+                if data is not None:
+                    self.store(key, source, query, page, per_page, data)
+            except Exception as e:
+                print(f"⚠️  Background refresh of {source} '{query}' failed: {e}")
+            finally:
+                with self.refresh_lock:
+                    self.refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get_or_fetch(self, source, query, page, per_page, fetch):
+        """Cached search result, calling `fetch()` (JSON data, or None on failure) only when needed"""
+        key = cache_key(source, query, page, per_page)
+        data, stored_at = self.lookup(key)
+        if data is not None:
+            age = time.time() - stored_at
+            if age < self.ttl:
+                return data
+            if age < self.ttl + self.stale_ttl:
+                self.refresh_in_background(key, source, query, page, per_page, fetch)
+                return data
+
+        data = fetch()
+        if data is not None:
+            self.store(key, source, query, page, per_page, data)
+        return data
+
+    def clear(self):
+        with self.connection() as db:
+            db.execute('DELETE FROM entries')
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    """Process-wide cache on the shared cache file"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SearchCache()
+    return _cache
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Cache-aware static file serving for the game
+Strong content-hash ETags, 304 revalidation, Range requests, immutable
+caching for content-hashed URLs (?v=<sha256 prefix>) and precompressed
+gzip/brotli variants of text assets
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import sys
+import threading
+
+from flask import abort, request, send_file
+
+from atomic_io import atomic_write_bytes
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+GAME_ROOT = os.path.dirname(os.path.abspath(__file__))
+VARIANT_DIR = os.path.join(GAME_ROOT, 'cache', 'static')
+
+# Only the game's own files are served: these entry files at the root, plus the library under
+# images/ (manifest, atlases, derived renditions). Source code, journals, caches and benchmark
+# results never are, whatever their extension
+GAME_FILES = {
+    'index.html', 'styles.css', 'pumpkin_character.jpg',
+    'config.js', 'soundManager.js', 'imageLoader.js', 'gameState.js', 'player.js',
+    'weapons.js', 'images.js', 'upgrades.js', 'game.js'
+}
+ASSET_DIRS = {'images'}
+SERVED_EXTENSIONS = {
+    '.html', '.js', '.css', '.json', '.svg', '.ico',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif'
+}
+TEXT_EXTENSIONS = {'.html', '.js', '.css', '.json', '.svg'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def content_digest(path):
+    """SHA-256 of a file, memoized on (size, mtime) so each file is hashed once per change"""
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns, st.st_ino)
+    with _digests_lock:
+        digest = _digests.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with _digests_lock:
+            _digests[key] = digest
+    return digest
+
+
+def resolve(filename, root=GAME_ROOT):
+    """Absolute path for a request path, or None if it isn't a servable game asset"""
+    parts = filename.replace('\\', '/').split('/')
+    if any(part.startswith('.') or part == '' for part in parts):
+        return None
+    if parts[0] not in (GAME_FILES if len(parts) == 1 else ASSET_DIRS):
+        return None
+    if os.path.splitext(filename)[1].lower() not in SERVED_EXTENSIONS:
+        return None
+    path = os.path.abspath(os.path.join(root, *parts))
+    if not path.startswith(os.path.abspath(root) + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def variant_path(path, digest, encoding):
+    """Compressed copy of `path`, built on first use and keyed by content hash so it can't go stale"""
+    if encoding == 'br' and brotli is None:
+        return None
+    suffix = dict(ENCODINGS)[encoding]
+    variant = os.path.join(VARIANT_DIR, f"{digest}{os.path.splitext(path)[1]}{suffix}")
+    if not os.path.exists(variant):
+        with open(path, 'rb') as f:
+            atomic_write_bytes(variant, compress(f.read(), encoding))
+    return variant
+
+
+def accepted_encodings():
+    header = request.headers.get('Accept-Encoding', '')
+    accepted = set()
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0'):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def serve(filename, root=GAME_ROOT):
+    """Flask response for a game asset"""
+    path = resolve(filename, root)
+    if path is None:
+        abort(404)
+
+    digest = content_digest(path)
+    etag = digest[:32]
+    version = request.args.get('v')
+    immutable = version is not None and len(version) >= 8 and digest.startswith(version)
+
+    send_path, encoding = path, None
+    if os.path.splitext(path)[1].lower() in TEXT_EXTENSIONS:
+        accepted = accepted_encodings()
+        for name, _ in ENCODINGS:
+            if name in accepted:
+                candidate = variant_path(path, digest, name)
+                if candidate:
+                    send_path, encoding = candidate, name
+                    # Each encoding is a different representation, so it gets its own strong ETag
+                    etag = f"{etag}-{name}"
+                    break
+
+    response = send_file(
+        send_path,
+        mimetype=None if encoding is None else guess_mimetype(path),
+        etag=etag,
+        conditional=True,
+        last_modified=os.path.getmtime(path)
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if os.path.splitext(path)[1].lower() in TEXT_EXTENSIONS:
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+    return response
+
+
+def guess_mimetype(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def precompress(root=GAME_ROOT):
+    """Build every compressed variant up front (they are otherwise built on first request)"""
+    count = 0
+    for directory, subdirs, files in os.walk(root):
+        subdirs[:] = [d for d in subdirs if not d.startswith('.') and d != 'cache']
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in TEXT_EXTENSIONS:
+                continue
+            path = os.path.join(directory, name)
+            if resolve(os.path.relpath(path, root), root) is None:
+                continue
+            digest = content_digest(path)
+            for encoding, _ in ENCODINGS:
+                if variant_path(path, digest, encoding):
+                    count += 1
+    print(f"🗜️  {count} compressed variants ready in {VARIANT_DIR}" + ("" if brotli else " (install brotli for .br)"))
+
+
+if __name__ == "__main__":
+    precompress(*sys.argv[1:])
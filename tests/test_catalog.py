@@ -0,0 +1,49 @@
+import os
+import shutil
+
+import pytest
+from PIL import Image
+
+import catalog
+from catalog import Catalog, get_catalog
+
+
+def image(path, color='red'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new('RGB', (8, 8), color).save(path)
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, '_catalogs', {})
+    monkeypatch.setattr(catalog, '_reconciled', {})
+    base = tmp_path / 'images'
+    image(str(base / 'dogs' / 'real' / 'real_dogs_1.jpg'))
+    return str(base)
+
+
+def test_files_added_behind_the_catalog_are_counted_on_open(library):
+    assert get_catalog(library).count('dogs', 'real') == 1
+
+    # Dropped in by hand, and written by a tool that doesn't record
+    image(os.path.join(library, 'dogs', 'real', 'real_dogs_2.jpg'), 'blue')
+    image(os.path.join(library, 'people', 'ai', 'ai_people_1.jpg'))
+    os.remove(os.path.join(library, 'dogs', 'real', 'real_dogs_1.jpg'))
+
+    catalog._catalogs.clear()
+    reopened = get_catalog(library)
+    assert reopened.counts() == {'dogs': {'real': 1, 'ai': 0}, 'people': {'real': 0, 'ai': 1}}
+
+
+def test_reconcile_only_rescans_changed_directories(library):
+    db = Catalog(library)
+    db.rebuild()
+    assert db.reconcile() == 0
+
+    image(os.path.join(library, 'cats', 'real', 'real_cats_1.jpg'))
+    assert db.reconcile() == 1
+    assert db.count('cats', 'real') == 1
+
+    shutil.rmtree(os.path.join(library, 'cats'))
+    assert db.reconcile() == 1
+    assert db.count('cats', 'real') == 0
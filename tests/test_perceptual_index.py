@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from perceptual_index import PerceptualIndex
+
+
+def photo(path, crop=0, seed=1):
+    """A smooth random image, optionally cropped, so crops hash alike but seeds don't"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize((256, 256), Image.Resampling.BICUBIC)
+    img.crop((crop, crop, 256 - crop, 256 - crop)).resize((256, 256)).save(path, quality=90)
+    return str(path)
+
+
+@pytest.fixture
+def library(tmp_path):
+    (tmp_path / 'dogs' / 'real').mkdir(parents=True)
+    return tmp_path
+
+
+def linker(source, dest, result=None):
+    def link():
+        if result is None:
+            os.link(source, dest)
+        return result
+    return link
+
+
+def test_admit_indexes_only_linked_files(library):
+    index = PerceptualIndex(str(library))
+    source = photo(library / 'blob.jpg')
+    dest = str(library / 'dogs' / 'real' / 'real_dogs_1.jpg')
+
+    # An exact duplicate found by link() leaves no row behind
+    assert index.admit(source, dest, linker(source, dest, 'real_dogs_0.jpg')) == (None, 'real_dogs_0.jpg')
+    assert len(index) == 0
+
+    assert index.admit(source, dest, linker(source, dest)) == (None, None)
+    assert len(index) == 1
+
+    crop = photo(library / 'crop.jpg', crop=8)
+    other = str(library / 'dogs' / 'real' / 'real_dogs_2.jpg')
+    assert index.admit(crop, other, linker(crop, other)) == (dest, None)
+    assert not os.path.exists(other)
+    new = photo(library / 'new.jpg', seed=2)
+    assert index.admit(new, other, linker(new, other)) == (None, None)
+    assert len(index) == 2
+
+
+def test_concurrent_admits_of_near_duplicates_let_one_through(library):
+    sources = [photo(library / f'crop{n}.jpg', crop=n * 4) for n in range(4)]
+    dests = [str(library / 'dogs' / 'real' / f'real_dogs_{n}.jpg') for n in range(4)]
+    barrier = threading.Barrier(len(sources))
+
+    def save(n):
+        # Separate instances, as in separate processes
+        index = PerceptualIndex(str(library))
+        barrier.wait()
+
+        def link():
+            time.sleep(0.05)  # widen the window between the check and the index update
+            os.link(sources[n], dests[n])
+
+        return index.admit(sources[n], dests[n], link)
+
+    with ThreadPoolExecutor(len(sources)) as pool:
+        results = list(pool.map(save, range(len(sources))))
+
+    admitted = [n for n, (near, _) in enumerate(results) if near is None]
+    assert len(admitted) == 1
+    assert [os.path.exists(dest) for dest in dests].count(True) == 1
+
+
+def test_records_are_appended_and_seen_by_other_processes(library):
+    writer = PerceptualIndex(str(library))
+    dest = str(library / 'dogs' / 'real' / 'real_dogs_1.jpg')
+    photo(dest)
+    writer.refresh(workers=1)
+    npz_mtime = os.stat(writer.path).st_mtime_ns
+
+    second = str(library / 'dogs' / 'real' / 'real_dogs_2.jpg')
+    source = photo(library / 'blob.jpg', seed=2)
+    writer.admit(source, second, linker(source, second))
+    assert os.stat(writer.path).st_mtime_ns == npz_mtime
+    writer.rename(dest, dest + '.moved')
+
+    reader = PerceptualIndex(str(library))
+    with reader.lock:
+        reader.sync()
+    assert sorted(reader.rows) == sorted([second, dest + '.moved'])
+
+
+def test_log_is_compacted_into_the_npz(library, monkeypatch):
+    monkeypatch.setattr('perceptual_index.COMPACT_AFTER', 3)
+    index = PerceptualIndex(str(library))
+    paths = [str(library / 'dogs' / 'real' / f'real_dogs_{i}.jpg') for i in range(4)]
+    for i, path in enumerate(paths):
+        source = photo(library / f'blob{i}.jpg', seed=i)
+        index.admit(source, path, linker(source, path))
+
+    assert os.path.getsize(index.log_path) > 0
+    reader = PerceptualIndex(str(library))
+    with reader.lock:
+        reader.sync()
+    assert sorted(reader.rows) == sorted(paths)
@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import os
+
+import pytest
+from flask import Flask
+
+import static_assets
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    files = {
+        'index.html': '<html></html>',
+        'game.js': 'console.log(1);\n' * 200,
+        'images/manifest.json': '{}',
+        'images/derived/200x160/dogs/real/real_dogs_1.webp': 'webp',
+        'cache/ingest_state.json': '{"secret": true}',
+        'benchmarks/results/abc1234.json': '{}',
+        'image_downloader_server.py': 'print()',
+        'notes.json': '{}',
+        'images/catalog.sqlite': 'db',
+    }
+    for name, content in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+    # Compressed variants go under the test's root, not the repo's cache/
+    monkeypatch.setattr(static_assets, 'VARIANT_DIR', str(tmp_path / 'variants'))
+    app = Flask(__name__)
+    app.add_url_rule('/game/<path:filename>', 'game_asset',
+                     lambda filename: static_assets.serve(filename, root=str(tmp_path)))
+    return app.test_client()
+
+
+@pytest.mark.parametrize('path', ['index.html', 'game.js', 'images/manifest.json',
+                                  'images/derived/200x160/dogs/real/real_dogs_1.webp'])
+def test_game_files_are_served(client, path):
+    assert client.get(f'/game/{path}').status_code == 200
+
+
+@pytest.mark.parametrize('path', [
+    'cache/ingest_state.json',
+    'benchmarks/results/abc1234.json',
+    'image_downloader_server.py',
+    'notes.json',
+    'images/catalog.sqlite',
+    'images/../cache/ingest_state.json',
+])
+def test_local_state_and_sources_are_not_served(client, path):
+    assert client.get(f'/game/{path}').status_code == 404
+
+
+def test_repo_state_is_not_resolvable():
+    assert static_assets.resolve('cache/ingest_state.json') is None
+    assert static_assets.resolve('static_assets.py') is None
+    assert static_assets.resolve('index.html') == os.path.join(static_assets.GAME_ROOT, 'index.html')
+
+
+def test_etag_revalidation_answers_304(client):
+    first = client.get('/game/game.js')
+    assert first.status_code == 200
+    assert first.headers['ETag']
+    assert first.headers['Cache-Control'] == static_assets.REVALIDATE_CACHE_CONTROL
+
+    again = client.get('/game/game.js', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert client.get('/game/game.js', headers={'If-None-Match': '"stale"'}).status_code == 200
+
+
+def test_range_request_answers_206(client):
+    response = client.get('/game/game.js', headers={'Range': 'bytes=0-10'})
+    assert response.status_code == 206
+    assert response.data == b'console.log'
+    assert response.headers['Content-Range'] == f"bytes 0-10/{len('console.log(1);' * 200) + 200}"
+
+
+def test_gzip_variant_is_chosen_by_accept_encoding(client):
+    plain = client.get('/game/game.js')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    zipped = client.get('/game/game.js', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.data) == plain.data
+    assert zipped.headers['ETag'] != plain.headers['ETag']
+
+    refused = client.get('/game/game.js', headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'Content-Encoding' not in refused.headers
+
+
+def test_brotli_variant_is_preferred_when_available(client):
+    response = client.get('/game/game.js', headers={'Accept-Encoding': 'gzip, br'})
+    if static_assets.brotli is None:
+        # Optional dependency missing: gzip is the fallback
+        assert response.headers['Content-Encoding'] == 'gzip'
+    else:
+        assert response.headers['Content-Encoding'] == 'br'
+        assert static_assets.brotli.decompress(response.data) == client.get('/game/game.js').data
+
+
+def test_versioned_urls_are_immutable(client, tmp_path):
+    digest = hashlib.sha256((tmp_path / 'game.js').read_bytes()).hexdigest()
+    current = client.get(f'/game/game.js?v={digest[:12]}')
+    assert current.headers['Cache-Control'] == static_assets.IMMUTABLE_CACHE_CONTROL
+    # A stale or too short version must not be cached forever
+    for version in ('0' * 12, digest[:4]):
+        response = client.get(f'/game/game.js?v={version}')
+        assert response.headers['Cache-Control'] == static_assets.REVALIDATE_CACHE_CONTROL